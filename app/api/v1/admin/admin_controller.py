@@ -0,0 +1,13 @@
+from app.utils.logger import get_logger
+from app.utils.provider_router import get_provider_router
+from app.api.v1.text_generation.text_generation_controller import get_api_source_candidates, get_default_api_source
+
+logger = get_logger(name="app.api.admin.controller")
+
+def get_providers_health() -> dict:
+    """
+    Circuit breaker state, rolling error rate and latency of each configured API source
+    """
+    router = get_provider_router()
+    return {"default_api_source": get_default_api_source().name,
+            "providers": [router.snapshot(api_source, model) for api_source, model in get_api_source_candidates()]}
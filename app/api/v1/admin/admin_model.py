@@ -0,0 +1,19 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+
+class ProviderHealth(BaseModel):
+    api_source: str = Field(description="API source name (model company)")
+    model: str = Field(description="Text generation model of the API source")
+    state: str = Field(description="Circuit breaker state: closed (healthy), open (failing fast) or half_open (probing)")
+    requests_count: int = Field(description="Number of provider calls in the rolling window")
+    failures_count: int = Field(description="Number of failed provider calls in the rolling window")
+    error_rate: float = Field(description="failures_count / requests_count")
+    latency_p50_ms: float|None = Field(default=None, description="Median latency of the recent successful calls, in milliseconds")
+    latency_p95_ms: float|None = Field(default=None, description="95th percentile latency of the recent successful calls, in milliseconds")
+    opened_at: datetime|None = Field(default=None, description="Time the circuit breaker last opened")
+    retry_at: datetime|None = Field(default=None, description="Time the next probe request is allowed (open breaker only)")
+
+class ProvidersHealthOutput(BaseModel):
+    default_api_source: str = Field(description="API source the requests without api_source are currently routed to")
+    providers: list[ProviderHealth] = Field(description="Health of each configured API source")
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from .admin_model import ProvidersHealthOutput
+from .admin_service import get_providers_health_service
+
+router = APIRouter()
+
+@router.get("/providers", response_model=ProvidersHealthOutput)
+async def get_providers_health():
+    return get_providers_health_service()
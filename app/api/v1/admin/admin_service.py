@@ -0,0 +1,4 @@
+from .admin_controller import get_providers_health
+
+def get_providers_health_service() -> dict:
+    return get_providers_health()
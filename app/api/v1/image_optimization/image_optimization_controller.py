@@ -1,22 +1,183 @@
 # Define your controller logic here
 from os import getenv
+import hashlib
 import json
 
 from fastapi import status, HTTPException
 
 
+from app.config.settings import get_settings
+from app.utils.file_sweeper import FileSweeper
+from app.utils.job_queue import JobQueue, JobQueueFullError, MongoJobStore, job_view
 from app.utils.logger import get_logger
-from app.utils.image_utils import convert_image_b64_to_file, is_valid_base64_image
-from .image_optimization_model import ImageOptimizationInput, ImageOptimizer
+from app.utils.single_flight import SingleFlight
+from .image_optimization_model import ImageOptimizationInput, ImageOptimizer, UpscaleJobInput, UpscaleOutputMode
 
 logger = get_logger(name="app.api.image_optimization.controller")
 
-def upscale_image(input:ImageOptimizationInput) -> str:
+UPSCALE_JOB_QUEUE = None
+UPSCALE_FILE_SWEEPER = None
+
+# Subdirectories of IMAGES_PATH where the upscaled images of the jobs (deleted with their job)
+# and of the 'url' output mode (deleted after UPSCALE_OUTPUT_RETENTION_SECONDS) are saved
+UPSCALE_JOB_IMAGES_DIRECTORY = "jobs"
+UPSCALE_OUTPUT_IMAGES_DIRECTORY = "outputs"
+
+# Identical upscale requests (same image bytes / URL) in flight at the same time share one upscale call
+upscale_flight = SingleFlight()
+
+def get_upscale_key(input:ImageOptimizationInput) -> str:
+    """
+    Coalescing key of an upscale request: sha256 of the decoded image bytes, or of the image URL
+    """
+    if input.image_bytes is not None:
+        return "data:" + hashlib.sha256(input.image_bytes).hexdigest()
+    return "url:" + hashlib.sha256(str(input.image_url).encode("utf-8")).hexdigest()
+
+# Image types of the Accept header served by the image output mode, with the requested upscaled image format
+# (None: the format of the input image)
+IMAGE_MEDIA_TYPES = {"image/png": "png", "image/jpeg": "jpeg", "image/jpg": "jpeg", "image/*": None}
+
+def get_accepted_media_types(accept:str|None) -> list[str]:
+    """
+    Media types of the Accept header, by preference (q value, then order), without the refused ones (q=0)
+    """
+    media_ranges = []
+    for index, media_range in enumerate((accept or "").split(",")):
+        media_type, *parameters = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            if parameter.startswith("q="):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    pass
+        if media_type and quality > 0:
+            media_ranges.append((-quality, index, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(media_ranges)]
+
+def get_output_mode(output_mode:UpscaleOutputMode|None, accept:str|None) -> tuple[UpscaleOutputMode, str|None]:
+    """
+    Output mode and upscaled image format ('png', 'jpeg', or None for the input image's format) of an upscale request:
+    the output_mode query parameter if given, else the image mode if the preferred type of the Accept header is
+    image/png, image/jpeg or image/*, else base64 JSON. Raises 406 if the Accept header allows none of them.
+    """
+    media_types = get_accepted_media_types(accept)
+    if output_mode is not None:
+        image_format = next((IMAGE_MEDIA_TYPES[media_type] for media_type in media_types if media_type in IMAGE_MEDIA_TYPES), None)
+        return output_mode, image_format
+    for media_type in media_types:
+        if media_type in IMAGE_MEDIA_TYPES:
+            return UpscaleOutputMode.image, IMAGE_MEDIA_TYPES[media_type]
+        if media_type in ("application/json", "application/*", "*/*"):
+            return UpscaleOutputMode.base64, None
+    if media_types:
+        response_message = f"Not acceptable ({status.HTTP_406_NOT_ACCEPTABLE}): the upscaled image can only be returned " + \
+            "as application/json, image/png or image/jpeg."
+        logger.info("%s Accept: %s", response_message, accept)
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=response_message)
+    return UpscaleOutputMode.base64, None
+
+async def _upscale_image(input:ImageOptimizationInput, output_mode:UpscaleOutputMode,
+                         image_format:str|None=None) -> str|bytes|tuple[bytes, str]:
+    image_optimizer = ImageOptimizer(input, output_format=image_format)
+    await image_optimizer.load_input_image()
+    match output_mode:
+        case UpscaleOutputMode.tmp_url: # The upscaled image is not downloaded
+            return await image_optimizer.request_upscale()
+        case UpscaleOutputMode.url:
+            return await image_optimizer.save_upscaled_image(UPSCALE_OUTPUT_IMAGES_DIRECTORY)
+        case UpscaleOutputMode.image:
+            generated_image_bytes, generated_image_format = await image_optimizer.upscale_image()
+            if image_format is not None and generated_image_format != image_format:
+                response_message = f"Not acceptable ({status.HTTP_406_NOT_ACCEPTABLE}): the upscaled image is only " + \
+                    f"available as image/{generated_image_format}."
+                logger.info(response_message)
+                raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=response_message)
+            return generated_image_bytes, generated_image_format
+        case _:
+            return await image_optimizer.send_image_upscale_request()
+
+async def upscale_image(input:ImageOptimizationInput, output_mode:UpscaleOutputMode=UpscaleOutputMode.base64,
+                        image_format:str|None=None) -> str|bytes|tuple[bytes, str]:
     """
     Receive image input (URL/ Base 64 encoded string) from client
-    Generate upscaled image in encoded Base64 string format
+    Generate upscaled image (in image_format 'png' / 'jpeg', or the input image's format), depending on the output mode:
+        base64: encoded Base64 string
+        image: (image bytes, image format)
+        url / tmp_url: image URL
     """
-    generated_image_b64 = ""
-    image_optimizer = ImageOptimizer(input)
-    generated_image_b64 = image_optimizer.send_image_upscale_request()
-    return generated_image_b64
\ No newline at end of file
+    return await upscale_flight.do(f"{output_mode.value}:{image_format}:{get_upscale_key(input)}",
+                                   _upscale_image, input, output_mode, image_format)
+
+
+async def run_upscale_job(payload:dict) -> dict:
+    """
+    Upscale the image of a job, the upscaled image is saved under IMAGES_PATH/jobs (served by the app)
+    """
+    image_optimizer = ImageOptimizer(ImageOptimizationInput.from_job_payload(payload))
+    await image_optimizer.load_input_image()
+    return {"image_output_url": await image_optimizer.save_upscaled_image(UPSCALE_JOB_IMAGES_DIRECTORY)}
+
+def get_upscale_job_queue() -> JobQueue:
+    global UPSCALE_JOB_QUEUE
+    if UPSCALE_JOB_QUEUE is None:
+        store = MongoJobStore(collection_name=getenv('UPSCALE_JOB_COLLECTION', default='upscale_jobs'),
+                              ttl_seconds=float(getenv('UPSCALE_JOB_TTL_SECONDS', default=86400)),
+                              lease_seconds=float(getenv('UPSCALE_JOB_LEASE_SECONDS', default=600)))
+        UPSCALE_JOB_QUEUE = JobQueue(store, run_upscale_job,
+                                     workers=int(getenv('UPSCALE_JOB_WORKERS', default=4)),
+                                     max_queue_size=int(getenv('UPSCALE_JOB_QUEUE_SIZE', default=100)),
+                                     max_attempts=int(getenv('UPSCALE_JOB_MAX_ATTEMPTS', default=3)),
+                                     recovery_interval=float(getenv('UPSCALE_JOB_RECOVERY_INTERVAL_SECONDS', default=30)),
+                                     webhook_timeout=float(getenv('UPSCALE_JOB_WEBHOOK_TIMEOUT_SECONDS', default=10)))
+
+    return UPSCALE_JOB_QUEUE
+
+def get_upscale_file_sweeper() -> FileSweeper:
+    """
+    Sweeper of the upscaled images served under IMAGES_PATH: the images of the jobs are deleted once
+    the job expired (UPSCALE_JOB_TTL_SECONDS after it finished), the images of the 'url' output mode
+    UPSCALE_OUTPUT_RETENTION_SECONDS after they were saved (kept if 0)
+    """
+    global UPSCALE_FILE_SWEEPER
+    if UPSCALE_FILE_SWEEPER is None:
+        UPSCALE_FILE_SWEEPER = FileSweeper(interval=float(getenv('IMAGES_SWEEP_INTERVAL_SECONDS', default=300)))
+        UPSCALE_FILE_SWEEPER.add(f"{get_settings().images_path}/{UPSCALE_JOB_IMAGES_DIRECTORY}",
+                                 get_upscale_job_queue().store.ttl_seconds)
+        UPSCALE_FILE_SWEEPER.add(f"{get_settings().images_path}/{UPSCALE_OUTPUT_IMAGES_DIRECTORY}",
+                                 float(getenv('UPSCALE_OUTPUT_RETENTION_SECONDS', default=86400)))
+
+    return UPSCALE_FILE_SWEEPER
+
+async def create_upscale_job(input:UpscaleJobInput) -> dict:
+    """
+    Store the upscale job and queue it for the background workers
+    """
+    # The image_data bytes are stored in the job document, under MongoDB's 16MB document size limit
+    max_image_bytes = int(getenv('UPSCALE_JOB_MAX_IMAGE_BYTES', default=15*1024*1024))
+    if input.image_bytes is not None and len(input.image_bytes) > max_image_bytes:
+        response_message = f"Payload too large ({status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}): image_data size " + \
+            f"({len(input.image_bytes)} bytes) exceeds {max_image_bytes} bytes for upscale jobs, please pass the image through 'image_url'."
+        logger.info(response_message)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=response_message)
+    try:
+        job = await get_upscale_job_queue().submit(input.to_job_payload(),
+                                                   webhook_url=None if input.webhook_url is None else str(input.webhook_url))
+    except JobQueueFullError as e:
+        response_message = f"Too many requests ({status.HTTP_429_TOO_MANY_REQUESTS}): the upscale job queue is full. Please try again later."
+        logger.info("%s %s", response_message, e)
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=response_message)
+    except Exception as e:
+        response_message = "Upscale jobs are unavailable for now. Please contact administrator for the issue."
+        logger.info("%s Error: %s", response_message, e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=response_message)
+    logger.info("Upscale job '%s' queued.", job["_id"])
+    return job_view(job)
+
+async def get_upscale_job(job_id:str) -> dict:
+    job = await get_upscale_job_queue().get(job_id)
+    if job is None:
+        response_message = f"Upscale job '{job_id}' not found."
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=response_message)
+    return job_view(job)
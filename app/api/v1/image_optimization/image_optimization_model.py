@@ -1,15 +1,28 @@
-from pydantic import BaseModel, Field, model_validator, AnyHttpUrl, FileUrl
+from pydantic import BaseModel, Field, PrivateAttr, model_validator, AnyHttpUrl, FileUrl
 # from pydantic_core.core_schema import FieldValidationInfo
-from os import getenv
+import os
+from datetime import datetime
+import asyncio
 from enum import Enum, auto
-from PIL import Image
 from typing import Any, Optional
 from typing_extensions import Annotated
 
 from fastapi import status, HTTPException
 
-from app.config.connect_claidai import connect_ClaidAI 
-from app.utils.image_utils import is_valid_base64_image, convert_image_b64_to_file, download_image, encode_image_b64
+from app.config.connect_claidai import (
+    connect_ClaidAI,
+    ClaidError,
+    ClaidRequestError,
+    ClaidRateLimitError,
+    ClaidQueueTimeoutError,
+    ClaidServerError,
+    ClaidTimeoutError
+)
+from app.config.settings import get_settings
+from app.utils.image_utils import decode_base64_image, save_image_bytes, download_image_async, download_upscaled_image_async, encode_image_b64
+from app.utils.metrics import image_stage
+from app.utils.retry_policy import get_retry_policy
+from app.utils.job_queue import JobStatus
 # import json
 
 from app.utils.logger import get_logger
@@ -26,6 +39,9 @@ class ImageOptimizationInput(BaseModel):
         title="ImageOptimizationInput - Image data base64",
         description=f"Input image data in base64 format from user/upstream",
         examples=["SGVyZSBpcyBhIEJhc2U2NCBzdHJpbmcu"])
+    # image_data decoded once by the validator, with its format ('jpeg' / 'png')
+    _image_bytes: bytes|None = PrivateAttr(default=None)
+    _image_format: str|None = PrivateAttr(default=None)
 
     model_config = {
         "json_schema_extra": {
@@ -55,11 +71,70 @@ class ImageOptimizationInput(BaseModel):
         if url is None and data is None:
             raise ValueError(none_field_exist_statement)
         if data is not None:
-            if is_valid_base64_image(data):
-                pass
+            with image_stage("decode"):
+                self._image_bytes, self._image_format = decode_base64_image(data)
     
         return self 
-    
+
+    @property
+    def image_bytes(self) -> bytes|None:
+        """
+        Original bytes of the image_data input (None for image_url input)
+        """
+        return self._image_bytes
+
+    @property
+    def image_format(self) -> str|None:
+        return self._image_format
+
+    def to_job_payload(self) -> dict:
+        """
+        Input stored with an upscale job: the image URL, or the decoded image bytes
+        """
+        if self._image_bytes is not None:
+            return {"image_bytes": self._image_bytes, "image_format": self._image_format}
+        return {"image_url": str(self.image_url)}
+
+    @classmethod
+    def from_job_payload(cls, payload:dict) -> 'ImageOptimizationInput':
+        """
+        Input of a stored upscale job (the image bytes were validated when the job was created)
+        """
+        if "image_bytes" not in payload:
+            return cls(image_url=payload["image_url"])
+        input_image = cls.model_construct()
+        input_image._image_bytes, input_image._image_format = payload["image_bytes"], payload["image_format"]
+        return input_image
+
+class UpscaleJobInput(ImageOptimizationInput):
+    webhook_url: Optional[AnyHttpUrl] = Field(default=None,
+        title="UpscaleJobInput - Webhook URL",
+        description="URL notified (POST of the job status) once the job succeeded or failed",
+        examples=["https://example.com/upscale-webhook"])
+
+class UpscaleJobError(BaseModel):
+    status_code: int
+    detail: str
+
+class UpscaleJobOutput(BaseModel):
+    job_id: str
+    status: JobStatus = Field(description="queued, running, succeeded or failed")
+    created_at: datetime
+    updated_at: datetime
+    image_output_url: Optional[str] = Field(default=None,
+        description="Path of the upscaled image (served by the app under IMAGES_PATH) once the job succeeded")
+    error: Optional[UpscaleJobError] = None
+
+class UpscaleOutputMode(str, Enum):
+    base64 = "base64" # JSON {"image_output": base64 image} (default)
+    image = "image" # Raw image/png or image/jpeg body
+    url = "url" # JSON {"image_output_url": path of the image saved under IMAGES_PATH/outputs, expires}
+    tmp_url = "tmp_url" # JSON {"image_output_url": CLAID.AI's temporary URL of the image}
+
+class ImageOptimizationUrlOutput(BaseModel):
+    image_output_url: str = Field(description="URL of the generated image: path under IMAGES_PATH, deleted after UPSCALE_OUTPUT_RETENTION_SECONDS (url mode) " + \
+                                  "or CLAID.AI's temporary URL (tmp_url mode)")
+
 class ImageOptimizationOutput(BaseModel):
    image_output: str = Field(description="Generated image in encoded Base64 format")
 
@@ -81,51 +156,116 @@ class ImageOptimizationOutput(BaseModel):
 class _defaultCase(Exception): pass
 
 class ImageOptimizer:
-    def __init__(self, input_image: ImageOptimizationInput):
+    """
+    Upscale pipeline working on in-memory image bytes end to end (no local file round trip), without blocking
+    the event loop: async downloads and CLAID.AI upload.
+    With IMAGES_PERSIST=true, the input and upscaled images are also saved under IMAGES_PATH (side effect only).
+    """
+    def __init__(self, input_image: ImageOptimizationInput, output_format:str|None=None):
+        self.input_image = input_image
+        self.output_format = output_format # 'png' / 'jpeg' upscaled image, or the input image's format (None)
         self.input_image_path = None
+        self.generated_image_path = None
+        self.input_image_bytes, self.image_format = input_image.image_bytes, input_image.image_format
+        self.client = connect_ClaidAI()
+
+    async def load_input_image(self):
+        """
+        Download the image_url input (the image_data input is decoded and validated by ImageOptimizationInput)
+        """
         try:
-                
-            if input_image.image_data is not None:
-                self.input_image_path = convert_image_b64_to_file(input_image.image_data)
-            else:
-                self.input_image_path = download_image(input_image.image_url)
-            if self.input_image_path is not None:
-                logging_message = f"Input image successfully saved to '{self.input_image_path}'."
-                logger.info(logging_message)
-                self.client = connect_ClaidAI()
-                logger.info("CLAID.AI client initiated.")
+            if self.input_image_bytes is None:
+                with image_stage("input_download"):
+                    self.input_image_bytes, self.image_format = await download_image_async(self.input_image.image_url)
+            if get_settings().images_persist:
+                self.input_image_path = await asyncio.to_thread(save_image_bytes, self.input_image_bytes, self.image_format)
+                logger.info("Input image successfully saved to '%s'.", self.input_image_path)
         except Exception as e:
             response_message = "Invalid input image data / URL."
-            logger.info(f"{response_message} Error: {e}") 
+            logger.info("%s Error: %s", response_message, e)
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=response_message)
-        
 
-    def send_image_upscale_request(self):
+    async def upload_image(self) -> dict:
+        """
+        Send the upscale request to CLAID.AI, retrying the rate limited / failed / timed out requests
+        with the shared retry policy (backoff, Retry-After, retry budget)
+        """
+        image_format = self.output_format or ('jpeg' if self.image_format in ['jpg', 'jpeg'] else 'png')
+        retry_policy = get_retry_policy()
+        retry_policy.record_request()
+        for retry_count in range(0, retry_policy.max_retries + 1):
+            try:
+                with image_stage("upscale"):
+                    return await self.client.upscale(self.input_image_bytes, format=image_format,
+                                                     filename=f"image.{self.image_format}")
+            except (ClaidRateLimitError, ClaidServerError, ClaidTimeoutError) as e:
+                logger.info("CLAID.AI upscale request failed (%s, status code: %s): %s", type(e).__name__, e.status_code, e)
+                if retry_count == retry_policy.max_retries or not await retry_policy.wait(retry_count, retry_after=e.retry_after):
+                    raise
+                logger.info("Retry attemp: %d/%d", retry_count + 1, retry_policy.max_retries)
+
+    async def request_upscale(self) -> str:
+        """
+        Send the upscale request to CLAID.AI, return the temporary URL of the upscaled image (CLAID.AI's tmp_url)
+        """
         try:
-            image = Image.open(open(self.input_image_path, 'rb'))
-            image_format = 'jpeg' if image.format.lower() in ['jpg', 'jpeg'] else 'png'
-            response = self.client.upscale(self.input_image_path, format=image_format)
+            response = await self.upload_image()
+            return response['data']['output']['tmp_url']
 
-            if response.status_code != 200:
-                response_code = response.status_code
-                logging_message = f"Status code: {response_code}. " + "Response: " + str(response.text)
-                response_message = "Error while sending image upscale request. Please contact administrator for the issue."
-                logger.info(logging_message)
-                raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
+        except ClaidRequestError as e:
+            response_message = f"Validation error ({status.HTTP_422_UNPROCESSABLE_ENTITY}): the input image was rejected by the image upscale service."
+            logger.info("%s Status code: %s. Response: %s", response_message, e.status_code, e)
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=response_message)
+        except (ClaidRateLimitError, ClaidQueueTimeoutError) as e:
+            response_message = f"Too many requests ({status.HTTP_429_TOO_MANY_REQUESTS}): the image upscale service is busy. Please try again later."
+            logger.info("%s Error: %s", response_message, e)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=response_message)
+        except ClaidTimeoutError as e:
+            response_message = "The image upscale service did not respond in time. Please try again later."
+            logger.info("%s Error: %s", response_message, e)
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=response_message)
+        except ClaidError as e: # ClaidAuthError, ClaidServerError
+            response_message = "Error while sending image upscale request. Please contact administrator for the issue."
+            logger.info("Status code: %s. Response: %s", e.status_code, e)
+            raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
+        except Exception as e:
+            response_message = "An generic exception occurred. Please contact administrator for the issue." 
+            logger.info("%s Error: %s", response_message, e)
+            raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT, detail=response_message)
 
-            generated_image_url = response.json()['data']['output']['tmp_url']
-            generated_image_file = download_image(generated_image_url)
+    async def upscale_image(self) -> tuple[bytes, str]:
+        """
+        Upscale the input image, return the (upscaled image bytes, image format)
+        """
+        generated_image_url = await self.request_upscale()
+        try:
+            with image_stage("output_download"):
+                generated_image_bytes, generated_image_format = await download_upscaled_image_async(generated_image_url)
 
-            logging_message = f"Upscaled image successfully saved to file '{generated_image_file}'"
-            logger.info(logging_message)
+            if get_settings().images_persist:
+                self.generated_image_path = await asyncio.to_thread(save_image_bytes, generated_image_bytes, generated_image_format)
+                logger.info("Upscaled image successfully saved to file '%s'", self.generated_image_path)
 
-            encoded_image = encode_image_b64(generated_image_file)
-            return encoded_image
+            return generated_image_bytes, generated_image_format
 
         except Exception as e:
             response_message = "An generic exception occurred. Please contact administrator for the issue." 
-            logger.info(f"{response_message} Error: {e}") 
+            logger.info("%s Error: %s", response_message, e)
             raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT, detail=response_message)
-   
-        return
-        
\ No newline at end of file
+
+    async def save_upscaled_image(self, subdirectory:str|None=None) -> str:
+        """
+        Upscale the input image and save it under IMAGES_PATH (or its subdirectory), return the image URL path (served by the app).
+        The served file is separate from the IMAGES_PERSIST copy, so it can be deleted once expired.
+        """
+        generated_image_bytes, generated_image_format = await self.upscale_image()
+        generated_image_file = await asyncio.to_thread(save_image_bytes, generated_image_bytes, generated_image_format,
+                                                       subdirectory)
+        image_url_path = get_settings().images_path if subdirectory is None else f"{get_settings().images_path}/{subdirectory}"
+        return f"/{image_url_path}/{os.path.basename(generated_image_file)}"
+
+    async def send_image_upscale_request(self):
+        generated_image_bytes, _ = await self.upscale_image()
+        with image_stage("encode"):
+            encoded_image = encode_image_b64(generated_image_bytes)
+        return encoded_image
@@ -1,11 +1,21 @@
 from typing import Annotated
-from fastapi import APIRouter, Query, Body
-from .image_optimization_model import ImageOptimizationInput, ImageOptimizationOutput
-from .image_optimization_service import upscale_image_service
+from fastapi import APIRouter, Query, Body, Header, Path, Request, Response, status
+from .image_optimization_model import (
+    ImageOptimizationInput,
+    ImageOptimizationOutput,
+    ImageOptimizationUrlOutput,
+    UpscaleOutputMode,
+    UpscaleJobInput,
+    UpscaleJobOutput
+)
+from .image_optimization_service import upscale_image_service, create_upscale_job_service, get_upscale_job_service
 
 router = APIRouter()
 
-@router.post("/upscale", response_model=ImageOptimizationOutput)
+@router.post("/upscale", response_model=ImageOptimizationOutput | ImageOptimizationUrlOutput,
+             responses={200: {"content": {"image/png": {}, "image/jpeg": {}},
+                              "description": "Base64 JSON (default), image URL JSON (url / tmp_url output mode) " + \
+                                             "or the raw image (image output mode, or an image type in the Accept header)"}})
 async def upscale_image(
         input: Annotated[ImageOptimizationInput, 
                          Body(
@@ -25,6 +35,39 @@ async def upscale_image(
                                }
                              }
                              
-                         )]
+                         )],
+        response: Response,
+        output_mode: Annotated[UpscaleOutputMode|None, Query(title="Output mode",
+                                                             description="base64 (default), image, url or tmp_url, " + \
+                                                                         "overrides the Accept header")] = None,
+        accept: Annotated[str|None, Header()] = None
                         ):
-    return upscale_image_service(input)
\ No newline at end of file
+    generated_image = await upscale_image_service(input, output_mode, accept)
+    # The output depends on the Accept header: set on the raw image response, or on the JSON one (injected response)
+    (generated_image if isinstance(generated_image, Response) else response).headers["Vary"] = "Accept"
+    return generated_image
+
+@router.post("/upscale/jobs", response_model=UpscaleJobOutput, status_code=status.HTTP_202_ACCEPTED)
+async def create_upscale_job(
+        input: Annotated[UpscaleJobInput,
+                         Body(
+                             openapi_examples={
+                "image_url": {
+                    "summary": "An example using image URL and a webhook",
+                    "description": "Upscale job of an **image URL**, notified to the webhook URL once finished",
+                    "value": {
+                        "image_url": "https://docs.gimp.org/en/images/filters/examples/noise/taj-rgb-noise.jpg",
+                        "webhook_url": "https://example.com/upscale-webhook"
+                    }
+                }
+                             }
+                         )],
+        request: Request,
+        response: Response):
+    job = await create_upscale_job_service(input)
+    response.headers["Location"] = str(request.url_for("get_upscale_job", job_id=job["job_id"]))
+    return job
+
+@router.get("/upscale/jobs/{job_id}", response_model=UpscaleJobOutput)
+async def get_upscale_job(job_id: Annotated[str, Path(title="Upscale job Id", max_length=32)]):
+    return await get_upscale_job_service(job_id)
@@ -1,8 +1,25 @@
-from .image_optimization_controller import upscale_image
-from .image_optimization_model import ImageOptimizationInput
+from fastapi.responses import Response
+
+from .image_optimization_controller import upscale_image, get_output_mode, create_upscale_job, get_upscale_job
+from .image_optimization_model import ImageOptimizationInput, UpscaleJobInput, UpscaleOutputMode
 # from .text_generation_model import apiSource
 
-def upscale_image_service(input:ImageOptimizationInput)-> dict[str,str]:
+async def upscale_image_service(input:ImageOptimizationInput, output_mode:UpscaleOutputMode|None=None,
+                                accept:str|None=None)-> dict[str,str]|Response:
+
+    output_mode, image_format = get_output_mode(output_mode, accept)
+    generated_image = await upscale_image(input=input, output_mode=output_mode, image_format=image_format)
+    match output_mode:
+        case UpscaleOutputMode.image:
+            image_bytes, image_format = generated_image
+            return Response(content=image_bytes, media_type=f"image/{image_format}")
+        case UpscaleOutputMode.url | UpscaleOutputMode.tmp_url:
+            return {"image_output_url": generated_image}
+        case _:
+            return {"image_output": generated_image}
+
+async def create_upscale_job_service(input:UpscaleJobInput) -> dict:
+    return await create_upscale_job(input=input)
 
-    generated_image = upscale_image(input=input)
-    return {"image_output": generated_image}  
\ No newline at end of file
+async def get_upscale_job_service(job_id:str) -> dict:
+    return await get_upscale_job(job_id=job_id)
@@ -1,56 +1,480 @@
 # Define your controller logic here
-from os import getenv
+from datetime import datetime
+import asyncio
+import contextlib
 import json
 
 from fastapi import status, HTTPException
 
 
-from app.utils.logger import get_logger
-from app.utils.sentence_checker import SentenceChecker
-from app.config.connect_openai import connect_OpenAI
-from .text_generation_model import TextGenerator, apiSource
+from app.config.settings import get_settings
+from app.utils.logger import get_logger, log_payload
+from app.utils.sentence_checker import get_sentence_checker
+from app.utils.retry_policy import get_retry_policy
+from app.utils.response_cache import get_response_cache
+from app.utils.single_flight import SingleFlight
+from app.utils.provider_stats import get_provider_stats
+from app.utils.provider_router import get_provider_router
+from app.utils.rate_limiter import get_rate_limiter
+from app.utils.execution_record import execution_time_record
+from app.utils.metrics import PROVIDER_RETRIES
+from app.utils.timing import span
+from .text_generation_model import TextGenerator, PackedTextGenerator, apiSource, get_text_gen_model, get_configured_api_sources
 
 logger = get_logger(name="app.api.text_generation.controller")
 
-def generate_text(input_text:str, user:str|None=None, api_source:apiSource|None=None)->list[str]:
+MEANINGLESS_INPUT_MESSAGE = f"Validation error ({status.HTTP_422_UNPROCESSABLE_ENTITY}): " + \
+    "Client's input text format is valid but does not have any meaningful English word."
+PROMPT_TOKENS_EXCEEDED_MESSAGE = f"Validation error ({status.HTTP_422_UNPROCESSABLE_ENTITY}): " +\
+    "Client's input text format is valid but total number of prompt tokens exceeded " +\
+    "control limit. Please try to reduce the number of words in the input."
+
+def rate_limit_exceeded_message(api_source:apiSource) -> str:
+    return f"Too many requests ({status.HTTP_429_TOO_MANY_REQUESTS}): " + \
+        f"The {api_source.name} API source request quota is exhausted. Please try again later."
+
+def get_rate_limit_queue_timeout() -> float:
+    """
+    Max seconds a request waits for the provider's quota (RATE_LIMIT_QUEUE_TIMEOUT_SECONDS)
+    """
+    return get_settings().rate_limit_queue_timeout_seconds
+
+def provider_unavailable_message(api_source:apiSource) -> str:
+    return f"Service unavailable ({status.HTTP_503_SERVICE_UNAVAILABLE}): " + \
+        f"The {api_source.name} API source is temporarily unavailable. Please try again later or use another API source."
+
+# Errors raised by the provider calls which count as provider failures for the circuit breakers
+# (the other ones are caused by the input, i.e: content filters)
+PROVIDER_FAILURE_STATUS_CODES = [status.HTTP_418_IM_A_TEAPOT, status.HTTP_424_FAILED_DEPENDENCY]
+
+# Identical requests (same cache key) in flight at the same time share one provider call
+text_generation_flight = SingleFlight()
+
+# Per provider limit of the concurrent provider calls made by batch requests (shared by all the batches of the worker)
+batch_semaphores: dict[apiSource, asyncio.Semaphore] = {}
+
+def get_api_source_candidates(exclude:apiSource|None=None) -> list[tuple[str, str]]:
+    """
+    Configured (api_source name, model) candidates, in preference order:
+    TEXT_GENERATION_DEFAULT_API_SOURCE first (openai by default), then the apiSource order
+    """
+    default_api_source = apiSource[get_settings().default_api_source]
+    api_sources = sorted(get_configured_api_sources(), key=lambda api_source: api_source != default_api_source)
+    return [(api_source.name, get_text_gen_model(api_source)) for api_source in api_sources if api_source != exclude]
+
+def get_default_api_source() -> apiSource:
+    """
+    API source of the requests without api_source: the healthiest configured provider (see app.utils.provider_router),
+    or the preferred one if all the providers are unavailable (the request then fails fast)
+    """
+    candidates = get_api_source_candidates()
+    if not candidates:
+        return apiSource.openai
+    api_source_name, _ = get_provider_router().choose(candidates) or candidates[0]
+    return apiSource[api_source_name]
+
+async def generate_text(input_text:str, user:str|None=None, api_source:apiSource|None=None, hedge:bool|None=None)->list[str]:
     """
     Control flow to validate user input_text and return appropriate response
     user: placeholder for hashed userId / username / email address for future tracking
+    hedge: send a hedged request to a second API source if the first one is slow (TEXT_GENERATION_HEDGING by default)
     """
     # Call service layer here
 
-    sentence_check = SentenceChecker()
-    if sentence_check.is_sentence_meaningless(input_text):
-        response_message = f"Validation error ({status.HTTP_422_UNPROCESSABLE_ENTITY}): " + \
-            "Client's input text format is valid but does not have any meaningful English word."
+    sentence_check = get_sentence_checker()
+    with span("sentence_check"):
+        is_meaningless = sentence_check.is_sentence_meaningless(input_text)
+    if is_meaningless:
+        response_message = MEANINGLESS_INPUT_MESSAGE
         logger.info(response_message)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=response_message)
 
     text_generator = TextGenerator(input_text, user=user, api_source=api_source) # Create and initialize text generator instance
 
+    # Return the cached response if the same input was already generated with the same settings
+    response_cache = get_response_cache()
+    cache_key = text_generator.cache_key()
+    with span("cache_lookup"):
+        cached_response = await response_cache.get(cache_key)
+    if cached_response is not None:
+        logger.info("Response retrieved from cache.")
+        return cached_response
+
+    if hedge is None:
+        hedge = get_settings().hedging
+    if hedge:
+        return await text_generation_flight.do(cache_key, request_hedged_text_generation, text_generator, cache_key)
+    return await text_generation_flight.do(cache_key, request_text_generation, text_generator, cache_key)
+
+async def request_text_generation(text_generator:TextGenerator, cache_key:str,
+                                  semaphore:asyncio.Semaphore|None=None)->list[str]:
+    """
+    Check the prompt tokens budget, send the request to the provider (with retries)
+    and store the generated response in the response cache
+    semaphore: concurrency limit held during each provider call only (not during the quota wait / retry backoff)
+    """
+    response_cache = get_response_cache()
+
     # Check if the input to be submitted exceed the controlled number of tokens or not
-    input_prompt_tokens_count = text_generator.calculate_prompt_tokens_count()
+    with span("token_count"):
+        input_prompt_tokens_count = text_generator.calculate_prompt_tokens_count()
     # TODO: Get datetime now 
-    max_retry = int(getenv('TEXT_OPTIMIZER_MAX_RETRY', default=2))
+    retry_policy = get_retry_policy()
+    max_retry = retry_policy.max_retries
+    router = get_provider_router()
+    api_source_name = text_generator.api_source.name
+    rate_limiter = get_rate_limiter(api_source_name, text_generator.model)
+    reserved_tokens_count = text_generator.calculate_max_request_tokens(input_prompt_tokens_count)
     if input_prompt_tokens_count <= text_generator.max_prompt_tokens:
-        for _ in range(0, max_retry + 1):
-            retry_count = 0
-            response = text_generator.send_text_generation_request()
-            if response is not None:
+        retry_policy.record_request()
+        for retry_count in range(0, max_retry + 1):
+            if not router.allow_request(api_source_name, text_generator.model): # Circuit breaker open, fail fast
+                response_message = provider_unavailable_message(text_generator.api_source)
+                logger.info(response_message)
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=response_message)
+            # Wait for the provider's quota instead of sending a request that would be rejected
+            if rate_limiter is not None and not await rate_limiter.acquire(reserved_tokens_count, get_rate_limit_queue_timeout()):
+                response_message = rate_limit_exceeded_message(text_generator.api_source)
+                logger.info(response_message)
+                raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=response_message)
+            start_time = datetime.now()
+            try:
+                async with semaphore or contextlib.nullcontext():
+                    with span("provider"):
+                        response = await text_generator.send_text_generation_request()
+            except HTTPException as e:
+                if e.status_code in PROVIDER_FAILURE_STATUS_CODES:
+                    router.record_failure(api_source_name, text_generator.model)
+                raise
+            finally:
+                if rate_limiter is not None:
+                    rate_limiter.reconcile(reserved_tokens_count, text_generator.usage_tokens_count or 0)
+            if not response: # No response, or no valid generated text (i.e: all Cohere's generations filtered out)
+                router.record_failure(api_source_name, text_generator.model)
+                if rate_limiter is not None and text_generator.retry_after:
+                    rate_limiter.pause(text_generator.retry_after) # Hold the provider's queue as requested
+            else:
+                router.record_success(api_source_name, text_generator.model,
+                                      (datetime.now() - start_time).total_seconds() * 1000)
+                await response_cache.set(cache_key, response)
                 return response
-            else:  
-                retry_count += 1
-                logger.info(f"Retry attemp: {retry_count}/{max_retry}")
-                if retry_count == max_retry:
-                    logger.info(f"Too many request ({status.HTTP_429_TOO_MANY_REQUESTS}): Exceeded max retry attempts ({retry_count}/{max_retry})")
-                    response_message = f"Too many requests ({status.HTTP_429_TOO_MANY_REQUESTS}): Exceeded max internal retry attempts. Please try again later."            
-                else:
-                    continue
+            if retry_count == max_retry:
+                logger.info("Too many request (%d): Exceeded max retry attempts (%d/%d)", status.HTTP_429_TOO_MANY_REQUESTS, retry_count, max_retry)
+                break
+            if not await retry_policy.wait(retry_count, retry_after=text_generator.retry_after):
+                logger.info("Too many request (%d): Retry budget exhausted, no more retry allowed for now", status.HTTP_429_TOO_MANY_REQUESTS)
+                break
+            logger.info("Retry attemp: %d/%d", retry_count + 1, max_retry)
+            PROVIDER_RETRIES.labels(api_source_name, text_generator.model).inc()
+
+        response_message = f"Too many requests ({status.HTTP_429_TOO_MANY_REQUESTS}): Exceeded max internal retry attempts. Please try again later."
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=response_message)
 
     else:
-        response_message = f"Validation error ({status.HTTP_422_UNPROCESSABLE_ENTITY}): " +\
-            "Client's input text format is valid but total number of prompt tokens exceeded " +\
-            "control limit. Please try to reduce the number of words in the input."
+        response_message = PROMPT_TOKENS_EXCEEDED_MESSAGE
+        logger.info(response_message)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=response_message)
+
+def get_hedge_api_source(api_source:apiSource) -> apiSource|None:
+    """
+    API source of the hedged requests: TEXT_GENERATION_HEDGE_API_SOURCE (name, i.e: 'cohere'),
+    or the healthiest other configured provider by default. None if there is no available provider to hedge with.
+    """
+    hedge_api_source = get_settings().hedge_api_source
+    if hedge_api_source and hedge_api_source != api_source.name:
+        configured_api_sources = get_configured_api_sources()
+        if hedge_api_source in apiSource.__members__ and apiSource[hedge_api_source] in configured_api_sources:
+            return apiSource[hedge_api_source]
+        logger.info("Hedge API source '%s' is not a configured API source, using the healthiest one.", hedge_api_source)
+    candidate = get_provider_router().choose(get_api_source_candidates(exclude=api_source))
+    return None if candidate is None else apiSource[candidate[0]]
+
+def get_hedge_delay_ms(text_generator:TextGenerator) -> float:
+    """
+    Delay before sending the hedged request: the TEXT_GENERATION_HEDGE_PERCENTILE (default p95) of the primary
+    API source's recent latencies, or TEXT_GENERATION_HEDGE_DELAY_MS until enough latencies are recorded
+    """
+    settings = get_settings()
+    latency_ms = get_provider_stats().latency_percentile(text_generator.api_source.name, text_generator.model,
+                                                         settings.hedge_percentile, min_samples=settings.hedge_min_samples)
+    if latency_ms is None:
+        return settings.hedge_delay_ms
+    return max(latency_ms, settings.hedge_min_delay_ms)
+
+async def request_hedged_text_generation(text_generator:TextGenerator, cache_key:str)->list[str]:
+    """
+    Hedged text generation: send the request to the primary API source, and if it has not answered
+    (or failed) within the hedge delay, send the same input to a second API source. The first valid response is
+    returned (each response is cached under the settings of its own API source), the other request is cancelled.
+    """
+    start_time = datetime.now()
+    hedge_delay_ms = get_hedge_delay_ms(text_generator)
+    primary = asyncio.ensure_future(request_text_generation(text_generator, cache_key))
+    db_record = {'created_timestamp': start_time,
+                 'task': "text_hedging",
+                 'api_source': text_generator.api_source,
+                 'model': text_generator.model,
+                 'user': text_generator.user,
+                 'hedge_delay_ms': hedge_delay_ms,
+                 'hedged': False,
+                 'winner': text_generator.api_source}
+
+    def record():
+        db_record['execution_time_ms'] = (datetime.now() - start_time).total_seconds() * 1000
+        log_payload(logger, "Execution record", db_record)
+        execution_time_record(db_record)
+
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay_ms / 1000)
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    primary_failed = primary in done and (primary.exception() is not None or not primary.result())
+    hedge_api_source = None if primary in done and not primary_failed else get_hedge_api_source(text_generator.api_source)
+    if hedge_api_source is None:
+        try:
+            return await primary
+        finally:
+            record()
+
+    try:
+        hedge_generator = TextGenerator(text_generator.input_text, user=text_generator.user, api_source=hedge_api_source)
+    except Exception as e: # The primary request goes on alone
+        logger.info("Hedged request to %s could not be created. Error: %s", hedge_api_source.name, e)
+        try:
+            return await primary
+        finally:
+            record()
+    if primary_failed:
+        logger.info("Primary API source failed within %.0fms, hedged request sent to %s.", hedge_delay_ms, hedge_generator.api_source.name)
+    else:
+        logger.info("Primary API source did not answer within %.0fms, hedged request sent to %s.", hedge_delay_ms, hedge_generator.api_source.name)
+    hedge = asyncio.ensure_future(request_text_generation(hedge_generator, hedge_generator.cache_key()))
+    db_record.update({'hedged': True, 'hedge_api_source': hedge_generator.api_source, 'hedge_model': hedge_generator.model})
+
+    pending = {hedge} if primary_failed else {primary, hedge}
+    winner = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (primary, hedge): # Primary first if both completed at the same time
+                if task in done and not task.cancelled() and task.exception() is None and task.result():
+                    winner = task
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    db_record['winner'] = None if winner is None else \
+        text_generator.api_source if winner is primary else hedge_generator.api_source
+    record()
+    if winner is None:
+        return primary.result() # Both failed, raise the primary's error
+    return winner.result()
+
+def format_sse(event:str, data) -> str:
+    """
+    Format a Server-Sent Event with JSON data
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_text(input_text:str, user:str|None=None, api_source:apiSource|None=None):
+    """
+    Validate the user input_text (same checks as generate_text, errors raised before the stream starts),
+    then return the async generator of the Server-Sent Events of the generation (see stream_text_events)
+    """
+    sentence_check = get_sentence_checker()
+    with span("sentence_check"):
+        is_meaningless = sentence_check.is_sentence_meaningless(input_text)
+    if is_meaningless:
+        response_message = MEANINGLESS_INPUT_MESSAGE
         logger.info(response_message)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=response_message)
-        
\ No newline at end of file
+
+    text_generator = TextGenerator(input_text, user=user, api_source=api_source)
+    with span("token_count"):
+        prompt_tokens_count = text_generator.calculate_prompt_tokens_count()
+    if prompt_tokens_count > text_generator.max_prompt_tokens:
+        response_message = PROMPT_TOKENS_EXCEEDED_MESSAGE
+        logger.info(response_message)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=response_message)
+    if not get_provider_router().breaker(api_source.name, text_generator.model).is_available():
+        response_message = provider_unavailable_message(api_source)
+        logger.info(response_message)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=response_message)
+
+    cache_key = text_generator.cache_key()
+    with span("cache_lookup"):
+        cached_response = await get_response_cache().get(cache_key)
+    return stream_text_events(text_generator, cache_key, cached_response)
+
+async def stream_text_events(text_generator:TextGenerator, cache_key:str, cached_response:list[str]|None=None):
+    """
+    Server-Sent Events of a text generation:
+        'suggestion' {"index": i, "text": "..."}: sent as soon as a generated text is parsed from the provider's stream
+        'result' {"generated_texts": [...]}: final event, same shape as TextGenerationOutput
+        'error' {"status_code": ..., "detail": "..."}: final event if the generation failed
+    If the provider's stream fails before any suggestion, falls back to the non-streaming request (with retries).
+    """
+    generated_texts = []
+    if cached_response is None:
+        router = get_provider_router()
+        rate_limiter = get_rate_limiter(text_generator.api_source.name, text_generator.model)
+        reserved_tokens_count = text_generator.calculate_max_request_tokens(text_generator.calculate_prompt_tokens_count())
+        if rate_limiter is not None and not await rate_limiter.acquire(reserved_tokens_count, get_rate_limit_queue_timeout()):
+            yield format_sse("error", {"status_code": status.HTTP_429_TOO_MANY_REQUESTS,
+                                       "detail": rate_limit_exceeded_message(text_generator.api_source)})
+            return
+        start_time = datetime.now()
+        try:
+            async for generated_text in text_generator.stream_text_generation_request():
+                yield format_sse("suggestion", {"index": len(generated_texts), "text": generated_text})
+                generated_texts.append(generated_text)
+            router.record_success(text_generator.api_source.name, text_generator.model,
+                                  (datetime.now() - start_time).total_seconds() * 1000)
+        except Exception as e:
+            router.record_failure(text_generator.api_source.name, text_generator.model)
+            logger.info("Text generation stream failed after %d suggestion(s). Error: %s", len(generated_texts), e)
+            if len(generated_texts) > 0:
+                response_message = f"Failed Dependency ({status.HTTP_424_FAILED_DEPENDENCY}): " + \
+                    "The text generation stream was interrupted. Please try again later."
+                yield format_sse("error", {"status_code": status.HTTP_424_FAILED_DEPENDENCY, "detail": response_message})
+                return
+        finally: # Before the fallback request, which reserves its own tokens
+            if rate_limiter is not None:
+                # Usage not reported: an interrupted stream keeps its reservation if it generated suggestions
+                used_tokens_count = text_generator.usage_tokens_count
+                if used_tokens_count is None:
+                    used_tokens_count = reserved_tokens_count if len(generated_texts) > 0 else 0
+                rate_limiter.reconcile(reserved_tokens_count, used_tokens_count)
+
+        if len(generated_texts) == text_generator.n_choices:
+            await get_response_cache().set(cache_key, generated_texts)
+            yield format_sse("result", {"generated_texts": generated_texts})
+            return
+        if len(generated_texts) > 0:
+            logger.info("Text generation stream returned %d/%d suggestion(s).", len(generated_texts), text_generator.n_choices)
+            yield format_sse("result", {"generated_texts": generated_texts})
+            return
+
+        try:
+            cached_response = await text_generation_flight.do(cache_key, request_text_generation, text_generator, cache_key)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+
+    for index, generated_text in enumerate(cached_response):
+        yield format_sse("suggestion", {"index": index, "text": generated_text})
+    yield format_sse("result", {"generated_texts": cached_response})
+
+def get_batch_semaphore(api_source:apiSource) -> asyncio.Semaphore:
+    """
+    Semaphore limiting the concurrent provider calls of batch requests for an API source:
+    {API_SOURCE}_BATCH_CONCURRENCY (i.e: OPENAI_BATCH_CONCURRENCY), or TEXT_GENERATION_BATCH_CONCURRENCY by default
+    """
+    semaphore = batch_semaphores.get(api_source)
+    if semaphore is None:
+        concurrency = get_settings().providers[api_source.name].batch_concurrency
+        semaphore = batch_semaphores[api_source] = asyncio.Semaphore(concurrency)
+    return semaphore
+
+def batch_item_error(status_code:int, detail:str) -> dict:
+    return {"generated_texts": None, "error": {"status_code": status_code, "detail": detail}}
+
+async def generate_text_batch(input_texts:list[str], user:str|None=None, api_source:apiSource|None=None)->list[dict]:
+    """
+    Control flow of a batch of input texts: validate all the inputs in bulk (sentence check and prompt tokens budget),
+    return the cached responses, then send the remaining inputs to the provider (packed in fewer requests when possible)
+    with a per provider concurrency limit.
+    Return the result (generated texts or error) of each input, in the input order
+    """
+    max_items = get_settings().batch_max_items
+    if len(input_texts) > max_items:
+        response_message = f"Validation error ({status.HTTP_422_UNPROCESSABLE_ENTITY}): " + \
+            f"A batch cannot contain more than {max_items} input texts."
+        logger.info(response_message)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=response_message)
+
+    results = [None] * len(input_texts)
+
+    # Bulk validation
+    sentence_check = get_sentence_checker()
+    text_generators = {}
+    with span("sentence_check"):
+        for index, input_text in enumerate(input_texts):
+            if sentence_check.is_sentence_meaningless(input_text):
+                results[index] = batch_item_error(status.HTTP_422_UNPROCESSABLE_ENTITY, MEANINGLESS_INPUT_MESSAGE)
+            else:
+                text_generators[index] = TextGenerator(input_text, user=user, api_source=api_source)
+
+    with span("token_count"):
+        prompt_tokens_counts = TextGenerator.calculate_prompt_tokens_counts(list(text_generators.values()))
+    prompt_tokens_by_index = dict(zip(text_generators, prompt_tokens_counts))
+    for (index, text_generator), prompt_tokens_count in zip(list(text_generators.items()), prompt_tokens_counts):
+        if prompt_tokens_count > text_generator.max_prompt_tokens:
+            results[index] = batch_item_error(status.HTTP_422_UNPROCESSABLE_ENTITY, PROMPT_TOKENS_EXCEEDED_MESSAGE)
+            del text_generators[index]
+
+    # Cached responses
+    response_cache = get_response_cache()
+    cache_keys = {index: text_generator.cache_key() for index, text_generator in text_generators.items()}
+    with span("cache_lookup"):
+        cached_responses = await asyncio.gather(*[response_cache.get(cache_key) for cache_key in cache_keys.values()])
+    for index, cached_response in zip(list(cache_keys), cached_responses):
+        if cached_response is not None:
+            results[index] = {"generated_texts": cached_response, "error": None}
+            del text_generators[index]
+
+    semaphore = get_batch_semaphore(api_source)
+
+    async def generate_pack(indexes:list[int]):
+        packed_text_generator = PackedTextGenerator([text_generators[index] for index in indexes])
+        rate_limiter = get_rate_limiter(api_source.name, packed_text_generator.model)
+        reserved_tokens_count = sum(prompt_tokens_by_index[index] for index in indexes) + packed_text_generator.max_output_tokens
+        if rate_limiter is not None and not await rate_limiter.acquire(reserved_tokens_count, get_rate_limit_queue_timeout()):
+            return # Inputs sent individually (queued again for the quota)
+        try:
+            async with semaphore:
+                packed_results = await packed_text_generator.send_text_generation_request()
+        except Exception as e:
+            logger.info("Packed request of %d input(s) failed, inputs sent individually. Error: %s", len(indexes), e)
+            return
+        finally:
+            if rate_limiter is not None:
+                rate_limiter.reconcile(reserved_tokens_count, packed_text_generator.usage_tokens_count or 0)
+        for index, generated_texts in zip(indexes, packed_results):
+            if generated_texts: # The inputs without generated texts are sent individually
+                await response_cache.set(cache_keys[index], generated_texts)
+                results[index] = {"generated_texts": generated_texts, "error": None}
+
+    async def generate_item(index:int):
+        try:
+            # The semaphore is only held during the provider calls (not while waiting for the quota,
+            # the retry backoff or a coalesced identical request)
+            generated_texts = await text_generation_flight.do(cache_keys[index], request_text_generation,
+                                                              text_generators[index], cache_keys[index], semaphore)
+            results[index] = {"generated_texts": generated_texts, "error": None}
+        except HTTPException as e:
+            results[index] = batch_item_error(e.status_code, e.detail)
+        except Exception as e:
+            logger.info("Batch item %d failed. Error: %s", index, e)
+            results[index] = batch_item_error(status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                              f"Internal server error ({status.HTTP_500_INTERNAL_SERVER_ERROR}): " + \
+                                              "The text generation failed. Please try again later.")
+
+    # Packed requests (when available), the inputs without a valid packed result are then sent individually
+    pack_size = PackedTextGenerator.get_pack_size(api_source)
+    if pack_size > 1 and text_generators and \
+        get_provider_router().breaker(api_source.name, next(iter(text_generators.values())).model).is_available():
+        pending_indexes = list(text_generators)
+        await asyncio.gather(*[generate_pack(pending_indexes[start:start + pack_size])
+                               for start in range(0, len(pending_indexes), pack_size)])
+    await asyncio.gather(*[generate_item(index) for index in text_generators if results[index] is None])
+
+    return results
+
+def get_cache_stats() -> dict:
+    """
+    Hit/miss counters and size of the text generation response cache
+    """
+    return get_response_cache().stats()
@@ -1,27 +1,28 @@
 from pydantic import BaseModel, Field
-from os import getenv
+from dataclasses import dataclass
 from enum import Enum, auto
 import json
 from datetime import datetime
-from dateutil import parser
-from time import sleep
 from fastapi import status, HTTPException
-from openai import APIError, APIConnectionError, RateLimitError, AuthenticationError 
-from cohere import CohereError, CohereAPIError, CohereConnectionError
-from botocore.exceptions import ClientError
 
-from anthropic_bedrock import HUMAN_PROMPT, AI_PROMPT
+# The providers' SDKs (openai, cohere, boto3 / botocore, anthropic_bedrock) are imported on first use of their API source,
+# so a worker only loads the SDKs of the providers it actually calls
 
-from app.utils.logger import get_logger
-from app.utils.token_helper import token_counter, token_counter_cohere, token_counter_bedrock
+from app.utils.logger import get_logger, log_payload
+from app.utils.token_helper import get_tokenizer_registry
 from app.utils.execution_record import execution_time_record
-from app.config.connect_openai import connect_OpenAI
-from app.config.connect_cohere import connect_Cohere
-from app.config.connect_bedrock import connect_Bedrock
+from app.utils.timing import span
+from app.utils.retry_policy import get_retry_after
+from app.utils.response_cache import make_cache_key, normalize_text
+from app.utils.json_stream import JsonStringArrayStream
+from app.config.settings import get_settings
+from app.config.connect_openai import connect_AsyncOpenAI
+from app.config.connect_cohere import connect_AsyncCohere
+from app.config.connect_bedrock import connect_Bedrock, run_bedrock
 
 # Define your Pydantic models (schemas) here
 
-MAX_CHARS = int(getenv('TEXT_OPTIMIZER_MAX_INPUT_CHARACTERS', 300))
+MAX_CHARS = get_settings().max_input_characters
 logger = get_logger(name="app.api.text_generation.model")
 
 class TextGenerationInput(BaseModel):
@@ -55,6 +56,51 @@ class TextGenerationOutput(BaseModel):
         }
     }
 
+class TextGenerationBatchItemError(BaseModel):
+    status_code: int = Field(description="HTTP status code of the error, as it would be returned for a single request")
+    detail: str = Field(description="Error details")
+
+class TextGenerationBatchItemOutput(BaseModel):
+    generated_texts: list[str]|None = Field(default=None, description="Generated texts of the input item (None if failed)")
+    error: TextGenerationBatchItemError|None = Field(default=None, description="Error of the input item (None if succeeded)")
+
+class TextGenerationBatchOutput(BaseModel):
+    results: list[TextGenerationBatchItemOutput] = Field(description="Result of each input item, in the input order")
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "results": [
+                        {
+                            "generated_texts": [
+                                "Salon U - Elevate Your Beauty Experience with Our Award-Winning Hair, Beauty and Spa Services Since 2002",
+                                "Explore Salon U - Where Excellence Meets Beauty. Offering Premium Hair, Beauty, and Spa Services for Nearly 20 Years"
+                            ],
+                            "error": None
+                        },
+                        {
+                            "generated_texts": None,
+                            "error": {
+                                "status_code": 422,
+                                "detail": "Validation error (422): Client's input text format is valid but does not have any meaningful English word."
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+    }
+
+class TextGenerationCacheStats(BaseModel):
+    backend: str = Field(description="Cache backend in use (memory / mongo)")
+    size: int = Field(description="Number of cached responses (-1 if unavailable)")
+    max_size: int = Field(description="Max number of cached responses before LRU eviction")
+    ttl_seconds: float = Field(description="Time to live of a cached response, in seconds")
+    hits: int = Field(description="Number of cache hits since the worker started")
+    misses: int = Field(description="Number of cache misses since the worker started")
+    hit_ratio: float = Field(description="hits / (hits + misses)")
+
 class apiSource(int, Enum):
     cohere = 1
     openai = 2
@@ -81,99 +127,230 @@ class AnthropicFinishReason(str, Enum):
     max_tokens = 'max_tokens'
 
 
-class _defaultCase(Exception): pass
+def cohere_prompt_template(prompt:str)->tuple[str, str]:
+    """
+    Return the (prefix, suffix) surrounding the user's input text in the Cohere's prompt message
+    """
+    return f"Request: \"{prompt}\"\nMessage: \"", "\""
+
+def anthropic_prompt_template(prompt:str)->tuple[str, str]:
+    """
+    Return the (prefix, suffix) surrounding the user's input text in the Anthropic's prompt message
+    """
+    from anthropic_bedrock import HUMAN_PROMPT, AI_PROMPT
+
+    return f"{prompt}{HUMAN_PROMPT} ", f" {AI_PROMPT}{{"
+
+def get_text_gen_model(api_source:apiSource)->str:
+    """
+    Text generation model of an API source ({API_SOURCE}_TEXT_GEN_MODEL, i.e: OPENAI_TEXT_GEN_MODEL)
+    """
+    return get_settings().providers[api_source.name].model
+
+def get_configured_api_sources()->list[apiSource]:
+    """
+    API sources with a text generation prompt configured ({API_SOURCE}_TEXT_GEN_PROMPT)
+    """
+    return [apiSource[name] for name in get_settings().configured_api_sources]
+
+@dataclass(frozen=True)
+class ProviderTemplate:
+    """
+    Prebuilt request of an API source (built once from the settings): formatted prompt, prompt prefix / suffix
+    surrounding the user's input text, stop sequences and, for Bedrock, the JSON body around the prompt message.
+    A request only fills in the user's input text.
+    """
+    api_source: apiSource
+    model: str
+    encoding_type: str
+    prompt: str
+    prompt_prefix: str
+    prompt_suffix: str
+    max_prompt_tokens: int
+    temperature: float
+    stop_sequences: tuple[str, ...] = ()
+    request_body_prefix: str = ""
+    request_body_suffix: str = ""
+    batch_prompt: str|None = None # System prompt of the packed requests (OpenAI)
+
+    def build_messages(self, input_text:str)->list:
+        if self.api_source == apiSource.openai:
+            return [
+                {"role": "system", "content": self.prompt}, # Prompt message as system guider
+                {"role": "user", "content": input_text}
+            ]
+        return [f"{self.prompt_prefix}{input_text}{self.prompt_suffix}"]
+
+    def build_request_body(self, prompt_message:str)->str:
+        """
+        JSON body of a Bedrock request (same output as json.dumps of the whole body)
+        """
+        return f"{self.request_body_prefix}{json.dumps(prompt_message)}{self.request_body_suffix}"
+
+PROVIDER_TEMPLATES: dict[apiSource, ProviderTemplate] = {}
+
+def build_provider_template(api_source:apiSource)->ProviderTemplate:
+    settings = get_settings()
+    provider = settings.providers[api_source.name]
+    if provider.prompt is None:
+        raise ValueError(f"{api_source.name.upper()}_TEXT_GEN_PROMPT is not configured.")
+    match api_source:
+        case apiSource.cohere:
+            prompt = provider.prompt.format(int(settings.max_output_tokens/3))
+            prompt_prefix, prompt_suffix = cohere_prompt_template(prompt)
+            return ProviderTemplate(api_source, provider.model, f"cohere:{provider.model}", prompt, prompt_prefix, prompt_suffix,
+                                    provider.max_prompt_tokens, provider.temperature)
+        case apiSource.anthropic:
+            prompt = provider.prompt.format(settings.n_choices)
+            prompt_prefix, prompt_suffix = anthropic_prompt_template(prompt)
+            stop_sequences = ("}}",)
+            request_body = json.dumps({"max_tokens_to_sample": settings.max_output_tokens,
+                                       "temperature": provider.temperature,
+                                       "stop_sequences": list(stop_sequences)})
+            return ProviderTemplate(api_source, provider.model, f"anthropic:{provider.model}", prompt, prompt_prefix, prompt_suffix,
+                                    provider.max_prompt_tokens, provider.temperature, stop_sequences,
+                                    request_body_prefix='{"prompt": ', request_body_suffix=f", {request_body[1:]}")
+        case _:
+            batch_prompt = settings.openai_batch_prompt
+            return ProviderTemplate(api_source, provider.model, provider.model, provider.prompt.format(settings.n_choices), "", "",
+                                    provider.max_prompt_tokens, provider.temperature,
+                                    batch_prompt=None if batch_prompt is None else batch_prompt.format(settings.n_choices))
+
+def get_provider_template(api_source:apiSource)->ProviderTemplate:
+    """
+    Prebuilt request template of an API source (built on first use)
+    """
+    template = PROVIDER_TEMPLATES.get(api_source)
+    if template is None:
+        template = PROVIDER_TEMPLATES[api_source] = build_provider_template(api_source)
+    return template
+
+def warm_up_tokenizers():
+    """
+    Build the request template of each configured provider, load the tokenizer of its model and precompute the token count
+    of its formatted prompt (at startup), so the prompt tokens budget check of a request only tokenizes the user's input text
+    """
+    for api_source in get_configured_api_sources():
+        model = get_text_gen_model(api_source)
+        try:
+            template = get_provider_template(api_source)
+            templates = [template.prompt] if api_source == apiSource.openai else [template.prompt_prefix, template.prompt_suffix]
+            get_tokenizer_registry().warm_up(template.encoding_type, templates=templates)
+            logger.info("Tokenizer of model '%s' loaded.", model)
+        except Exception as e:
+            logger.info("Tokenizer warm up of model '%s' failed, it will be loaded on first request. Error: %s", model, e)
 
 class TextGenerator:
     def __init__(self, input_text:str, user:str|None=None, api_source:apiSource|None=None):
         self.input_text = input_text
-        logger.info(f"User: {user}\nSelected API source: {api_source.name}")
+        logger.info("User: %s\nSelected API source: %s", user, api_source.name)
         self.api_source = api_source
-        self.n_choices = int(getenv('TEXT_OPTIMIZER_CHOICES', default=2)) # number of suggestions provide as output
-        self.max_output_tokens = int(getenv('TEXT_OPTIMIZER_MAX_TOKENS', default=200)) # Control max generate tokens
-        try:
-            match api_source:
-                case apiSource.openai:
-                    raise _defaultCase()
-                case apiSource.cohere:
-                    self.client = connect_Cohere()
-                    self.model = getenv('COHERE_TEXT_GEN_MODEL', default='command')
-                    self.prompt = getenv('COHERE_TEXT_GEN_PROMPT').format(int(self.max_output_tokens/3))
-                    self.messages = [f"Request: \"{self.prompt}\"\nMessage: \"{input_text}\""]
-                    self.max_prompt_tokens = int(getenv('COHERE_TEXT_OPTIMIZER_MAX_PROMPT_TOKEN', default=200)) # Internal control on total prompt tokens
-                case apiSource.anthropic:
-                    self.client = connect_Bedrock()  
-                    self.model = getenv('ANTHROPIC_TEXT_GEN_MODEL', default='anthropic.claude-v2:1')     
-                    self.prompt = getenv('ANTHROPIC_TEXT_GEN_PROMPT').format(self.n_choices)
-                    self.messages = [f"{self.prompt}{HUMAN_PROMPT} {input_text} {AI_PROMPT}{{"]
-                    self.max_prompt_tokens = int(getenv('ANTHROPIC_TEXT_OPTIMIZER_MAX_PROMPT_TOKEN', default=200))
-        except _defaultCase:
-            '''
-            Replacement of skipping break for python match:
-                https://stackoverflow.com/questions/72273235/how-to-break-the-match-case-but-not-the-while-loop
-
-            '''
-            pass
-            # api_source = apiSource.openai
-            self.client = connect_OpenAI()
-            self.model = getenv('OPENAI_TEXT_GEN_MODEL', default='gpt-3.5-turbo-1106') # OpenAI's chat completion model
-            self.prompt = getenv('OPENAI_TEXT_GEN_PROMPT').format(self.n_choices) # Prompt message as system guider 
-            self.messages = [
-                {"role": "system", "content": self.prompt},
-                {"role": "user", "content": input_text}
-            ]
-            self.max_prompt_tokens = int(getenv('OPENAI_TEXT_OPTIMIZER_MAX_PROMPT_TOKEN', default=125)) # Internal control on total prompt tokens
-            
-        
-        self.temperature = float(getenv('ANTHROPIC_TEXT_GEN_TEMPERATURE', default=.8)) if api_source == apiSource.anthropic else \
-            float(getenv('TEXT_OPTIMIZER_TEMPERATURE', default=1.3)) # Level of creativeness of the response
-        
-        
-        logger.info("Input messages:")
-        logger.info(self.messages)
+        settings = get_settings()
+        self.n_choices = settings.n_choices # number of suggestions provide as output
+        self.max_output_tokens = settings.max_output_tokens # Control max generate tokens
+        match api_source:
+            case apiSource.cohere:
+                self.client = connect_AsyncCohere()
+            case apiSource.anthropic:
+                self.client = connect_Bedrock()
+            case _:
+                self.client = connect_AsyncOpenAI()
+
+        self.template = get_provider_template(api_source)
+        self.model = self.template.model
+        self.prompt = self.template.prompt
+        self.encoding_type = self.template.encoding_type
+        self.prompt_prefix, self.prompt_suffix = self.template.prompt_prefix, self.template.prompt_suffix
+        self.messages = self.template.build_messages(input_text)
+        self.max_prompt_tokens = self.template.max_prompt_tokens # Internal control on total prompt tokens
+        self.temperature = self.template.temperature # Level of creativeness of the response
+
+        log_payload(logger, "Input messages", self.messages)
         
         self.user = user
+        self.retry_after = None # Retry-After hint (seconds) from the provider's last retryable error
+        self.usage_tokens_count = None # Tokens (prompt + completion) of the last request reported by the provider
         
+    def cache_key(self)->str:
+        """
+        Key of the response cache: every parameter that changes the generated output,
+        except the user (same input from different users share the same response)
+        """
+        return make_cache_key(input_text=normalize_text(self.input_text),
+                              api_source=self.api_source.value,
+                              model=self.model,
+                              prompt=self.prompt,
+                              temperature=self.temperature,
+                              n_choices=self.n_choices,
+                              max_output_tokens=self.max_output_tokens)
+
     def calculate_prompt_tokens_count(self)->int:
         """
-        Calculate the total tokens submitted to OpenAI's chat completion API based on the prompt message, input user message and the model used
-        Using OpenAI's tiktoken module to calculate the tokens for prompt message and user message
+        Calculate the total tokens submitted to the provider's API based on the prompt message, input user message and the model used
+        Counted locally (see app.utils.token_helper): tiktoken for OpenAI, Claude's tokenizer for Anthropic,
+        Cohere's tokenizer (or calibrated estimator) for Cohere. The prompt template's count is computed once.
         --------------------- 
-        Return prompt_tokens_count + user_tokens_count + 11
+        OpenAI: return prompt_tokens_count + user_tokens_count + 11
+        Cohere / Anthropic: return prompt_prefix_tokens_count + user_tokens_count + prompt_suffix_tokens_count
+
+        """
+        user_tokens_count = get_tokenizer_registry().count(self.input_text, self.encoding_type)
+        return self.calculate_template_tokens_count() + user_tokens_count
 
+    def calculate_template_tokens_count(self)->int:
+        """
+        Tokens count of the prompt message without the user's input text (computed once per prompt template)
         """
+        tokenizer_registry = get_tokenizer_registry()
         if self.api_source == apiSource.openai:
-            prompt_tokens_count = token_counter(self.prompt, self.model)
-            user_tokens_count = token_counter(self.input_text, self.model)
-            return prompt_tokens_count + user_tokens_count + 11
-        elif self.api_source == apiSource.cohere:
-            return token_counter_cohere(self.messages[0], self.model)
-        elif self.api_source == apiSource.anthropic:
-            return token_counter_bedrock(string=self.messages[0], 
-                client=self.client, 
-                model_id=self.model)
-        else: 
-            return -1
+            return tokenizer_registry.count_template(self.prompt, self.encoding_type) + 11
+        return tokenizer_registry.count_template(self.prompt_prefix, self.encoding_type) + \
+            tokenizer_registry.count_template(self.prompt_suffix, self.encoding_type)
+
+    def calculate_max_request_tokens(self, prompt_tokens_count:int)->int:
+        """
+        Max tokens a request can count against the provider's tokens quota: prompt tokens + max output tokens of all the generations
+        """
+        n_generations = self.n_choices if self.api_source == apiSource.cohere else 1
+        return prompt_tokens_count + self.max_output_tokens * n_generations
+
+    @staticmethod
+    def calculate_prompt_tokens_counts(text_generators:list['TextGenerator'])->list[int]:
+        """
+        Batch version of calculate_prompt_tokens_count for text generators of the same API source:
+        the user's input texts are all tokenized in one call
+        """
+        if len(text_generators) == 0:
+            return []
+        user_tokens_counts = get_tokenizer_registry().count_batch([text_generator.input_text for text_generator in text_generators],
+                                                                  text_generators[0].encoding_type)
+        return [text_generator.calculate_template_tokens_count() + user_tokens_count
+                for text_generator, user_tokens_count in zip(text_generators, user_tokens_counts)]
     
 
-    def send_text_generation_request(self):
+    async def send_text_generation_request(self):
         """
         Generic method to call the proper API endpoint depending on the API source
+        Returns None if the request should be retried (see app.utils.retry_policy), with the provider's
+        Retry-After hint (if any) kept in self.retry_after
         
         """
+        self.retry_after = None
+        self.usage_tokens_count = None
         try:
             if self.api_source == apiSource.cohere:
-                return self.send_cohere_request()
+                return await self.send_cohere_request()
             elif self.api_source == apiSource.openai:
-                return self.send_openai_request()
+                return await self.send_openai_request()
             elif self.api_source == apiSource.anthropic:
-                return self.send_anthropic_bedrock_request()
+                return await self.send_anthropic_bedrock_request()
         except Exception as e: # Catch all generic exeption that does not related to any 3rd party service
             response_message = "An generic exception occurred. Please contact administrator for the issue." 
-            logger.info(f"{response_message} Error: {e}") 
+            logger.info("%s Error: %s", response_message, e)
             raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT, detail=response_message)
 
 
-    def send_openai_request(self):
+    async def send_openai_request(self):
         """
         Create request and send to OpenAI's chat completion API endpoint
         References: 
@@ -183,10 +360,11 @@ class TextGenerator:
         Returns the response from the sent request (ChatCompletion object)
                        
         """
-        
+        from openai import APIError, APIConnectionError, RateLimitError, AuthenticationError
+
         try:
             start_time = datetime.now()
-            completion = self.client.chat.completions.create(
+            completion = await self.client.chat.completions.create(
             model=self.model,
             messages=self.messages,
             # n=1,
@@ -198,8 +376,7 @@ class TextGenerator:
             finish_time = datetime.now()
             execution_time_ms = (finish_time - start_time).total_seconds() * 1000
 
-            logger.info("OpenAI's Response:")
-            logger.info(completion)
+            log_payload(logger, "OpenAI's Response", completion)
             # Retrieve finish reason for handling response from API call 
             
             finish_reason = completion.choices[0].finish_reason          
@@ -208,6 +385,7 @@ class TextGenerator:
             # future's DB record & analysis purpose                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                        
             completion_tokens_count = completion.usage.completion_tokens # generated message's token count
             prompt_tokens_count = completion.usage.prompt_tokens # total input + prompt token count
+            self.usage_tokens_count = prompt_tokens_count + completion_tokens_count
             created_timestamp = completion.created # Unix timestamp
             db_record = {'created_timestamp': datetime.fromtimestamp(created_timestamp), 
                          'task': "text_optimization",
@@ -219,11 +397,12 @@ class TextGenerator:
                          'prompt_tokens_count': prompt_tokens_count, 'completion_tokens_count': completion_tokens_count,
                          'generated_texts': completion.choices[0].message.content,
                          'finish_reason': [finish_reason]}
-            logger.info(db_record)
+            log_payload(logger, "Execution record", db_record)
             execution_time_record(db_record)
 
             if finish_reason == OpenAIFinishReason.stop.name:
-                generated_texts = json.loads(completion.choices[0].message.content)['messages']
+                with span("parse"):
+                    generated_texts = json.loads(completion.choices[0].message.content)['messages']
                 if len(generated_texts) == self.n_choices:
                     return generated_texts
                 else:
@@ -246,37 +425,33 @@ class TextGenerator:
                 # Not sure what to do yet
                 pass
 
+        # RateLimitError, AuthenticationError and APIConnectionError are subclasses of APIError,
+        # so they must be handled first
+        except AuthenticationError as e:
+            logger.info("OpenAI API client cannot be authenticated: %s", e)
+            response_message = f"Failed Dependency ({status.HTTP_424_FAILED_DEPENDENCY}): " + \
+                "Failed to authenticate OpenAI API. Please contact web admin / developer."
+            raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
+        except RateLimitError as e:
+            # Retry with backoff, honoring OpenAI's Retry-After hint
+            logger.info("OpenAI API request exceeded rate limit: %s. Will auto retry again if within retry limit.", e)
+            self.retry_after = get_retry_after(e)
+            return None
+        except APIConnectionError as e:
+            logger.info("Failed to connect to OpenAI API: %s. Will auto retry again if within retry limit.", e)
+            return None
         except APIError as e:
             #Handle API error here, e.g. retry or log
-            logger.info(f"OpenAI API returned an API Error: {e}")
+            logger.info("OpenAI API returned an API Error: %s", e)
             if '401' in e.message:
                 response_message = f"OpenAI API authentication error. Please ask admin / developer to verify the provided OpenAI's API key."
                 raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
-            # Other error than 401, wait for 3 seconds and retry in next loop
-            sleep(3)
+            # Other error than 401, retry in next loop
+            self.retry_after = get_retry_after(e)
             return None
-
-        except APIConnectionError as e:
-            #Handle connection error here
-            logger.info(f"Failed to connect to OpenAI API: {e}")
-            response_message = f"Failed Dependency ({status.HTTP_424_FAILED_DEPENDENCY}): " + \
-                "Failed to conenct to OpenAI API. Please check with web admin / developer."
-            raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
-        except RateLimitError as e:
-            #Handle rate limit error (we recommend using exponential backoff)
-            logger.info(f"OpenAI API request exceeded rate limit: {e}")
-            response_message = f"Failed Dependency ({status.HTTP_424_FAILED_DEPENDENCY}): " + \
-                "OpenAI API request exceeded rate limit. Please wait for a few seconds and retry request again."
-            sleep(3)
-            raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
-        except AuthenticationError as e:
-            logger.info(f"OpenAI API client cannot be authenticated: {e}")
-            response_message = f"Failed Dependency ({status.HTTP_424_FAILED_DEPENDENCY}): " + \
-                "Failed to authenticate OpenAI API. Please contact web admin / developer."
-            raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
         
     
-    def send_cohere_request(self):
+    async def send_cohere_request(self):
         """
         Create request and send to Cohere's text generation API using Cohere python SDK
         References:
@@ -285,23 +460,24 @@ class TextGenerator:
         Returns the response from the sent request (Generations object)
 
         """
+        from cohere import CohereError, CohereAPIError, CohereConnectionError
+
         try:
             start_time = datetime.now()
-            cohere_generate_response = self.client.generate(
+            cohere_generate_response = await self.client.generate(
                 model=self.model,
                 prompt=self.messages[0],
                 num_generations=self.n_choices,
                 max_tokens=self.max_output_tokens,
                 temperature=self.temperature,
                 k=0,
-                stop_sequences=[],
+                stop_sequences=list(self.template.stop_sequences),
                 return_likelihoods='NONE')
             
             finish_time = datetime.now()
             execution_time_ms = (finish_time - start_time).total_seconds() * 1000
 
-            logger.info("Cohere's Response:")
-            logger.info(cohere_generate_response)
+            log_payload(logger, "Cohere's Response", cohere_generate_response)
             
             finish_reasons = [response.finish_reason for response in cohere_generate_response.generations]
 
@@ -309,6 +485,8 @@ class TextGenerator:
             # future's DB record & analysis purpose     
             completion_tokens_count = cohere_generate_response.meta['billed_units']['output_tokens'] # generated message's token count
             prompt_tokens_count = cohere_generate_response.meta['billed_units']['input_tokens'] # total input + prompt token count
+            self.usage_tokens_count = prompt_tokens_count + completion_tokens_count
+            get_tokenizer_registry().observe(self.messages[0], prompt_tokens_count, self.encoding_type) # Calibrate local estimator
             created_timestamp = start_time
             db_record = {'created_timestamp': created_timestamp, 
                          'task': "text_optimization",
@@ -320,7 +498,7 @@ class TextGenerator:
                          'prompt_tokens_count': prompt_tokens_count, 'completion_tokens_count': completion_tokens_count,
                          'generated_texts': [generation.text for generation in cohere_generate_response.generations],
                          'finish_reason': finish_reasons}
-            logger.info(db_record)
+            log_payload(logger, "Execution record", db_record)
             execution_time_record(db_record)
 
             if all([finish_reason == CohereFinishReason.COMPLETE for finish_reason in finish_reasons]):
@@ -354,24 +532,21 @@ class TextGenerator:
         except CohereAPIError as e:
             response_message = f"Cohere API error. Details: {e}. Will auto retry again if still within retry limit."
             logger.info(response_message)
-            # Wait for 3 seconds and retry in next loop
-            sleep(3)
+            # Retry in next loop, honoring Cohere's Retry-After hint
+            self.retry_after = get_retry_after(e)
+            return None
+        except CohereConnectionError as e:
+            logger.info("Cohere API connection error: the SDK cannot reach the API server. Details: %s", e)
             return None
         except CohereError as e:
             
             response_message = f"Cohere API generic error: {e}. Will auto retry again if still within retry limit."
             logger.info(response_message)
-            # Wait for 3 seconds and retry in next loop
-            sleep(3)
-            return None
-        except CohereConnectionError as e:
-            logger.info(f"Cohere API connection error: the SDK cannot reach the API server. Details: {e}")
-            sleep(3)
             return None
             
         return cohere_generate_response
     
-    def send_anthropic_bedrock_request(self):
+    async def send_anthropic_bedrock_request(self):
         """
         Create request and send to Anthropic's text generation API using AWS Bedrock python SDK (boto3)
         References:
@@ -383,17 +558,16 @@ class TextGenerator:
         Returns the Response object from the bedrock runtime client ()
 
         """
+        from botocore.exceptions import ClientError
+        from dateutil import parser
+
         try:
             
-            request_body = json.dumps({"prompt": self.messages[0],
-                   "max_tokens_to_sample": self.max_output_tokens,
-                   "temperature": self.temperature,
-                   "stop_sequences": ["}}"]
-                   })
+            request_body = self.template.build_request_body(self.messages[0])
             accept = "application/json"
             contentType = "application/json"
             start_time = datetime.now()
-            response = self.client.invoke_model(
+            response = await run_bedrock(self.client.invoke_model,
                 body=request_body, modelId=self.model, 
                 accept=accept, 
                 contentType=contentType
@@ -403,9 +577,8 @@ class TextGenerator:
             finish_time = datetime.now()
             execution_time_ms = (finish_time - start_time).total_seconds() * 1000
             
-            logger.info("Anthropic's Response:")
-            logger.info(response)
-            response_body = json.loads(response.get("body").read())
+            log_payload(logger, "Anthropic's Response", response)
+            response_body = json.loads(await run_bedrock(response.get("body").read))
 
             finish_reason = response_body['stop_reason']
             # Retrieve tokens usage and other info from OpenAI's response for 
@@ -413,6 +586,7 @@ class TextGenerator:
 
             completion_tokens_count = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count']) # generated message's token count
             prompt_tokens_count = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count']) # total input + prompt token count
+            self.usage_tokens_count = prompt_tokens_count + completion_tokens_count
             created_timestamp = parser.parse(response['ResponseMetadata']['HTTPHeaders']['date'])
             db_record = {'created_timestamp': created_timestamp, 
                          'task': "text_optimization",
@@ -426,10 +600,11 @@ class TextGenerator:
                          'finish_reason': [finish_reason]}
             
             execution_time_record(db_record)
-            logger.info(db_record)
+            log_payload(logger, "Execution record", db_record)
 
             if finish_reason == AnthropicFinishReason.stop_sequence:
-                generated_texts = json.loads('{' + response_body['completion'])['messages']
+                with span("parse"):
+                    generated_texts = json.loads('{' + response_body['completion'])['messages']
                 if len(generated_texts) == self.n_choices:
                     return generated_texts
                 else:
@@ -459,21 +634,229 @@ class TextGenerator:
                 logger.info(response_message)
                 user_response = "ResourceNotFoundException raised by Anthropic Bedrock, please contact administrator."
                 raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=user_response)
-            elif error.response in ['ServiceQuotaExceededException', 'ThrottlingException']:
-                response_message = f"Failed Dependency ({status.HTTP_424_FAILED_DEPENDENCY}): " + \
-                "Anthropic bedrock request exceeded rate limit or service quota. Please wait for a few seconds and retry request again."
+            elif error.response['Error']['Code'] in ['ServiceQuotaExceededException', 'ThrottlingException']:
+                response_message = "Anthropic bedrock request exceeded rate limit or service quota. Will auto retry again if within retry limit."
                 logger.info(response_message + f"Detailed error: {error}")
-                sleep(3)
-                raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
+                self.retry_after = get_retry_after(error)
+                return None
             elif error.response['Error']['Code'] == 'ValidationException':
                 response_message = "Input validation failed from Anthropic Bedrock. Please contact administrator to check for request parameters."
                 logger.info(response_message + f"Detailed error: {error}")
                 raise HTTPException(status_code=status.HTTP_424_FAILED_DEPENDENCY, detail=response_message)
                 
             else:
-                logger.info(f"Anthropic Bedrock client cannot invoke due to an error. Will auto retry again if within retry limit. Details: {error}")
-                sleep(3)
+                logger.info("Anthropic Bedrock client cannot invoke due to an error. Will auto retry again if within retry limit. Details: %s", error)
+                self.retry_after = get_retry_after(error)
                 return None
         
         return response
-        
\ No newline at end of file
+
+    async def stream_text_generation_request(self):
+        """
+        Streaming version of send_text_generation_request: async generator yielding each generated text (suggestion)
+        as soon as it is fully parsed from the provider's stream.
+        Provider's errors are raised as is (no retry), the caller decides how to recover.
+        """
+        self.usage_tokens_count = None
+        if self.api_source == apiSource.cohere:
+            stream = self.stream_cohere_request()
+        elif self.api_source == apiSource.anthropic:
+            stream = self.stream_anthropic_bedrock_request()
+        else:
+            stream = self.stream_openai_request()
+        async for generated_text in stream:
+            yield generated_text
+
+    def _record_stream(self, start_time:datetime, first_text_time:datetime|None, generated_texts:list[str],
+                       finish_reasons:list, prompt_tokens_count:int|None=None, completion_tokens_count:int|None=None):
+        execution_time_ms = (datetime.now() - start_time).total_seconds() * 1000
+        if prompt_tokens_count is not None and completion_tokens_count is not None:
+            self.usage_tokens_count = prompt_tokens_count + completion_tokens_count
+        db_record = {'created_timestamp': start_time, 
+                     'task': "text_optimization",
+                     'api_source': self.api_source,
+                     'model': self.model,
+                     'user': self.user,
+                     'input_messages': self.messages,
+                     'execution_time_ms': execution_time_ms,
+                     'first_text_time_ms': None if first_text_time is None else (first_text_time - start_time).total_seconds() * 1000,
+                     'prompt_tokens_count': prompt_tokens_count, 'completion_tokens_count': completion_tokens_count,
+                     'generated_texts': generated_texts,
+                     'finish_reason': finish_reasons}
+        log_payload(logger, "Execution record", db_record)
+        execution_time_record(db_record)
+
+    async def stream_openai_request(self):
+        """
+        Stream the OpenAI's chat completion (stream=True), the JSON output {"messages": [...]} is parsed incrementally
+        Reference: https://platform.openai.com/docs/api-reference/chat/streaming
+        """
+        start_time, first_text_time = datetime.now(), None
+        generated_texts, finish_reasons, usage = [], [], None
+        parser = JsonStringArrayStream("messages")
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            temperature=self.temperature,
+            max_tokens=self.max_output_tokens,
+            user=self.user if self.user is not None else 'user123',
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
+            )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if len(chunk.choices) == 0:
+                continue
+            if chunk.choices[0].finish_reason is not None:
+                finish_reasons.append(chunk.choices[0].finish_reason)
+            for generated_text in parser.feed(chunk.choices[0].delta.content or ""):
+                first_text_time = first_text_time or datetime.now()
+                generated_texts.append(generated_text)
+                yield generated_text
+        self._record_stream(start_time, first_text_time, generated_texts, finish_reasons,
+                            usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None)
+
+    async def stream_cohere_request(self):
+        """
+        Stream the Cohere's generations (stream=True), a generation is yielded once its ``` fenced text is complete
+        Reference: https://docs.cohere.com/reference/generate
+        """
+        start_time, first_text_time = datetime.now(), None
+        generated_texts = []
+        texts, yielded = {}, set()
+        stream = await self.client.generate(
+            model=self.model,
+            prompt=self.messages[0],
+            num_generations=self.n_choices,
+            max_tokens=self.max_output_tokens,
+            temperature=self.temperature,
+            k=0,
+            stop_sequences=list(self.template.stop_sequences),
+            return_likelihoods='NONE',
+            stream=True)
+        async for token in stream:
+            index = token.index or 0
+            texts[index] = texts.get(index, "") + token.text
+            if index not in yielded and texts[index].count("```") >= 2:
+                yielded.add(index)
+                first_text_time = first_text_time or datetime.now()
+                generated_text = texts[index].split("```")[1].replace('\n','')
+                generated_texts.append(generated_text)
+                yield generated_text
+        billed_units = (getattr(stream.generations, 'meta', None) or {}).get('billed_units', {})
+        self._record_stream(start_time, first_text_time, generated_texts, [stream.finish_reason],
+                            billed_units.get('input_tokens'), billed_units.get('output_tokens'))
+
+    async def stream_anthropic_bedrock_request(self):
+        """
+        Stream the Anthropic's completion with Bedrock's invoke_model_with_response_stream, the JSON output is parsed incrementally.
+        The blocking event stream is read in the Bedrock thread pool.
+        Reference: https://docs.aws.amazon.com/bedrock/latest/APIReference/API_runtime_InvokeModelWithResponseStream.html
+        """
+        start_time, first_text_time = datetime.now(), None
+        generated_texts, finish_reasons, metrics = [], [], {}
+        parser = JsonStringArrayStream("messages")
+        parser.feed('{') # The prompt ends with the opening brace of the JSON output
+        request_body = self.template.build_request_body(self.messages[0])
+        response = await run_bedrock(self.client.invoke_model_with_response_stream,
+            body=request_body, modelId=self.model, 
+            accept="application/json", 
+            contentType="application/json")
+        events = iter(response.get("body"))
+        while (event := await run_bedrock(next, events, None)) is not None:
+            if "chunk" not in event:
+                continue
+            chunk = json.loads(event["chunk"]["bytes"])
+            if chunk.get("stop_reason") is not None:
+                finish_reasons.append(chunk["stop_reason"])
+            metrics = chunk.get("amazon-bedrock-invocationMetrics", metrics)
+            for generated_text in parser.feed(chunk.get("completion", "")):
+                first_text_time = first_text_time or datetime.now()
+                generated_texts.append(generated_text)
+                yield generated_text
+        self._record_stream(start_time, first_text_time, generated_texts, finish_reasons,
+                            metrics.get("inputTokenCount"), metrics.get("outputTokenCount"))
+
+
+class PackedTextGenerator:
+    """
+    Send the inputs of several OpenAI's text generators (same settings) in one chat completion request.
+    The system prompt is OPENAI_TEXT_GEN_BATCH_PROMPT (formatted with the number of choices), the user message is
+    the JSON list of the input texts {"inputs": [...]}, and the expected answer is
+    {"results": [{"messages": [...]}, ...]} in the same order as the inputs.
+    """
+    def __init__(self, text_generators:list[TextGenerator]):
+        self.text_generators = text_generators
+        text_generator = text_generators[0]
+        self.api_source = text_generator.api_source
+        self.client = text_generator.client
+        self.model = text_generator.model
+        self.user = text_generator.user
+        self.n_choices = text_generator.n_choices
+        self.temperature = text_generator.temperature
+        self.max_output_tokens = text_generator.max_output_tokens * len(text_generators)
+        self.usage_tokens_count = None # Tokens (prompt + completion) reported by the provider
+        self.prompt = text_generator.template.batch_prompt
+        self.messages = [
+            {"role": "system", "content": self.prompt},
+            {"role": "user", "content": json.dumps({"inputs": [text_generator.input_text for text_generator in text_generators]})}
+        ]
+
+    @staticmethod
+    def get_pack_size(api_source:apiSource)->int:
+        """
+        Max number of inputs packed in one request, 1 if packing is not available for the API source
+        """
+        settings = get_settings()
+        if api_source != apiSource.openai or settings.openai_batch_prompt is None:
+            return 1
+        return settings.batch_pack_size
+
+    async def send_text_generation_request(self)->list[list[str]|None]:
+        """
+        Returns the generated texts of each input (None for the inputs without a valid result,
+        which should be sent again individually)
+        """
+        results = [None] * len(self.text_generators)
+        try:
+            start_time = datetime.now()
+            completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            temperature=self.temperature,
+            max_tokens=self.max_output_tokens,
+            user=self.user if self.user is not None else 'user123',
+            response_format={"type": "json_object"}
+            )
+            finish_time = datetime.now()
+            execution_time_ms = (finish_time - start_time).total_seconds() * 1000
+
+            finish_reason = completion.choices[0].finish_reason
+            self.usage_tokens_count = completion.usage.prompt_tokens + completion.usage.completion_tokens
+            db_record = {'created_timestamp': datetime.fromtimestamp(completion.created), 
+                         'task': "text_optimization",
+                         'api_source': self.api_source,
+                         'model': self.model,
+                         'user': self.user,
+                         'input_messages': self.messages,
+                         'execution_time_ms': execution_time_ms,
+                         'prompt_tokens_count': completion.usage.prompt_tokens, 
+                         'completion_tokens_count': completion.usage.completion_tokens,
+                         'generated_texts': completion.choices[0].message.content,
+                         'finish_reason': [finish_reason]}
+            log_payload(logger, "Execution record", db_record)
+            execution_time_record(db_record)
+
+            if finish_reason == OpenAIFinishReason.stop.name:
+                with span("parse"):
+                    packed_results = json.loads(completion.choices[0].message.content)['results']
+                for index, packed_result in enumerate(packed_results[:len(results)]):
+                    generated_texts = packed_result.get('messages') if isinstance(packed_result, dict) else None
+                    if isinstance(generated_texts, list) and len(generated_texts) == self.n_choices:
+                        results[index] = generated_texts
+        except Exception as e:
+            logger.info("Packed OpenAI request of %d inputs failed, inputs will be sent individually. Error: %s", len(results), e)
+        return results
+
@@ -1,7 +1,8 @@
 from typing import Annotated
 from fastapi import APIRouter, Query, Body
-from .text_generation_model import TextGenerationInput, TextGenerationOutput, apiSource
-from .text_generation_service import generate_text_service
+from fastapi.responses import StreamingResponse
+from .text_generation_model import TextGenerationInput, TextGenerationOutput, TextGenerationBatchOutput, TextGenerationCacheStats, apiSource
+from .text_generation_service import generate_text_service, generate_text_stream_service, generate_text_batch_service, get_cache_stats_service
 
 router = APIRouter()
 
@@ -11,6 +12,38 @@ async def generate_text(input: Annotated[TextGenerationInput, Body()],
                                                         description="User Id for usage tracking purpose",
                                                         max_length=15)] = None, 
                         api_source: Annotated[apiSource|None, Query(title="API Source Id",
-                                                                    description="Internal API source ID (Id of the model company to use)")] = None
+                                                                    description="Internal API source ID (Id of the model company to use)")] = None,
+                        hedge: Annotated[bool|None, Query(title="Hedged request",
+                                                          description="Send the request to a second API source if the first one is slow " + \
+                                                            "(server's TEXT_GENERATION_HEDGING setting by default)")] = None
                         ):
-    return generate_text_service(input.input_text, user, api_source)
+    return await generate_text_service(input.input_text, user, api_source, hedge)
+
+@router.post("/generate/stream", response_class=StreamingResponse,
+             responses={200: {"content": {"text/event-stream": {}},
+                              "description": "Server-Sent Events: 'suggestion' {index, text} for each generated text as soon as " + \
+                                "it is available, then a final 'result' (TextGenerationOutput) or 'error' {status_code, detail} event"}})
+async def generate_text_stream(input: Annotated[TextGenerationInput, Body()], 
+                               user: Annotated[str|None, Query(title="User Id / User name",
+                                                               description="User Id for usage tracking purpose",
+                                                               max_length=15)] = None, 
+                               api_source: Annotated[apiSource|None, Query(title="API Source Id",
+                                                                           description="Internal API source ID (Id of the model company to use)")] = None
+                               ):
+    events = await generate_text_stream_service(input.input_text, user, api_source)
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/generate/batch", response_model=TextGenerationBatchOutput)
+async def generate_text_batch(inputs: Annotated[list[TextGenerationInput], Body()], 
+                              user: Annotated[str|None, Query(title="User Id / User name",
+                                                              description="User Id for usage tracking purpose",
+                                                              max_length=15)] = None, 
+                              api_source: Annotated[apiSource|None, Query(title="API Source Id",
+                                                                          description="Internal API source ID (Id of the model company to use)")] = None
+                              ):
+    return await generate_text_batch_service([input.input_text for input in inputs], user, api_source)
+
+@router.get("/cache", response_model=TextGenerationCacheStats)
+async def get_cache_stats():
+    return get_cache_stats_service()
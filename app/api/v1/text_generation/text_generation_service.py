@@ -1,11 +1,25 @@
 # Here, include your service layer which interacts with the model to process data
-from .text_generation_controller import generate_text
+from .text_generation_controller import generate_text, generate_text_batch, stream_text, get_cache_stats, get_default_api_source
 from .text_generation_model import apiSource
 
-def generate_text_service(input_text: str, user:str|None=None, api_source:apiSource|None=None)-> dict[str,list[str]]:
+async def generate_text_service(input_text: str, user:str|None=None, api_source:apiSource|None=None, hedge:bool|None=None)-> dict[str,list[str]]:
     # This should interact with your text generation logic
-    if api_source is None: # Define default API source if not specified
-        generated_messages = generate_text(input_text, user=user, api_source=apiSource.openai)
+    if api_source is None: # Route to the healthiest API source if not specified
+        generated_messages = await generate_text(input_text, user=user, api_source=get_default_api_source(), hedge=hedge)
     else:    
-        generated_messages = generate_text(input_text, user=user, api_source=api_source)
+        generated_messages = await generate_text(input_text, user=user, api_source=api_source, hedge=hedge)
     return {"generated_texts": generated_messages}  # Mock response
+
+async def generate_text_stream_service(input_text: str, user:str|None=None, api_source:apiSource|None=None):
+    if api_source is None: # Route to the healthiest API source if not specified
+        api_source = get_default_api_source()
+    return await stream_text(input_text, user=user, api_source=api_source)
+
+async def generate_text_batch_service(input_texts: list[str], user:str|None=None, api_source:apiSource|None=None)-> dict[str,list[dict]]:
+    if api_source is None: # Route to the healthiest API source if not specified
+        api_source = get_default_api_source()
+    results = await generate_text_batch(input_texts, user=user, api_source=api_source)
+    return {"results": results}
+
+def get_cache_stats_service()-> dict:
+    return get_cache_stats()
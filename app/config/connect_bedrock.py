@@ -1,19 +1,46 @@
 from os import getenv
-
-from app.utils import bedrock, print_ww
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 BEDROCK_CLIENT = None
+BEDROCK_EXECUTOR = None
 
 def connect_Bedrock():
     global BEDROCK_CLIENT
     if BEDROCK_CLIENT is None:
-        pass
+        from app.utils import bedrock # boto3 loaded on first use
+
         BEDROCK_ASSUME_ROLE = getenv("BEDROCK_ASSUME_ROLE", None)
         AWS_DEFAULT_REGION = getenv("AWS_DEFAULT_REGION", None)
+        BEDROCK_MAX_CONCURRENT_REQUESTS = int(getenv("BEDROCK_MAX_CONCURRENT_REQUESTS", 64))
+        BEDROCK_ENDPOINT_URL = getenv("BEDROCK_ENDPOINT_URL", None) # Default: regional AWS endpoint
         BEDROCK_CLIENT = bedrock.get_bedrock_client(
         assumed_role=BEDROCK_ASSUME_ROLE,
-        region=AWS_DEFAULT_REGION
+        region=AWS_DEFAULT_REGION,
+        max_pool_connections=BEDROCK_MAX_CONCURRENT_REQUESTS,
+        # Single attempt, retries are handled by the shared retry policy (app.utils.retry_policy)
+        max_attempts=1,
+        endpoint_url=BEDROCK_ENDPOINT_URL
         # runtime=False
         )
 
-    return BEDROCK_CLIENT
\ No newline at end of file
+    return BEDROCK_CLIENT
+
+async def run_bedrock(func, *args, **kwargs):
+    """
+    Run a blocking boto3 Bedrock call in a dedicated thread pool so it does not block the event loop
+    """
+    global BEDROCK_EXECUTOR
+    if BEDROCK_EXECUTOR is None:
+        BEDROCK_MAX_CONCURRENT_REQUESTS = int(getenv("BEDROCK_MAX_CONCURRENT_REQUESTS", 64))
+        BEDROCK_EXECUTOR = ThreadPoolExecutor(max_workers=BEDROCK_MAX_CONCURRENT_REQUESTS,
+                                              thread_name_prefix="bedrock")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BEDROCK_EXECUTOR, partial(func, *args, **kwargs))
+
+def shutdown_Bedrock_executor():
+    global BEDROCK_EXECUTOR
+    if BEDROCK_EXECUTOR is not None:
+        BEDROCK_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        BEDROCK_EXECUTOR = None
@@ -1,28 +1,100 @@
 from os import getenv
-from pathlib import Path
-import requests
+import asyncio
 import json
 
+from app.utils.multipart import MultipartBody
+from app.utils.retry_policy import parse_retry_after
+
 CLAIDAI_CLIENT = None
 
 CLAID_API_HOST = getenv("CLAID_API_HOST", "https://api.claid.ai")
 
+
+class ClaidError(Exception):
+    """
+    Error of a CLAID.AI request (status_code is None when no response was received)
+    """
+    def __init__(self, message:str, status_code:int|None=None, retry_after:float|None=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class ClaidRequestError(ClaidError):
+    """
+    The request was rejected (HTTP 4xx), i.e: image format / size not supported
+    """
+
+class ClaidAuthError(ClaidError):
+    """
+    Invalid API key or no access to the operation (HTTP 401 / 403)
+    """
+
+class ClaidRateLimitError(ClaidError):
+    """
+    Too many requests for the plan (HTTP 429), retry after `retry_after` seconds if given
+    """
+
+class ClaidServerError(ClaidError):
+    """
+    CLAID.AI failed to process the request (HTTP 5xx)
+    """
+
+class ClaidTimeoutError(ClaidError):
+    """
+    Connection error or timeout while sending the request / waiting for the response
+    """
+
+class ClaidQueueTimeoutError(ClaidError):
+    """
+    No upload slot (CLAID_MAX_CONCURRENT_UPLOADS) became available within CLAID_QUEUE_TIMEOUT_SECONDS
+    """
+
+
+def get_claid_error(status_code:int, message:str, retry_after:float|None=None) -> ClaidError:
+    """
+    Typed error of a CLAID.AI error response
+    """
+    if status_code in (401, 403):
+        return ClaidAuthError(message, status_code)
+    if status_code == 429:
+        return ClaidRateLimitError(message, status_code, retry_after)
+    if status_code >= 500:
+        return ClaidServerError(message, status_code, retry_after)
+    return ClaidRequestError(message, status_code)
+
+
 class ClaidAPIClient:
-    def __init__(self, api_key):
+    """
+    Async CLAID.AI client sharing one keep-alive connection pool (httpx) for all requests of the worker.
+    Concurrent uploads are capped by a semaphore (max_concurrent_uploads, to match the CLAID.AI plan),
+    the requests waiting for a slot give up after queue_timeout seconds.
+    """
+    def __init__(self, api_key, connect_timeout:float=5, timeout:float=60,
+                 max_concurrent_uploads:int=8, queue_timeout:float=30):
+        import httpx # Loaded on first use of the image routes
+
         self.base_url = f"{CLAID_API_HOST}/v1-beta1"
         self.api_key = api_key
         self.headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
+        self.queue_timeout = queue_timeout
+        self.upload_slots = asyncio.Semaphore(max_concurrent_uploads)
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                                        limits=httpx.Limits(max_connections=max_concurrent_uploads,
+                                                            max_keepalive_connections=max_concurrent_uploads))
 
-    def upscale(self, image_path, format:str='png'):
+    async def upscale(self, image:bytes|memoryview, format:str='png', filename:str='image.png') -> dict:
         '''
         Upscale image using default settings from CLAID.AI's API reference:
             Upload edit: https://docs.claid.ai/image-editing-api/upload-api-reference
             Upscale / enhance: https://docs.claid.ai/image-editing-api/image-operations/restorations
 
-
+        The image bytes are streamed in the multipart upload as is (no copy of the whole image, no file).
+        Returns the JSON body of the upload response, raises a ClaidError on failure
         '''
+        import httpx
+
         endpoint = "/image/edit/upload"
         url = f"{self.base_url}{endpoint}"
         output_format = {
@@ -52,30 +124,51 @@ class ClaidAPIClient:
                 }
             }
 
-        # Read the image file
-        with open(image_path, "rb") as image_file:
-            files = {"file": (Path(image_path).name, image_file, "form-data"),
-                     "data": (None, json.dumps(payload), "application/json")}
-
-            # Define the JSON data for the request
-            
+        body = MultipartBody([("file", filename, image, "application/octet-stream"),
+                              ("data", None, json.dumps(payload).encode("utf-8"), "application/json")])
 
+        try:
+            await asyncio.wait_for(self.upload_slots.acquire(), timeout=self.queue_timeout)
+        except TimeoutError:
+            raise ClaidQueueTimeoutError(f"No upload slot available after {self.queue_timeout}s.")
+        try:
             # Make the POST request
-            response = requests.post(url, 
-                                     headers=self.headers, 
-                                     files=files 
-                                     )
+            response = await self.client.post(url,
+                                              headers={**self.headers, "Content-Type": body.content_type,
+                                                       "Content-Length": str(len(body))},
+                                              content=aiter(body))
+        except httpx.TransportError as e:
+            raise ClaidTimeoutError(f"{type(e).__name__}: {e}")
+        finally:
+            self.upload_slots.release()
 
-            if response.status_code == 200:
-                return response
-            else:
-                return f"Error: {response.status_code} - {response.text}"
+        if response.status_code != 200:
+            raise get_claid_error(response.status_code, response.text,
+                                  retry_after=parse_retry_after(response.headers.get("retry-after")))
+        return response.json()
+
+    async def close(self):
+        await self.client.aclose()
 
 def connect_ClaidAI():
     global CLAIDAI_CLIENT
     if CLAIDAI_CLIENT is None:
         CLAID_API_KEY = getenv("CLAID_API_KEY")
-        
-        CLAIDAI_CLIENT = ClaidAPIClient(api_key=CLAID_API_KEY)
-        
-    return CLAIDAI_CLIENT
\ No newline at end of file
+
+        CLAIDAI_CLIENT = ClaidAPIClient(api_key=CLAID_API_KEY,
+                                        connect_timeout=float(getenv("CLAID_CONNECT_TIMEOUT_SECONDS", default=5)),
+                                        timeout=float(getenv("CLAID_TIMEOUT_SECONDS", default=60)),
+                                        # Concurrent uploads allowed by the CLAID.AI plan (per worker)
+                                        max_concurrent_uploads=int(getenv("CLAID_MAX_CONCURRENT_UPLOADS", default=8)),
+                                        queue_timeout=float(getenv("CLAID_QUEUE_TIMEOUT_SECONDS", default=30)))
+
+    return CLAIDAI_CLIENT
+
+async def disconnect_ClaidAI():
+    """
+    Close the connection pool of the CLAID.AI client (if opened)
+    """
+    global CLAIDAI_CLIENT
+    if CLAIDAI_CLIENT is not None:
+        await CLAIDAI_CLIENT.close()
+        CLAIDAI_CLIENT = None
@@ -1,7 +1,7 @@
-from cohere import Client
 from os import getenv
 
 COHERE_CLIENT = None
+ASYNC_COHERE_CLIENT = None
 
 def connect_Cohere():
     """
@@ -9,6 +9,8 @@ def connect_Cohere():
     """
     global COHERE_CLIENT
     if COHERE_CLIENT is None:
+        from cohere import Client # SDK loaded on first use
+
         # Provide Cohere's API KEY to connect to Cohere's API using cohere  package
         COHERE_API_KEY = getenv('COHERE_API_KEY')
         #ORGANIZATION_ID = getenv('OPENAI_ORGANIZATION_ID') # Organization ID from OpenAI's account, in Settings 
@@ -18,4 +20,34 @@ def connect_Cohere():
                                 client_name=COHERE_CLIENT_NAME
                                )
         
-    return COHERE_CLIENT
\ No newline at end of file
+    return COHERE_CLIENT
+
+def connect_AsyncCohere():
+    """
+    Setup authentication to Cohere's async API client (shared by all requests of the worker)
+    """
+    global ASYNC_COHERE_CLIENT
+    if ASYNC_COHERE_CLIENT is None:
+        from cohere import AsyncClient # SDK loaded on first use
+
+        COHERE_API_KEY = getenv('COHERE_API_KEY')
+        COHERE_CLIENT_NAME = getenv('COHERE_CLIENT_NAME')
+        # Max number of concurrent requests the client keeps in flight (aiohttp session)
+        COHERE_MAX_CONCURRENT_REQUESTS = int(getenv('COHERE_MAX_CONCURRENT_REQUESTS', default=256))
+        ASYNC_COHERE_CLIENT = AsyncClient(api_key=COHERE_API_KEY,
+                                          client_name=COHERE_CLIENT_NAME,
+                                          num_workers=COHERE_MAX_CONCURRENT_REQUESTS,
+                                          # Retries are handled by the shared retry policy (app.utils.retry_policy)
+                                          max_retries=0
+                                          )
+
+    return ASYNC_COHERE_CLIENT
+
+async def disconnect_AsyncCohere():
+    """
+    Close the aiohttp session of the async Cohere's API client (if opened)
+    """
+    global ASYNC_COHERE_CLIENT
+    if ASYNC_COHERE_CLIENT is not None:
+        await ASYNC_COHERE_CLIENT.close()
+        ASYNC_COHERE_CLIENT = None
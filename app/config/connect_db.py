@@ -5,10 +5,10 @@ DATABASE_CLIENT = None
 
 def get_database():
     global DATABASE_CLIENT
+    DB_NAME = getenv("DB_NAME")
     if DATABASE_CLIENT is None:
         # Provide the mongodb atlas url to connect python to mongodb using pymongo
         MONGODB_URI = getenv("MONGODB_URI")
-        DB_NAME = getenv("DB_NAME")
 
         # Create a connection using MongoClient.
         DATABASE_CLIENT = MongoClient(MONGODB_URI)
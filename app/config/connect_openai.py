@@ -1,7 +1,7 @@
-from openai import OpenAI
 from os import getenv
 
 OPENAI_CLIENT = None
+ASYNC_OPENAI_CLIENT = None
 
 def connect_OpenAI():
     """
@@ -9,6 +9,8 @@ def connect_OpenAI():
     """
     global OPENAI_CLIENT
     if OPENAI_CLIENT is None:
+        from openai import OpenAI # SDK loaded on first use
+
         # Provide OpenAI's API KEY to connect to OpenAI's API using openai package
         OPENAI_API_KEY = getenv('OPENAI_API_KEY')
         ORGANIZATION_ID = getenv('OPENAI_ORGANIZATION_ID') # Organization ID from OpenAI's account, in Settings 
@@ -16,4 +18,30 @@ def connect_OpenAI():
         OPENAI_CLIENT = OpenAI(api_key=OPENAI_API_KEY,
                                organization=ORGANIZATION_ID)
         
-    return OPENAI_CLIENT
\ No newline at end of file
+    return OPENAI_CLIENT
+
+def connect_AsyncOpenAI():
+    """
+    Setup authentication to OpenAI's async API client (shared by all requests of the worker)
+    """
+    global ASYNC_OPENAI_CLIENT
+    if ASYNC_OPENAI_CLIENT is None:
+        from openai import AsyncOpenAI # SDK loaded on first use
+
+        OPENAI_API_KEY = getenv('OPENAI_API_KEY')
+        ORGANIZATION_ID = getenv('OPENAI_ORGANIZATION_ID')
+        # Retries are handled by the shared retry policy (app.utils.retry_policy), not by the SDK
+        ASYNC_OPENAI_CLIENT = AsyncOpenAI(api_key=OPENAI_API_KEY,
+                                          organization=ORGANIZATION_ID,
+                                          max_retries=0)
+
+    return ASYNC_OPENAI_CLIENT
+
+async def disconnect_AsyncOpenAI():
+    """
+    Close the connection pool of the async OpenAI's API client (if opened)
+    """
+    global ASYNC_OPENAI_CLIENT
+    if ASYNC_OPENAI_CLIENT is not None:
+        await ASYNC_OPENAI_CLIENT.close()
+        ASYNC_OPENAI_CLIENT = None
@@ -0,0 +1,108 @@
+"""
+Typed settings of the app, read from the environment once (on the first get_settings call, at startup)
+and frozen, so every request of a worker sees the same values without calling getenv.
+"""
+from dataclasses import dataclass
+from os import getenv
+from types import MappingProxyType
+from typing import Mapping
+
+API_SOURCE_NAMES = ('cohere', 'openai', 'anthropic')
+DEFAULT_TEXT_GEN_MODELS = {'openai': 'gpt-3.5-turbo-1106', 'cohere': 'command', 'anthropic': 'anthropic.claude-v2:1'}
+DEFAULT_MAX_PROMPT_TOKENS = {'openai': 125, 'cohere': 200, 'anthropic': 200}
+
+SETTINGS = None
+
+
+@dataclass(frozen=True)
+class ProviderSettings:
+    """
+    Text generation settings of an API source
+    """
+    prompt: str|None # {API_SOURCE}_TEXT_GEN_PROMPT, None if the API source is not configured
+    model: str # {API_SOURCE}_TEXT_GEN_MODEL
+    max_prompt_tokens: int # {API_SOURCE}_TEXT_OPTIMIZER_MAX_PROMPT_TOKEN
+    temperature: float
+    batch_concurrency: int # {API_SOURCE}_BATCH_CONCURRENCY
+
+
+@dataclass(frozen=True)
+class Settings:
+    images_path: str
+    images_persist: bool # Also save the input / upscaled images under images_path (the upscale works in memory)
+    # Text generation
+    max_input_characters: int
+    n_choices: int
+    max_output_tokens: int
+    providers: Mapping[str, ProviderSettings]
+    default_api_source: str
+    rate_limit_queue_timeout_seconds: float
+    # Batch requests
+    openai_batch_prompt: str|None
+    batch_pack_size: int
+    batch_max_items: int
+    # Hedged requests
+    hedging: bool
+    hedge_api_source: str|None
+    hedge_percentile: float
+    hedge_min_samples: int
+    hedge_delay_ms: float
+    hedge_min_delay_ms: float
+
+    @property
+    def configured_api_sources(self) -> list[str]:
+        """
+        Names of the API sources with a text generation prompt configured
+        """
+        return [name for name, provider in self.providers.items() if provider.prompt is not None]
+
+
+def load_settings() -> Settings:
+    """
+    Read the settings from the environment
+    """
+    temperature = float(getenv('TEXT_OPTIMIZER_TEMPERATURE', default=1.3))
+    batch_concurrency = int(getenv('TEXT_GENERATION_BATCH_CONCURRENCY', default=8))
+    providers = {}
+    for name in API_SOURCE_NAMES:
+        prefix = name.upper()
+        providers[name] = ProviderSettings(
+            prompt=getenv(f'{prefix}_TEXT_GEN_PROMPT'),
+            model=getenv(f'{prefix}_TEXT_GEN_MODEL', default=DEFAULT_TEXT_GEN_MODELS[name]),
+            max_prompt_tokens=int(getenv(f'{prefix}_TEXT_OPTIMIZER_MAX_PROMPT_TOKEN', default=DEFAULT_MAX_PROMPT_TOKENS[name])),
+            temperature=float(getenv('ANTHROPIC_TEXT_GEN_TEMPERATURE', default=.8)) if name == 'anthropic' else temperature,
+            batch_concurrency=int(getenv(f'{prefix}_BATCH_CONCURRENCY', default=batch_concurrency)))
+
+    default_api_source = getenv('TEXT_GENERATION_DEFAULT_API_SOURCE', default='openai')
+    if default_api_source not in API_SOURCE_NAMES: # Fail at startup rather than on every default-routed request
+        raise ValueError(f"TEXT_GENERATION_DEFAULT_API_SOURCE must be one of {', '.join(API_SOURCE_NAMES)}, "
+                         f"got '{default_api_source}'.")
+
+    return Settings(
+        images_path=getenv('IMAGES_PATH', default='images'),
+        images_persist=getenv('IMAGES_PERSIST', default='false').lower() == 'true',
+        max_input_characters=int(getenv('TEXT_OPTIMIZER_MAX_INPUT_CHARACTERS', default=300)),
+        n_choices=int(getenv('TEXT_OPTIMIZER_CHOICES', default=2)),
+        max_output_tokens=int(getenv('TEXT_OPTIMIZER_MAX_TOKENS', default=200)),
+        providers=MappingProxyType(providers),
+        default_api_source=default_api_source,
+        rate_limit_queue_timeout_seconds=float(getenv('RATE_LIMIT_QUEUE_TIMEOUT_SECONDS', default=5)),
+        openai_batch_prompt=getenv('OPENAI_TEXT_GEN_BATCH_PROMPT'),
+        batch_pack_size=max(int(getenv('TEXT_GENERATION_BATCH_PACK_SIZE', default=5)), 1),
+        batch_max_items=int(getenv('TEXT_GENERATION_BATCH_MAX_ITEMS', default=100)),
+        hedging=getenv('TEXT_GENERATION_HEDGING', default='false').lower() == 'true',
+        hedge_api_source=getenv('TEXT_GENERATION_HEDGE_API_SOURCE') or None,
+        hedge_percentile=float(getenv('TEXT_GENERATION_HEDGE_PERCENTILE', default=95)),
+        hedge_min_samples=int(getenv('TEXT_GENERATION_HEDGE_MIN_SAMPLES', default=20)),
+        hedge_delay_ms=float(getenv('TEXT_GENERATION_HEDGE_DELAY_MS', default=2000)),
+        hedge_min_delay_ms=float(getenv('TEXT_GENERATION_HEDGE_MIN_DELAY_MS', default=100)))
+
+
+def get_settings() -> Settings:
+    """
+    Settings snapshot of the worker (loaded once)
+    """
+    global SETTINGS
+    if SETTINGS is None:
+        SETTINGS = load_settings()
+    return SETTINGS
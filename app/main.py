@@ -5,22 +5,35 @@ load_dotenv(override=True)
 
 from contextlib import asynccontextmanager
 from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
 from pydantic import ValidationError
 
 from app.api.v1.routes import api_router
+from app.api.v1.text_generation.text_generation_model import warm_up_tokenizers
+from app.api.v1.image_optimization.image_optimization_controller import get_upscale_job_queue, get_upscale_file_sweeper
+from app.config.settings import get_settings
 from app.config.connect_db import get_database
-from app.config.connect_openai import connect_OpenAI
+from app.config.connect_openai import connect_OpenAI, disconnect_AsyncOpenAI
+from app.config.connect_cohere import disconnect_AsyncCohere
+from app.config.connect_bedrock import shutdown_Bedrock_executor
+from app.config.connect_claidai import disconnect_ClaidAI
+from app.utils.response_cache import get_response_cache
+from app.utils.execution_record import get_execution_recorder
+from app.utils.image_downloader import get_image_downloader
+from app.utils.sentence_checker import get_sentence_checker
+from app.utils.metrics import generate_metrics, METRICS_CONTENT_TYPE
 from app.middleware.api_key_auth import api_key_auth
+from app.middleware.request_metrics import request_metrics
+from app.middleware.server_timing import server_timing
 from app.middleware.error_handler import (
     http_exception_handler,
     request_validation_exception_handler,
     validation_exception_handler
 )
 
-images_path = os.getenv("IMAGES_PATH", "images")
+images_path = get_settings().images_path # Loads the settings snapshot of the worker
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -30,6 +43,12 @@ async def lifespan(app: FastAPI):
     # Before the app start:
 
     app.db = get_database() # Load database connection
+    get_sentence_checker() # Load (or build on first run) the shared English words lexicon
+    warm_up_tokenizers() # Load tokenizers and precompute the prompt templates token counts
+    get_response_cache() # Initialize the text generation response cache (and its indexes for mongo backend)
+    get_execution_recorder().start() # Start the background flush of the execution records
+    get_upscale_job_queue().start() # Start the upscale job workers (and requeue the jobs left by a restart)
+    get_upscale_file_sweeper().start() # Start the deletion of the expired upscaled images
 
     # Create static files folder
     
@@ -40,6 +59,14 @@ async def lifespan(app: FastAPI):
     yield
     
     # After the app finish (before shutdown)
+    await get_execution_recorder().stop() # Flush the remaining execution records
+    await get_upscale_job_queue().stop() # Running upscale jobs are put back in the queue
+    await get_upscale_file_sweeper().stop()
+    await disconnect_AsyncOpenAI()
+    await disconnect_AsyncCohere()
+    shutdown_Bedrock_executor()
+    await get_image_downloader().close()
+    await disconnect_ClaidAI()
     app.db.client.close()
 
 tags_metadata = [
@@ -55,6 +82,10 @@ tags_metadata = [
         #     "url": "https://fastapi.tiangolo.com/",
         # },
     },
+    {
+        "name": "Admin",
+        "description": "Service operations (providers health, etc..)",
+    },
 ]
 
 app = FastAPI(lifespan=lifespan, 
@@ -68,6 +99,12 @@ app.mount(f"/{images_path}", StaticFiles(directory=images_path), name="images")
 # Include the API key authentication as middleware
 app.middleware("http")(api_key_auth)
 
+# Collect the stage spans of the requests in the Server-Timing header
+app.middleware("http")(server_timing)
+
+# Record the requests duration (added last so it also times the rejected requests)
+app.middleware("http")(request_metrics)
+
 
 # Add custom exception handlers
 app.add_exception_handler(HTTPException, http_exception_handler)
@@ -82,6 +119,10 @@ app.include_router(api_router, prefix="/api/v1")
 async def health_check():
     return JSONResponse(content="Sliike server is running")
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=generate_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return JSONResponse(content=f"Welcome to Sliike app!")
@@ -7,7 +7,7 @@ API_KEY = getenv("API_KEY")
 
 async def api_key_auth(request: Request, call_next):
     # List of endpoints to exclude from API key requirement
-    excluded_paths = ["/health", "/", "/docs", "/openapi.json", "/redoc"]
+    excluded_paths = ["/health", "/", "/docs", "/openapi.json", "/redoc", "/metrics"]
 
     if request.url.path not in excluded_paths:
         api_key = request.headers.get("X-API-KEY")
@@ -1,6 +1,7 @@
 # Custom exception handlers
 
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
@@ -14,13 +15,13 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def request_validation_exception_handler(request: Request, exc: RequestValidationError):
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors()},
+        content={"detail": jsonable_encoder(exc.errors(), custom_encoder={Exception: str})}, # Validators' errors as messages
     )
 
 async def validation_exception_handler(request: Request, exc: ValidationError):
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors()},
+        content={"detail": jsonable_encoder(exc.errors(), custom_encoder={Exception: str})}, # Validators' errors as messages
     )
 
 # You can add more custom exception handlers as needed
@@ -0,0 +1,19 @@
+import time
+
+from fastapi import Request
+
+from app.utils.metrics import HTTP_REQUEST_DURATION
+
+
+async def request_metrics(request: Request, call_next):
+    # Record the request duration per route template (i.e: /api/v1/text-generation/generate), not per raw path
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.labels(request.method, getattr(route, "path", "unmatched"),
+                                     str(status_code)).observe(time.perf_counter() - start_time)
@@ -0,0 +1,33 @@
+import time
+from datetime import datetime
+from os import getenv
+
+from fastapi import Request
+
+from app.utils.execution_record import execution_time_record
+from app.utils.timing import aggregate_spans, format_server_timing, start_request_spans
+
+TIMING_RECORD = getenv("TIMING_RECORD", "false").lower() == "true"
+
+
+async def server_timing(request: Request, call_next):
+    # Collect the stage spans of the request and return them in the Server-Timing header
+    # (for streaming responses, only the spans recorded before the stream starts are included)
+    created_timestamp = datetime.now()
+    start_time = time.perf_counter()
+    spans = start_request_spans()
+    response = await call_next(request)
+    total_ms = (time.perf_counter() - start_time) * 1000
+    aggregated_spans = aggregate_spans(spans)
+    response.headers["Server-Timing"] = format_server_timing(aggregated_spans, total_ms)
+
+    if TIMING_RECORD and aggregated_spans: # Optionally keep the spans in the execution records
+        route = request.scope.get("route")
+        execution_time_record({'created_timestamp': created_timestamp,
+                               'task': "request_timing",
+                               'method': request.method,
+                               'route': getattr(route, "path", request.url.path),
+                               'status_code': response.status_code,
+                               'execution_time_ms': total_ms,
+                               'spans': {name: entry["duration_ms"] for name, entry in aggregated_spans.items()}})
+    return response
@@ -14,6 +14,9 @@ def get_bedrock_client(
     assumed_role: Optional[str] = None,
     region: Optional[str] = None,
     runtime: Optional[bool] = True,
+    max_pool_connections: Optional[int] = None,
+    max_attempts: Optional[int] = 10,
+    endpoint_url: Optional[str] = None,
 ):
     """Create a boto3 client for Amazon Bedrock, with optional configuration overrides
 
@@ -27,6 +30,12 @@ def get_bedrock_client(
         If not specified, AWS_REGION or AWS_DEFAULT_REGION environment variable will be used.
     runtime :
         Optional choice of getting different client to perform operations with the Amazon Bedrock service.
+    max_pool_connections :
+        Optional maximum number of connections kept in the client's connection pool (botocore's default is 10).
+    max_attempts :
+        Optional maximum number of attempts (including the first one) made by botocore's retry handler.
+    endpoint_url :
+        Optional URL of the service endpoint, overriding the regional AWS endpoint (e.g. a local stand-in for load tests).
     """
     if region is None:
         target_region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
@@ -36,6 +45,9 @@ def get_bedrock_client(
     print(f"Create new client\n  Using region: {target_region}")
     session_kwargs = {"region_name": target_region}
     client_kwargs = {**session_kwargs}
+    if endpoint_url:
+        print(f"  Using endpoint: {endpoint_url}")
+        client_kwargs["endpoint_url"] = endpoint_url
 
     profile_name = os.environ.get("AWS_PROFILE")
     if profile_name:
@@ -45,9 +57,10 @@ def get_bedrock_client(
     retry_config = Config(
         region_name=target_region,
         retries={
-            "max_attempts": 10,
+            "max_attempts": max_attempts,
             "mode": "standard",
         },
+        **({"max_pool_connections": max_pool_connections} if max_pool_connections else {}),
     )
     session = boto3.Session(**session_kwargs)
 
@@ -1,30 +1,234 @@
+import asyncio
 import csv
+import io
+import json
 import os
+from collections import deque
 from datetime import datetime
+from enum import Enum
+from os import getenv
 
-def execution_time_record(db_record:dict):
+from app.utils.logger import get_logger
+from app.utils.metrics import observe_execution_record
+
+logger = get_logger(name="app.utils.execution_record")
+
+EXECUTION_RECORDER = None
+
+# Recorded columns of each task's csv file
+RECORDED_PARAMETERS = {
+    'text_optimization': ['created_timestamp', 'user',
+                          'api_source', 'model',
+                          'execution_time_ms',
+                          'prompt_tokens_count', 'completion_tokens_count',
+                          'finish_reason'],
+    'text_hedging': ['created_timestamp', 'user',
+                     'api_source', 'model',
+                     'hedge_api_source', 'hedge_model',
+                     'hedge_delay_ms', 'hedged', 'winner',
+                     'execution_time_ms'],
+    'request_timing': ['created_timestamp', 'method', 'route', 'status_code',
+                       'execution_time_ms', 'spans'],
+}
+
+
+def rotate_file(path:str, max_bytes:int, backup_count:int):
+    """
+    Rename path to path.1 (path.1 to path.2, etc..) once it reached max_bytes, keeping backup_count old files
     """
-    Record execution time to csv file, taken db_record dictionary as input
+    if max_bytes <= 0 or not os.path.exists(path) or os.path.getsize(path) < max_bytes:
+        return
+    for index in range(backup_count - 1, 0, -1):
+        if os.path.exists(f"{path}.{index}"):
+            os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+    if backup_count > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+
+def group_by_task(records:list[dict]) -> dict[str, list[dict]]:
+    records_by_task = {}
+    for record in records:
+        records_by_task.setdefault(record['task'], []).append(record)
+    return records_by_task
 
+
+class CsvRecordSink:
+    """
+    Rotating csv files, one per task: {directory}/{task}_records.csv with the task's RECORDED_PARAMETERS columns
     """
+    name = "csv"
 
-    recorded_parameters = ['created_timestamp', 'user',
-                         'api_source', 'model',
-                         'execution_time_ms',
-                         'prompt_tokens_count', 'completion_tokens_count',
-                         'finish_reason']
-    
-    task = db_record['task']
-    csv_file = f'./test_init/{task}_records.csv'
+    def __init__(self, directory:str='./test_init', max_bytes:int=10*1024*1024, backup_count:int=5):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
 
-    if not os.path.exists(csv_file):
-        with open(csv_file, mode='w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(recorded_parameters)
+    def write(self, records:list[dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        for task, task_records in group_by_task(records).items():
+            recorded_parameters = RECORDED_PARAMETERS.get(task, RECORDED_PARAMETERS['text_optimization'])
+            csv_file = os.path.join(self.directory, f'{task}_records.csv')
+            rotate_file(csv_file, self.max_bytes, self.backup_count)
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=recorded_parameters, extrasaction='ignore')
+            if not os.path.exists(csv_file) or os.path.getsize(csv_file) == 0:
+                writer.writeheader()
+            writer.writerows(task_records)
+            # One write of whole lines per batch, so the appends of concurrent workers do not interleave partial lines
+            with open(csv_file, mode='a', newline='') as f:
+                f.write(buffer.getvalue())
 
-    else:
-        data_to_write = {k:v for k,v in db_record.items() if k in recorded_parameters}
-        with open(csv_file, mode='a', newline='') as csvfile: 
-            writer = csv.DictWriter(csvfile, fieldnames = recorded_parameters) 
-            writer.writerow(data_to_write) 
-    return
\ No newline at end of file
+
+class JsonlRecordSink:
+    """
+    Rotating JSON lines files, one per task: {directory}/{task}_records.jsonl with the full records
+    """
+    name = "jsonl"
+
+    def __init__(self, directory:str='./test_init', max_bytes:int=10*1024*1024, backup_count:int=5):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write(self, records:list[dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        for task, task_records in group_by_task(records).items():
+            jsonl_file = os.path.join(self.directory, f'{task}_records.jsonl')
+            rotate_file(jsonl_file, self.max_bytes, self.backup_count)
+            lines = "".join(json.dumps(to_document(record), default=str) + "\n" for record in task_records)
+            with open(jsonl_file, mode='a') as f:
+                f.write(lines)
+
+
+class MongoRecordSink:
+    """
+    MongoDB collection of the full records (database from connect_db.get_database), inserted in bulk
+    """
+    name = "mongo"
+
+    def __init__(self, collection_name:str="execution_records"):
+        from app.config.connect_db import get_database
+
+        self.collection = get_database()[collection_name]
+
+    def write(self, records:list[dict]):
+        self.collection.insert_many([to_document(record) for record in records], ordered=False)
+
+
+def to_document(record:dict) -> dict:
+    """
+    Copy of a record with the enums replaced by their names (i.e: apiSource.openai -> 'openai')
+    """
+    def convert(value):
+        if isinstance(value, Enum):
+            return value.name
+        if isinstance(value, list):
+            return [convert(item) for item in value]
+        return value
+    return {key: convert(value) for key, value in record.items()}
+
+
+class ExecutionRecorder:
+    """
+    Buffered execution records: the request path only appends the record to an in-memory queue,
+    a background task flushes the queued records in batches to the sinks (in a worker thread).
+    The queue is bounded, the oldest records are dropped (and counted) if the sinks cannot keep up.
+    """
+    def __init__(self, sinks:list, max_queue_size:int=10000, batch_size:int=500, flush_interval:float=1.0):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = deque(maxlen=max_queue_size) # append / popleft are thread safe
+        self._task = None
+
+    def record(self, db_record:dict):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(db_record)
+
+    def flush(self):
+        """
+        Write all the queued records to the sinks, in batches of batch_size (blocking)
+        """
+        while self._queue:
+            records = []
+            while self._queue and len(records) < self.batch_size:
+                records.append(self._queue.popleft())
+            for sink in self.sinks:
+                try:
+                    sink.write(records)
+                except Exception as e:
+                    logger.info("Failed to write %d execution record(s) to the %s sink: %s", len(records), sink.name, e)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._queue:
+                await asyncio.to_thread(self.flush)
+
+    def start(self):
+        """
+        Start the background flush task (at startup)
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the background flush task and flush the remaining records (at shutdown)
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+
+def create_record_sinks() -> list:
+    """
+    Sinks listed in EXECUTION_RECORD_SINKS (comma separated: csv, jsonl, mongo)
+    """
+    directory = getenv('EXECUTION_RECORD_PATH', default='./test_init')
+    max_bytes = int(getenv('EXECUTION_RECORD_MAX_BYTES', default=10*1024*1024))
+    backup_count = int(getenv('EXECUTION_RECORD_BACKUP_COUNT', default=5))
+    sinks = []
+    for sink_name in getenv('EXECUTION_RECORD_SINKS', default='csv').split(','):
+        match sink_name.strip():
+            case 'csv':
+                sinks.append(CsvRecordSink(directory, max_bytes, backup_count))
+            case 'jsonl':
+                sinks.append(JsonlRecordSink(directory, max_bytes, backup_count))
+            case 'mongo':
+                sinks.append(MongoRecordSink(getenv('EXECUTION_RECORD_COLLECTION', default='execution_records')))
+            case '':
+                pass
+            case _:
+                logger.info("Unknown execution record sink '%s' ignored.", sink_name)
+    return sinks
+
+
+def get_execution_recorder() -> ExecutionRecorder:
+    global EXECUTION_RECORDER
+    if EXECUTION_RECORDER is None:
+        EXECUTION_RECORDER = ExecutionRecorder(create_record_sinks(),
+                                               max_queue_size=int(getenv('EXECUTION_RECORD_QUEUE_SIZE', default=10000)),
+                                               batch_size=int(getenv('EXECUTION_RECORD_BATCH_SIZE', default=500)),
+                                               flush_interval=float(getenv('EXECUTION_RECORD_FLUSH_INTERVAL_SECONDS', default=1)))
+
+    return EXECUTION_RECORDER
+
+
+def execution_time_record(db_record:dict):
+    """
+    Record execution time, taken db_record dictionary as input: the record is queued
+    and written to the sinks by the background flush task of the execution recorder
+
+    """
+    observe_execution_record(db_record)
+    get_execution_recorder().record(db_record)
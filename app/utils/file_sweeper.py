@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+
+from app.utils.logger import get_logger
+
+logger = get_logger(name="app.utils.file_sweeper")
+
+
+class FileSweeper:
+    """
+    Background task deleting the files older than the retention of their directory (by modification time),
+    every `interval` seconds. Safe to run in several workers (a file already deleted is skipped).
+    """
+    def __init__(self, interval:float=300):
+        self.interval = interval
+        self.directories = {} # directory -> retention in seconds
+        self._task = None
+
+    def add(self, directory:str, retention_seconds:float):
+        """
+        Sweep the files of `directory` older than retention_seconds (never swept if retention_seconds <= 0)
+        """
+        if retention_seconds > 0:
+            self.directories[directory] = retention_seconds
+
+    def sweep(self) -> int:
+        """
+        Delete the expired files, return the number of deleted files
+        """
+        now = time.time()
+        deleted_count = 0
+        for directory, retention_seconds in self.directories.items():
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime < now - retention_seconds:
+                            os.remove(entry.path)
+                            deleted_count += 1
+                    except FileNotFoundError:
+                        pass
+        return deleted_count
+
+    async def run(self):
+        while True:
+            try:
+                deleted_count = await asyncio.to_thread(self.sweep)
+                if deleted_count > 0:
+                    logger.info("%d expired file(s) deleted.", deleted_count)
+            except Exception as e:
+                logger.info("Failed to sweep the expired files: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        Start the sweep task (at startup)
+        """
+        if self._task is None and self.directories:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the sweep task (at shutdown)
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,90 @@
+import asyncio
+from os import getenv
+
+IMAGE_DOWNLOADER = None
+
+# Content types accepted before downloading (some origins serve images as application/octet-stream)
+ACCEPTED_CONTENT_TYPES = ("image/", "application/octet-stream")
+
+
+class ImageDownloadError(Exception):
+    pass
+
+
+class ImageDownloader:
+    """
+    Async image downloader sharing a keep-alive connection pool (httpx, created on first use), with connect / read
+    timeouts, a total download deadline and a max size: the Content-Type / Content-Length headers are checked before
+    the body is read, and the body is streamed into memory (as is, never decoded) until the max size.
+    The input images are limited to max_bytes, the upscaled images (2x width and height) to max_output_bytes.
+    """
+    def __init__(self, connect_timeout:float=5, read_timeout:float=10, total_timeout:float=30,
+                 max_bytes:int=20*1024*1024, max_output_bytes:int=80*1024*1024, max_connections:int=100):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.max_output_bytes = max_output_bytes
+        self.max_connections = max_connections
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            import httpx # Loaded on first use of the image routes
+
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                follow_redirects=True)
+        return self._async_client
+
+    def _check_headers(self, url:str, response, max_bytes:int):
+        if response.status_code != 200:
+            raise ImageDownloadError(f"'{url}' returned HTTP {response.status_code}.")
+        content_type = response.headers.get("content-type", "").lower()
+        if not content_type.startswith(ACCEPTED_CONTENT_TYPES):
+            raise ImageDownloadError(f"'{url}' is not an image (Content-Type: '{content_type}').")
+        content_length = response.headers.get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ImageDownloadError(f"'{url}' image size ({content_length} bytes) exceeds {max_bytes} bytes.")
+
+    async def download_async(self, url:str, max_bytes:int|None=None) -> bytes:
+        """
+        Download the image bytes of `url`, up to max_bytes (self.max_bytes by default)
+        (raises ImageDownloadError, or httpx's errors on connection / timeouts)
+        """
+        max_bytes = max_bytes or self.max_bytes
+        buffer = bytearray()
+        try:
+            async with asyncio.timeout(self.total_timeout):
+                async with self.async_client.stream("GET", url) as response:
+                    self._check_headers(url, response, max_bytes)
+                    async for chunk in response.aiter_bytes():
+                        buffer += chunk
+                        if len(buffer) > max_bytes:
+                            raise ImageDownloadError(f"'{url}' image size exceeds {max_bytes} bytes.")
+        except TimeoutError:
+            raise ImageDownloadError(f"'{url}' download exceeded {self.total_timeout}s.")
+        return bytes(buffer)
+
+    async def close(self):
+        """
+        Close the connection pool (if opened)
+        """
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+def get_image_downloader() -> ImageDownloader:
+    global IMAGE_DOWNLOADER
+    if IMAGE_DOWNLOADER is None:
+        IMAGE_DOWNLOADER = ImageDownloader(connect_timeout=float(getenv('IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS', default=5)),
+                                           read_timeout=float(getenv('IMAGE_DOWNLOAD_READ_TIMEOUT_SECONDS', default=10)),
+                                           total_timeout=float(getenv('IMAGE_DOWNLOAD_TOTAL_TIMEOUT_SECONDS', default=30)),
+                                           max_bytes=int(getenv('IMAGE_DOWNLOAD_MAX_BYTES', default=20*1024*1024)),
+                                           max_output_bytes=int(getenv('IMAGE_OUTPUT_DOWNLOAD_MAX_BYTES', default=80*1024*1024)),
+                                           max_connections=int(getenv('IMAGE_DOWNLOAD_MAX_CONNECTIONS', default=100)))
+
+    return IMAGE_DOWNLOADER
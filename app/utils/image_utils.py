@@ -1,88 +1,96 @@
-import requests
 from base64 import b64decode, b64encode
+import os
 from io import BytesIO
-from PIL import Image
 from uuid import uuid4
-from os import getenv
 
-images_path = getenv("IMAGES_PATH", "images")
+from app.config.settings import get_settings
+from app.utils.image_downloader import get_image_downloader
+from app.utils.timing import span
 
-def is_valid_base64_image(image_data_base64:str, size_limit:int=1920):
+def validate_image_bytes(image_bytes:bytes, size_limit:int=1920) -> str:
     """
-    Checking for validity of base64 image string, and additional check for image size (in pixel)
+    Checking for validity of image data, and additional check for image size (in pixel).
+    Only the image header is parsed (the pixels are not decoded)
     ------------------------
-    Return True if the b64 string is from a valid image file (jpg, jpeg, png format) and having
+    Return the image format ('jpeg' or 'png') if the data is from a valid image file (jpg, jpeg, png format) and having
         both the height and width meet the size_limit 
-    Reference: https://stackoverflow.com/questions/60186924/python-is-base64-data-a-valid-image  
     """
-    
+    from PIL import Image # Pillow loaded on first use of the image routes
+
     try:
-        image_data_decoded = b64decode(image_data_base64)
-        image = Image.open(BytesIO(image_data_decoded))
+        image = Image.open(BytesIO(image_bytes))
     except Exception:
-        raise Exception('Input string is not a valid Base64 image.')
-    # end of check base64 image string
-    
+        raise ValueError('Input string is not a valid Base64 image.')
+
     # Checking image format supported
     if image.format.lower() in ["jpg", "jpeg", "png"]:
         
         # Check for image dimension
         width, height = image.size
         if width < size_limit and height < size_limit:
-            return True
+            return image.format.lower()
         else:
-            raise Exception(
+            raise ValueError(
                 f"Image size exceeded, width and height must be less than {size_limit} pixels.")
         # end of checking dimentions
         
     else:
-        raise Exception("Image is not valid, only 'Base64' image (jpg, jpeg, png) is valid.")
+        raise ValueError("Image is not valid, only 'Base64' image (jpg, jpeg, png) is valid.")
     # end of checking image format
 
-def convert_image_b64_to_file(image_data_base64:str) -> str:
+def decode_base64_image(image_data_base64:str, size_limit:int=1920) -> tuple[bytes, str]:
+    """
+    Decode a base64 image string once and validate the decoded bytes (see validate_image_bytes)
+    Return the (original image bytes, image format), the bytes are passed downstream as is (no re-encoding)
+    Reference: https://stackoverflow.com/questions/60186924/python-is-base64-data-a-valid-image  
+    """
+    try:
+        image_bytes = b64decode(image_data_base64)
+    except Exception:
+        raise ValueError('Input string is not a valid Base64 image.')
+    return image_bytes, validate_image_bytes(image_bytes, size_limit=size_limit)
+
+def save_image_bytes(image_bytes:bytes, image_format:str, subdirectory:str|None=None) -> str:
     """
-    Check if the input string is a valid base64 encoded image
-    If yes, save the data to a local image file and return the file path in format:
+    Save the original image bytes (no re-encoding) to a local image file and return the file path in format:
         f"{image_path}/image_{random_uuid4}_{image_extension}"
+    or f"{image_path}/{subdirectory}/image_{random_uuid4}_{image_extension}" (subdirectory created if needed)
+    """
+    random_id = str(uuid4())
+    image_directory = f"./{get_settings().images_path}" if subdirectory is None else f"./{get_settings().images_path}/{subdirectory}"
+    if subdirectory is not None:
+        os.makedirs(image_directory, exist_ok=True)
+    image_file = f"{image_directory}/image_{random_id}.{image_format}"
+    with span("save"), open(image_file, "wb") as f:
+        f.write(image_bytes)
+    return image_file
 
+def get_image_format(image_bytes:bytes) -> str:
+    """
+    Format of the image data (i.e: 'png', 'jpeg'), from the image header only
     """
-    converted_image_file = ""
-    if is_valid_base64_image(image_data_base64):
-        pass
-        image_data_decoded = b64decode(image_data_base64)
-        image = Image.open(BytesIO(image_data_decoded))
-        image_extension = image.format.lower()
-        random_id = str(uuid4())
-        converted_image_file = f"./{images_path}/image_{random_id}.{image_extension}"
-        # converted_img_url = f"http://localhost:8080/static/{image_name}"
-        image.save(converted_image_file)
-    return converted_image_file
+    from PIL import Image # Pillow loaded on first use of the image routes
 
-def download_image(image_url:str) -> str:
+    return Image.open(BytesIO(image_bytes)).format.lower()
+
+async def download_image_async(image_url:str, max_bytes:int|None=None) -> tuple[bytes, str]:
     """
     Check the input URL links to a valid image file.
-    If yes, download the file and return the local file path in format:
-        f"{image_path}/image_{random_uuid4}_{image_extension}"
-
+    If yes, download the file in memory (shared connection pool, bounded time and size, see ImageDownloader)
+    and return the (image bytes, image format)
     """
-    local_image_file = ""
-    image_extension = ""
-    image = None
     try:
-        image = Image.open(requests.get(image_url, stream=True).raw)
-        image_extension = image.format.lower()
-    except Exception:
-        raise Exception("Invalid image data from input URL.")
-    if image_extension != "":
-        random_id = str(uuid4())
-        local_image_file = f"./{images_path}/image_{random_id}.{image_extension}"
-        image.save(local_image_file)
-    return local_image_file
+        image_bytes = await get_image_downloader().download_async(str(image_url), max_bytes=max_bytes)
+        return image_bytes, get_image_format(image_bytes)
+    except Exception as e:
+        raise Exception(f"Invalid image data from input URL: {e}")
 
+async def download_upscaled_image_async(image_url:str) -> tuple[bytes, str]:
+    """
+    Download an upscaled image, limited to IMAGE_OUTPUT_DOWNLOAD_MAX_BYTES (the input images to IMAGE_DOWNLOAD_MAX_BYTES)
+    """
+    return await download_image_async(image_url, max_bytes=get_image_downloader().max_output_bytes)
 
-def encode_image_b64(image_file:str) -> str:
-    encoded_image = ""
-    with open(image_file, "rb") as f:
-        encoded_image = b64encode(f.read())
-    return encoded_image
 
+def encode_image_b64(image_bytes:bytes) -> bytes:
+    return b64encode(image_bytes)
@@ -0,0 +1,245 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from uuid import uuid4
+
+from app.utils.logger import get_logger
+
+logger = get_logger(name="app.utils.job_queue")
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class MongoJobStore:
+    """
+    Job documents in a MongoDB collection (database from connect_db.get_database), shared by all workers.
+    The status changes are atomic updates, so a queued job is claimed (and run) by a single worker.
+    A running job holds a lease: if its worker dies, the job is requeued once the lease expired.
+    The finished jobs are removed after ttl_seconds (TTL index).
+    """
+    def __init__(self, collection_name:str="jobs", ttl_seconds:float=86400, lease_seconds:float=600):
+        self.collection_name = collection_name
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None: # Connected on first use, so the startup does not wait for MongoDB
+            from app.config.connect_db import get_database
+
+            collection = get_database()[self.collection_name]
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            collection.create_index([("status", 1), ("created_at", 1)])
+            self._collection = collection
+        return self._collection
+
+    def create(self, job_id:str, payload:dict, webhook_url:str|None=None) -> dict:
+        now = datetime.now(timezone.utc)
+        job = {"_id": job_id, "status": JobStatus.queued.value, "payload": payload, "webhook_url": webhook_url,
+               "attempts": 0, "created_at": now, "updated_at": now}
+        self.collection.insert_one(job)
+        return job
+
+    def get(self, job_id:str) -> dict|None:
+        return self.collection.find_one({"_id": job_id}, {"payload": 0})
+
+    def claim(self, job_id:str) -> dict|None:
+        """
+        Mark the queued job as running, return None if the job is not queued anymore (claimed by another worker)
+        """
+        from pymongo import ReturnDocument
+
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {"_id": job_id, "status": JobStatus.queued.value},
+            {"$set": {"status": JobStatus.running.value, "updated_at": now,
+                      "lease_expires_at": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER)
+
+    def finish(self, job_id:str, status:JobStatus, result:dict|None=None, error:dict|None=None) -> dict|None:
+        """
+        Store the result (or error) of the job, its input payload is dropped
+        """
+        from pymongo import ReturnDocument
+
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {"_id": job_id},
+            {"$set": {"status": status.value, "result": result, "error": error, "updated_at": now,
+                      "expires_at": now + timedelta(seconds=self.ttl_seconds)},
+             "$unset": {"payload": "", "lease_expires_at": ""}},
+            projection={"payload": 0},
+            return_document=ReturnDocument.AFTER)
+
+    def release(self, job_id:str):
+        """
+        Put a running job back in the queue (worker shutting down)
+        """
+        self.collection.update_one({"_id": job_id, "status": JobStatus.running.value},
+                                   {"$set": {"status": JobStatus.queued.value, "updated_at": datetime.now(timezone.utc)},
+                                    "$inc": {"attempts": -1}, "$unset": {"lease_expires_at": ""}})
+
+    def recover(self, max_attempts:int, limit:int) -> list[str]:
+        """
+        Requeue the running jobs with an expired lease (failed after max_attempts),
+        return the ids of the oldest `limit` queued jobs
+        """
+        now = datetime.now(timezone.utc)
+        expired = {"status": JobStatus.running.value, "lease_expires_at": {"$lt": now}}
+        self.collection.update_many(
+            {**expired, "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": JobStatus.failed.value, "updated_at": now,
+                      "error": {"status_code": 500, "detail": f"Job interrupted {max_attempts} times."},
+                      "expires_at": now + timedelta(seconds=self.ttl_seconds)},
+             "$unset": {"payload": "", "lease_expires_at": ""}})
+        self.collection.update_many(
+            expired,
+            {"$set": {"status": JobStatus.queued.value, "updated_at": now}, "$unset": {"lease_expires_at": ""}})
+        if limit <= 0:
+            return []
+        queued = self.collection.find({"status": JobStatus.queued.value}, {"_id": 1}).sort("created_at", 1).limit(limit)
+        return [job["_id"] for job in queued]
+
+
+def job_view(job:dict) -> dict:
+    """
+    Public fields of a job document, with the result fields at the top level
+    """
+    def utc(value:datetime) -> datetime:
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+    return {"job_id": job["_id"], "status": job["status"],
+            "created_at": utc(job["created_at"]), "updated_at": utc(job["updated_at"]),
+            **(job.get("result") or {}), "error": job.get("error")}
+
+
+class JobQueue:
+    """
+    Background jobs persisted in a job store: submit returns the stored job right away, and a bounded pool of
+    `workers` tasks runs `handler(payload)` (async, returns the result dict) for each job.
+    The local queue holds at most max_queue_size jobs, submit raises JobQueueFullError above it.
+    The jobs queued or interrupted before a restart are recovered from the store at startup and every
+    recovery_interval seconds (which also spreads the jobs of a busy worker to the idle ones).
+    If the job has a webhook_url, the job (job_view) is posted to it once finished (best effort).
+    """
+    def __init__(self, store:MongoJobStore, handler, workers:int=4, max_queue_size:int=100, max_attempts:int=3,
+                 recovery_interval:float=30, webhook_timeout:float=10):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.recovery_interval = recovery_interval
+        self.webhook_timeout = webhook_timeout
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._queued_ids = set()
+        self._tasks = []
+        self._webhook_client = None
+
+    def _enqueue(self, job_id:str) -> bool:
+        if job_id in self._queued_ids:
+            return True
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            return False
+        self._queued_ids.add(job_id)
+        return True
+
+    async def submit(self, payload:dict, webhook_url:str|None=None) -> dict:
+        if self._queue.full():
+            raise JobQueueFullError(f"{self._queue.qsize()} jobs already queued.")
+        job = await asyncio.to_thread(self.store.create, uuid4().hex, payload, webhook_url)
+        self._enqueue(job["_id"]) # Left to the recovery if the queue got full meanwhile
+        return job
+
+    async def get(self, job_id:str) -> dict|None:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def run_job(self, job_id:str):
+        job = await asyncio.to_thread(self.store.claim, job_id)
+        if job is None: # Already run by another worker
+            return
+        logger.info("Job '%s' started (attempt %d).", job_id, job["attempts"])
+        try:
+            result = await self.handler(job["payload"])
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.store.release, job_id)
+            raise
+        except Exception as e:
+            error = {"status_code": getattr(e, "status_code", 500), "detail": str(getattr(e, "detail", e))}
+            logger.info("Job '%s' failed: %s", job_id, error)
+            job = await asyncio.to_thread(self.store.finish, job_id, JobStatus.failed, error=error)
+        else:
+            logger.info("Job '%s' succeeded.", job_id)
+            job = await asyncio.to_thread(self.store.finish, job_id, JobStatus.succeeded, result=result)
+        if job is not None and job.get("webhook_url"):
+            await self.notify(job)
+
+    async def notify(self, job:dict):
+        """
+        Post the finished job to its webhook_url
+        """
+        import httpx
+
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=self.webhook_timeout)
+        try:
+            response = await self._webhook_client.post(job["webhook_url"], content=json.dumps(job_view(job), default=str),
+                                                       headers={"Content-Type": "application/json"})
+            logger.info("Job '%s' webhook answered HTTP %d.", job["_id"], response.status_code)
+        except httpx.HTTPError as e:
+            logger.info("Job '%s' webhook failed: %s", job["_id"], e)
+
+    async def work(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued_ids.discard(job_id)
+            try:
+                await self.run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info("Job '%s' could not be run: %s", job_id, e)
+
+    async def recover(self):
+        while True:
+            try:
+                job_ids = await asyncio.to_thread(self.store.recover, self.max_attempts,
+                                                  self._queue.maxsize - self._queue.qsize())
+                for job_id in job_ids:
+                    self._enqueue(job_id)
+            except Exception as e:
+                logger.info("Failed to recover the queued jobs: %s", e)
+            await asyncio.sleep(self.recovery_interval)
+
+    def start(self):
+        """
+        Start the workers and the recovery task (at startup)
+        """
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self.recover()))
+
+    async def stop(self):
+        """
+        Stop the workers, the running jobs are put back in the queue for the next start (at shutdown)
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
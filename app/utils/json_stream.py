@@ -0,0 +1,81 @@
+import json
+import re
+
+
+class JsonStringArrayStream:
+    """
+    Incremental parser of a JSON object streamed in chunks, extracting each string item of the
+    array under `key` as soon as the item is complete, i.e. for key 'messages':
+        '{"messages": ["first suggestion", "sec' -> ["first suggestion"]
+        'ond suggestion"]}'                      -> ["second suggestion"]
+    """
+    def __init__(self, key:str="messages"):
+        self._array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self._buffer = "" # Text not scanned yet
+        self._array_started = False
+        # Scanned text of the current string item (None between items) and escape state at its end:
+        # each character is scanned once and the item is only joined once complete
+        self._item_parts = None
+        self._escaped = False
+        self.finished = False
+
+    def feed(self, chunk:str) -> list[str]:
+        """
+        Add a chunk of the JSON text, return the array items completed by this chunk
+        """
+        items = []
+        if self.finished:
+            return items
+        buffer = self._buffer + chunk
+        if not self._array_started:
+            match = self._array_start.search(buffer)
+            if match is None:
+                self._buffer = buffer
+                return items
+            self._array_started = True
+            buffer = buffer[match.end():]
+
+        while True:
+            if self._item_parts is None:
+                position = 0
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position >= len(buffer):
+                    buffer = ""
+                    break
+                if buffer[position] == "]":
+                    self.finished = True
+                    break
+                if buffer[position] != '"':
+                    # Not an array of strings, stop parsing
+                    self.finished = True
+                    break
+                self._item_parts, self._escaped = ['"'], False
+                buffer = buffer[position + 1:]
+            end = self._find_string_end(buffer)
+            if end is None: # Item not complete yet
+                self._item_parts.append(buffer)
+                buffer = ""
+                break
+            self._item_parts.append(buffer[:end + 1])
+            items.append(json.loads("".join(self._item_parts)))
+            self._item_parts = None
+            buffer = buffer[end + 1:]
+        self._buffer = buffer
+        return items
+
+    def _find_string_end(self, buffer:str) -> int|None:
+        """
+        Position of the closing quote of the current string item in `buffer` (its next scanned text),
+        the escape state is kept for the next chunk if the item is not complete
+        """
+        escaped = self._escaped
+        for position, character in enumerate(buffer):
+            if escaped:
+                escaped = False
+            elif character == "\\":
+                escaped = True
+            elif character == '"':
+                return position
+        self._escaped = escaped
+        return None
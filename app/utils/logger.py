@@ -1,8 +1,114 @@
+"""
+Logging of the app, configured once (on the first get_logger call):
+the records are put in a queue by the request handlers (QueueHandler, no formatting nor I/O on the event loop)
+and formatted / written to stderr by a background thread (QueueListener).
+Messages are formatted lazily: use logger.info("... %s", value) rather than f-strings.
+Bulky payloads (provider responses, execution records) go through log_payload(), which is levelled, sampled
+and can be disabled (LOG_PAYLOADS=false) so that they are never rendered.
+"""
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from os import getenv
+
+LOG_LEVEL = getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = getenv("LOG_FORMAT", "text").lower() # text | json
+LOG_PAYLOADS = getenv("LOG_PAYLOADS", "true").lower() == "true"
+LOG_PAYLOAD_LEVEL = logging.getLevelName(getenv("LOG_PAYLOAD_LEVEL", "DEBUG").upper())
+LOG_PAYLOAD_SAMPLE_RATE = float(getenv("LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+
+# Attributes of every LogRecord, the other ones are the `extra` fields of the structured (json) logs
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+log_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, the `extra` fields and the exception if any
+    """
+    def format(self, record:logging.LogRecord) -> str:
+        document = {'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                    'level': record.levelname,
+                    'logger': record.name,
+                    'message': record.getMessage()}
+        document.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document['exception'] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler which leaves the message formatting to the listener thread
+    (the default QueueHandler formats the message before enqueuing it).
+    Only the exception traceback is rendered here, since it cannot be passed to another thread.
+    """
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging():
+    """
+    Route the logs of the app through a queue to a background writer (only done once)
+    """
+    global log_listener
+    if log_listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+    root_logger.addHandler(LazyQueueHandler(log_queue))
+
+    log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Write the queued logs and stop the background writer
+    """
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
 
 def get_logger(name: str):
-    # Configures and returns a logger instance
+    # Configures (once) and returns a logger instance
 
-    logging.basicConfig(level=logging.INFO)
+    configure_logging()
     logger = logging.getLogger(name)
     return logger
+
+
+def log_payload(logger:logging.Logger, label:str, payload):
+    """
+    Log a bulky payload (i.e: provider response, execution record) at LOG_PAYLOAD_LEVEL (DEBUG by default),
+    for a LOG_PAYLOAD_SAMPLE_RATE share of the calls. The payload is only rendered if the log is kept.
+    """
+    if not LOG_PAYLOADS or not logger.isEnabledFor(LOG_PAYLOAD_LEVEL):
+        return
+    if LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(LOG_PAYLOAD_LEVEL, "%s: %s", label, payload)
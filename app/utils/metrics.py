@@ -0,0 +1,76 @@
+"""
+Prometheus metrics of the app, exposed on /metrics.
+Metric updates are lock-light: the label children are cached by prometheus_client, and the counters/histograms
+only take a per-value lock. With several workers, set PROMETHEUS_MULTIPROC_DIR to aggregate the workers' metrics.
+"""
+from contextlib import contextmanager
+from os import getenv
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+from app.utils.timing import span
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+HTTP_REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Duration of the HTTP requests, per route',
+                                  ['method', 'route', 'status_code'], buckets=LATENCY_BUCKETS)
+PROVIDER_REQUEST_DURATION = Histogram('provider_request_duration_seconds', 'Duration of the text generation provider calls',
+                                      ['api_source', 'model'], buckets=LATENCY_BUCKETS)
+PROVIDER_TOKENS = Counter('provider_tokens', 'Tokens reported by the text generation providers',
+                          ['api_source', 'model', 'type'])
+PROVIDER_FINISH_REASONS = Counter('provider_finish_reasons', 'Finish reasons of the text generation provider responses',
+                                  ['api_source', 'model', 'finish_reason'])
+PROVIDER_RETRIES = Counter('provider_retries', 'Retried text generation provider calls', ['api_source', 'model'])
+CACHE_LOOKUPS = Counter('text_generation_cache_lookups', 'Text generation response cache lookups', ['result'])
+CACHE_HITS = CACHE_LOOKUPS.labels(result='hit')
+CACHE_MISSES = CACHE_LOOKUPS.labels(result='miss')
+IMAGE_STAGE_DURATION = Histogram('image_stage_duration_seconds', 'Duration of the image optimization stages',
+                                 ['stage'], buckets=LATENCY_BUCKETS)
+
+
+def label_name(value) -> str:
+    """
+    Label value of an enum (its name) or any other value
+    """
+    return getattr(value, 'name', str(value))
+
+
+def observe_execution_record(db_record:dict):
+    """
+    Update the provider metrics from a text generation execution record
+    (execution time, prompt / completion tokens, finish reasons)
+    """
+    if db_record.get('task') != 'text_optimization':
+        return
+    api_source, model = label_name(db_record.get('api_source')), str(db_record.get('model'))
+    if db_record.get('execution_time_ms') is not None:
+        PROVIDER_REQUEST_DURATION.labels(api_source, model).observe(db_record['execution_time_ms'] / 1000)
+    for token_type in ('prompt', 'completion'):
+        tokens_count = db_record.get(f'{token_type}_tokens_count')
+        if tokens_count:
+            PROVIDER_TOKENS.labels(api_source, model, token_type).inc(tokens_count)
+    for finish_reason in db_record.get('finish_reason') or []:
+        PROVIDER_FINISH_REASONS.labels(api_source, model, label_name(finish_reason)).inc()
+
+
+@contextmanager
+def image_stage(stage:str):
+    """
+    Time an image optimization stage, in the stage histogram and in the request's spans (Server-Timing)
+    """
+    with span(stage), IMAGE_STAGE_DURATION.labels(stage=stage).time():
+        yield
+
+
+def generate_metrics() -> bytes:
+    """
+    Metrics in Prometheus text format (aggregated from all the workers in multiprocess mode)
+    """
+    if getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
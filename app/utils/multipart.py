@@ -0,0 +1,52 @@
+from uuid import uuid4
+
+
+class MultipartBody:
+    """
+    multipart/form-data request body streamed from in-memory parts, without copying the parts' content:
+    a file-like object with a known length (read / len) which can also be iterated by chunks, sync or async
+    (httpx' AsyncClient streams async iterables only, hence aiter(body)).
+        body = MultipartBody([("file", "image.png", image_bytes, "image/png"), ("data", None, json_bytes, "application/json")])
+        await client.post(url, content=aiter(body), headers={"Content-Type": body.content_type, "Content-Length": str(len(body))})
+    """
+    def __init__(self, parts:list[tuple[str, str|None, bytes|memoryview, str]], chunk_size:int=64*1024):
+        self.boundary = uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+        self._segments = []
+        for name, filename, content, content_type in parts:
+            disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+            header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\nContent-Type: {content_type}\r\n\r\n"
+            self._segments += [memoryview(header.encode("utf-8")), memoryview(content).cast("B"), memoryview(b"\r\n")]
+        self._segments.append(memoryview(f"--{self.boundary}--\r\n".encode("utf-8")))
+        self.length = sum(segment.nbytes for segment in self._segments)
+        self._segment_index = 0
+        self._segment_offset = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size:int=-1) -> bytes:
+        """
+        Next `size` bytes of the body (the remaining body if size < 0), b"" at the end
+        """
+        if size is None or size < 0:
+            size = self.length
+        chunks = []
+        while size > 0 and self._segment_index < len(self._segments):
+            segment = self._segments[self._segment_index]
+            chunk = segment[self._segment_offset:self._segment_offset + size]
+            chunks.append(chunk)
+            size -= chunk.nbytes
+            self._segment_offset += chunk.nbytes
+            if self._segment_offset >= segment.nbytes:
+                self._segment_index, self._segment_offset = self._segment_index + 1, 0
+        return b"".join(chunks)
+
+    def __iter__(self):
+        while chunk := self.read(self.chunk_size):
+            yield chunk
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
@@ -0,0 +1,193 @@
+import time
+from collections import deque
+from datetime import datetime
+from os import getenv
+
+from app.utils.provider_stats import ProviderStats, get_provider_stats
+
+PROVIDER_ROUTER = None
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a provider's model, based on the rolling error rate of its calls:
+        closed: requests are allowed, the breaker opens when the error rate of the last `window_seconds`
+                reaches `failure_rate_threshold` (with at least `min_requests` calls in the window)
+        open: requests fail fast until `open_seconds` elapsed, then one probe request is allowed (half open)
+        half_open: the probe's success closes the breaker, its failure opens it again
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_seconds:float=60, min_requests:int=10, failure_rate_threshold:float=0.5, open_seconds:float=30):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate_threshold = failure_rate_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = None # Wall clock time the breaker last opened (for display)
+        self._opened_monotonic = None
+        self._probe_started = None
+        self._outcomes = deque() # (monotonic time, success)
+
+    def _trim(self, now:float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def counts(self) -> tuple[int, int]:
+        """
+        Number of calls and of failed calls in the rolling window
+        """
+        self._trim(time.monotonic())
+        failures = sum(1 for _, success in self._outcomes if not success)
+        return len(self._outcomes), failures
+
+    def error_rate(self) -> float:
+        """
+        Error rate of the rolling window, 0 until there are at least min_requests calls
+        """
+        requests_count, failures_count = self.counts()
+        if requests_count < self.min_requests:
+            return 0.0
+        return failures_count / requests_count
+
+    def is_available(self) -> bool:
+        """
+        True if a request would be allowed (without starting a probe)
+        """
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            return now - self._opened_monotonic >= self.open_seconds
+        if self.state == self.HALF_OPEN:
+            return self._probe_started is None or now - self._probe_started >= self.open_seconds
+        return True
+
+    def allow_request(self) -> bool:
+        if not self.is_available():
+            return False
+        if self.state != self.CLOSED:
+            self.state = self.HALF_OPEN
+            self._probe_started = time.monotonic()
+        return True
+
+    def retry_at(self) -> datetime|None:
+        """
+        Time the next probe request is allowed if the breaker is open
+        """
+        if self.state != self.OPEN:
+            return None
+        return datetime.fromtimestamp(self.opened_at.timestamp() + self.open_seconds)
+
+    def _open(self, now:float):
+        self.state = self.OPEN
+        self.opened_at = datetime.now()
+        self._opened_monotonic = now
+        self._probe_started = None
+
+    def record_success(self):
+        now = time.monotonic()
+        self._outcomes.append((now, True))
+        self._trim(now)
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            self._probe_started = None
+            self._outcomes.clear() # Start over with a fresh window
+
+    def record_failure(self):
+        now = time.monotonic()
+        self._outcomes.append((now, False))
+        self._trim(now)
+        if self.state == self.HALF_OPEN:
+            self._open(now)
+        elif self.state == self.CLOSED and self.error_rate() >= self.failure_rate_threshold:
+            self._open(now)
+
+
+class ProviderRouter:
+    """
+    Health of the providers' models (circuit breaker state, rolling error rate and latency),
+    used to fail fast on a failing provider and route the default traffic to the healthiest one
+    """
+    def __init__(self, stats:ProviderStats, window_seconds:float=60, min_requests:int=10,
+                 failure_rate_threshold:float=0.5, open_seconds:float=30, slow_latency_ms:float=10000):
+        self.stats = stats
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate_threshold = failure_rate_threshold
+        self.open_seconds = open_seconds
+        self.slow_latency_ms = slow_latency_ms
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def breaker(self, api_source:str, model:str) -> CircuitBreaker:
+        key = (api_source, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(self.window_seconds, self.min_requests,
+                                                           self.failure_rate_threshold, self.open_seconds)
+        return breaker
+
+    def allow_request(self, api_source:str, model:str) -> bool:
+        return self.breaker(api_source, model).allow_request()
+
+    def record_success(self, api_source:str, model:str, latency_ms:float):
+        self.breaker(api_source, model).record_success()
+        self.stats.record_latency(api_source, model, latency_ms)
+
+    def record_failure(self, api_source:str, model:str):
+        self.breaker(api_source, model).record_failure()
+
+    def choose(self, candidates:list[tuple[str, str]]) -> tuple[str, str]|None:
+        """
+        Healthiest available candidate (api_source, model): closed breakers first, then the lowest error rate,
+        then not slow (p95 latency under slow_latency_ms), ties broken by the candidates order (preference).
+        None if all the candidates' breakers are open.
+        """
+        def health(indexed_candidate):
+            index, (api_source, model) = indexed_candidate
+            breaker = self.breaker(api_source, model)
+            latency_ms = self.stats.latency_percentile(api_source, model, 95)
+            return (breaker.state != CircuitBreaker.CLOSED,
+                    breaker.error_rate(),
+                    latency_ms is not None and latency_ms > self.slow_latency_ms,
+                    index)
+
+        available = [(index, candidate) for index, candidate in enumerate(candidates)
+                     if self.breaker(*candidate).is_available()]
+        if not available:
+            return None
+        return min(available, key=health)[1]
+
+    def snapshot(self, api_source:str, model:str) -> dict:
+        """
+        Current health of a provider's model
+        """
+        breaker = self.breaker(api_source, model)
+        if breaker.state == CircuitBreaker.OPEN and breaker.is_available():
+            state = CircuitBreaker.HALF_OPEN # Next request will be a probe
+        else:
+            state = breaker.state
+        requests_count, failures_count = breaker.counts()
+        return {"api_source": api_source,
+                "model": model,
+                "state": state,
+                "requests_count": requests_count,
+                "failures_count": failures_count,
+                "error_rate": failures_count / requests_count if requests_count else 0.0,
+                "latency_p50_ms": self.stats.latency_percentile(api_source, model, 50),
+                "latency_p95_ms": self.stats.latency_percentile(api_source, model, 95),
+                "opened_at": breaker.opened_at,
+                "retry_at": breaker.retry_at()}
+
+
+def get_provider_router() -> ProviderRouter:
+    global PROVIDER_ROUTER
+    if PROVIDER_ROUTER is None:
+        PROVIDER_ROUTER = ProviderRouter(get_provider_stats(),
+                                         window_seconds=float(getenv('PROVIDER_BREAKER_WINDOW_SECONDS', default=60)),
+                                         min_requests=int(getenv('PROVIDER_BREAKER_MIN_REQUESTS', default=10)),
+                                         failure_rate_threshold=float(getenv('PROVIDER_BREAKER_FAILURE_RATE', default=0.5)),
+                                         open_seconds=float(getenv('PROVIDER_BREAKER_OPEN_SECONDS', default=30)),
+                                         slow_latency_ms=float(getenv('PROVIDER_SLOW_LATENCY_MS', default=10000)))
+
+    return PROVIDER_ROUTER
@@ -0,0 +1,68 @@
+import math
+import threading
+from collections import deque
+from os import getenv
+
+PROVIDER_STATS = None
+
+
+class LatencyWindow:
+    """
+    Rolling window of the latest latency samples (in milliseconds)
+    """
+    def __init__(self, size:int=200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, latency_ms:float):
+        self._samples.append(latency_ms)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, percentile:float) -> float|None:
+        """
+        Nearest-rank percentile of the window, None if empty
+        """
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = math.ceil(percentile / 100 * len(samples))
+        return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+class ProviderStats:
+    """
+    Rolling latency statistics of the provider calls, per (API source, model)
+    """
+    def __init__(self, window_size:int=200):
+        self.window_size = window_size
+        self._latencies: dict[tuple[str, str], LatencyWindow] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, api_source:str, model:str) -> LatencyWindow:
+        key = (api_source, model)
+        window = self._latencies.get(key)
+        if window is None:
+            with self._lock:
+                window = self._latencies.setdefault(key, LatencyWindow(self.window_size))
+        return window
+
+    def record_latency(self, api_source:str, model:str, latency_ms:float):
+        self._window(api_source, model).add(latency_ms)
+
+    def latency_percentile(self, api_source:str, model:str, percentile:float, min_samples:int=1) -> float|None:
+        """
+        Latency percentile (in milliseconds) of the provider's model, None if there are less than min_samples samples
+        """
+        window = self._window(api_source, model)
+        if len(window) < min_samples:
+            return None
+        return window.percentile(percentile)
+
+
+def get_provider_stats() -> ProviderStats:
+    global PROVIDER_STATS
+    if PROVIDER_STATS is None:
+        PROVIDER_STATS = ProviderStats(window_size=int(getenv('PROVIDER_STATS_WINDOW_SIZE', default=200)))
+
+    return PROVIDER_STATS
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from os import getenv
+
+from app.utils.timing import span
+
+RATE_LIMITERS = {}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity` per minute (i.e: a requests-per-minute or tokens-per-minute quota)
+    """
+    def __init__(self, capacity:float):
+        self.capacity = capacity
+        self.rate = capacity / 60 # Refill per second
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount:float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if available now)
+        """
+        self._refill()
+        amount = min(amount, self.capacity) # A request bigger than the quota waits for a full bucket
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount:float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount:float):
+        """
+        Give back (amount > 0) or take extra (amount < 0) tokens, the bucket can go below 0 (debt repaid by the refill)
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter of a provider's model, with requests-per-minute and tokens-per-minute quotas
+    (None for no quota). Requests reserve their tokens up front (prompt + max output tokens), wait in FIFO order
+    until both quotas allow them, and the reservation is reconciled with the usage returned by the provider.
+    """
+    def __init__(self, requests_per_minute:float|None=None, tokens_per_minute:float|None=None):
+        self.requests_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+    def _wait_time(self, tokens:int) -> float:
+        wait_time = max(self._paused_until - time.monotonic(), 0.0)
+        if self.requests_bucket is not None:
+            wait_time = max(wait_time, self.requests_bucket.wait_time(1))
+        if self.tokens_bucket is not None:
+            wait_time = max(wait_time, self.tokens_bucket.wait_time(tokens))
+        return wait_time
+
+    async def acquire(self, tokens:int, timeout:float) -> bool:
+        """
+        Reserve one request and `tokens` tokens, waiting up to `timeout` seconds.
+        Returns False (nothing reserved) if the quotas would not allow the request within the timeout.
+        """
+        with span("rate_limit_wait"):
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            try:
+                await asyncio.wait_for(self._lock.acquire(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            try:
+                while True:
+                    wait_time = self._wait_time(tokens)
+                    if wait_time <= 0:
+                        if self.requests_bucket is not None:
+                            self.requests_bucket.consume(1)
+                        if self.tokens_bucket is not None:
+                            self.tokens_bucket.consume(tokens)
+                        return True
+                    if loop.time() + wait_time > deadline:
+                        return False
+                    await asyncio.sleep(wait_time)
+            finally:
+                self._lock.release()
+
+    def reconcile(self, reserved_tokens:int, used_tokens:int):
+        """
+        Adjust the tokens quota with the actual usage of a request (used_tokens = 0 if the provider did not process it)
+        """
+        if self.tokens_bucket is not None:
+            self.tokens_bucket.adjust(reserved_tokens - used_tokens)
+
+    def pause(self, seconds:float):
+        """
+        Hold the queued requests for `seconds` (i.e: provider's Retry-After after a rate limit error)
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def get_rate_limiter(api_source:str, model:str) -> RateLimiter|None:
+    """
+    Shared rate limiter of a provider's model, with the quotas {API_SOURCE}_RPM_LIMIT and {API_SOURCE}_TPM_LIMIT
+    (i.e: OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT). None if the provider has no quota configured.
+    """
+    key = (api_source, model)
+    if key not in RATE_LIMITERS:
+        requests_per_minute = getenv(f'{api_source.upper()}_RPM_LIMIT')
+        tokens_per_minute = getenv(f'{api_source.upper()}_TPM_LIMIT')
+        if requests_per_minute is None and tokens_per_minute is None:
+            RATE_LIMITERS[key] = None
+        else:
+            RATE_LIMITERS[key] = RateLimiter(float(requests_per_minute) if requests_per_minute else None,
+                                             float(tokens_per_minute) if tokens_per_minute else None)
+    return RATE_LIMITERS[key]
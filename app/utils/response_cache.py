@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from os import getenv
+
+from app.utils.logger import get_logger
+from app.utils.metrics import CACHE_HITS, CACHE_MISSES
+
+logger = get_logger(name="app.utils.response_cache")
+
+RESPONSE_CACHE = None
+
+
+def normalize_text(text:str) -> str:
+    """
+    Normalize input text for cache keys: unicode NFC, collapsed whitespaces, stripped
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(**parts) -> str:
+    """
+    Build a stable cache key (sha256 hex digest) from the given keyword parts
+    """
+    serialized = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    In-process cache backend, size bounded (LRU eviction) with TTL expiration
+    """
+    name = "memory"
+
+    def __init__(self, max_size:int=1024, ttl_seconds:float=3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    async def get(self, key:str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key:str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class MongoCacheBackend:
+    """
+    Cache backend shared by all workers, stored in a MongoDB collection (database from connect_db.get_database).
+    Expired documents are removed by a TTL index, and the least recently used documents are trimmed
+    when the collection grows over max_size.
+    """
+    name = "mongo"
+
+    def __init__(self, collection_name:str="text_generation_cache", max_size:int=10000,
+                 ttl_seconds:float=3600, trim_interval:int=100):
+        from app.config.connect_db import get_database
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.trim_interval = trim_interval
+        self._sets_count = 0
+        self.collection = get_database()[collection_name]
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self.collection.create_index("last_access")
+
+    def _get(self, key:str):
+        now = datetime.now(timezone.utc)
+        document = self.collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_access": now}})
+        return None if document is None else document["value"]
+
+    def _set(self, key:str, value):
+        now = datetime.now(timezone.utc)
+        self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "last_access": now, "expires_at": now + timedelta(seconds=self.ttl_seconds)},
+            upsert=True)
+
+    def _trim(self):
+        overflow = self.collection.estimated_document_count() - self.max_size
+        if overflow > 0:
+            oldest = self.collection.find({}, {"_id": 1}).sort("last_access", 1).limit(overflow)
+            self.collection.delete_many({"_id": {"$in": [document["_id"] for document in oldest]}})
+
+    async def get(self, key:str):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key:str, value):
+        await asyncio.to_thread(self._set, key, value)
+        self._sets_count += 1
+        if self._sets_count % self.trim_interval == 0:
+            await asyncio.to_thread(self._trim)
+
+    def size(self) -> int:
+        return self.collection.estimated_document_count()
+
+
+class ResponseCache:
+    """
+    Exact-match cache of the generated responses, with hit/miss counters.
+    Backend errors are logged and treated as cache misses, they never fail the request.
+    """
+    def __init__(self, backend:MemoryCacheBackend|MongoCacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key:str):
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.info("Response cache (%s) lookup failed: %s", self.backend.name, e)
+            value = None
+        if value is None:
+            self.misses += 1
+            CACHE_MISSES.inc()
+        else:
+            self.hits += 1
+            CACHE_HITS.inc()
+        return value
+
+    async def set(self, key:str, value):
+        try:
+            await self.backend.set(key, value)
+        except Exception as e:
+            logger.info("Response cache (%s) update failed: %s", self.backend.name, e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = -1
+        return {"backend": self.backend.name,
+                "size": size,
+                "max_size": self.backend.max_size,
+                "ttl_seconds": self.backend.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+def get_response_cache() -> ResponseCache:
+    global RESPONSE_CACHE
+    if RESPONSE_CACHE is None:
+        CACHE_BACKEND = getenv('TEXT_GENERATION_CACHE_BACKEND', default='memory')
+        CACHE_MAX_SIZE = int(getenv('TEXT_GENERATION_CACHE_MAX_SIZE', default=1024))
+        CACHE_TTL_SECONDS = float(getenv('TEXT_GENERATION_CACHE_TTL_SECONDS', default=3600))
+        if CACHE_BACKEND == 'mongo':
+            backend = MongoCacheBackend(max_size=CACHE_MAX_SIZE, ttl_seconds=CACHE_TTL_SECONDS)
+        else:
+            backend = MemoryCacheBackend(max_size=CACHE_MAX_SIZE, ttl_seconds=CACHE_TTL_SECONDS)
+        RESPONSE_CACHE = ResponseCache(backend)
+
+    return RESPONSE_CACHE
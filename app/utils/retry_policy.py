@@ -0,0 +1,153 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from os import getenv
+
+from app.utils.timing import span
+
+RETRY_POLICY = None
+
+
+class RetryBudget:
+    """
+    Process-wide retry budget: retries are only allowed while they stay under
+    `retry_ratio` of the requests seen in the last `ttl_seconds` (plus a small
+    `min_retries_per_second` allowance), so a provider outage cannot multiply
+    our outbound traffic by the number of retry attempts.
+    """
+    def __init__(self, ttl_seconds:float=10.0, min_retries_per_second:float=1.0, retry_ratio:float=0.2):
+        self.ttl_seconds = ttl_seconds
+        self.min_retries_per_second = min_retries_per_second
+        self.retry_ratio = retry_ratio
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now:float):
+        deadline = now - self.ttl_seconds
+        while self._requests and self._requests[0] < deadline:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < deadline:
+            self._retries.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._requests.append(now)
+
+    def try_withdraw(self) -> bool:
+        """
+        Reserve one retry from the budget. Return False if the budget is exhausted.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            allowed = self.min_retries_per_second * self.ttl_seconds + self.retry_ratio * len(self._requests)
+            if len(self._retries) + 1 > allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class RetryPolicy:
+    """
+    Shared retry policy of the provider calls: exponential backoff with full jitter,
+    provider's Retry-After hints honored, non-blocking sleep and a process-wide retry budget
+    """
+    def __init__(self, max_retries:int=2, base_delay:float=0.5, max_delay:float=8.0,
+                 max_retry_after:float=20.0, budget:RetryBudget|None=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def record_request(self):
+        """
+        Count a new (first attempt) request into the retry budget
+        """
+        self.budget.record_request()
+
+    def backoff(self, attempt:int, retry_after:float|None=None) -> float:
+        """
+        Return the delay (in seconds) before the retry following the given attempt (0-based)
+        """
+        if retry_after is not None:
+            return min(max(retry_after, 0.0), self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def wait(self, attempt:int, retry_after:float|None=None) -> bool:
+        """
+        Sleep (without blocking the event loop) before the next retry.
+        Return False without sleeping if the retry budget is exhausted.
+        """
+        if not self.budget.try_withdraw():
+            return False
+        with span("retry_wait"):
+            await asyncio.sleep(self.backoff(attempt, retry_after))
+        return True
+
+
+def parse_retry_after(value) -> float|None:
+    """
+    Parse a Retry-After header value (delay in seconds or HTTP date) into seconds
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_date = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def get_retry_after(error:Exception) -> float|None:
+    """
+    Extract the Retry-After hint (in seconds) from a provider SDK exception, if any.
+    Supports OpenAI's APIStatusError (httpx response), CohereAPIError (headers) and botocore's ClientError.
+    """
+    headers = None
+    response = getattr(error, "response", None)
+    if isinstance(response, dict): # botocore ClientError
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders")
+    elif response is not None:
+        headers = getattr(response, "headers", None)
+    if headers is None:
+        headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+
+    headers = {str(k).lower(): v for k, v in headers.items()}
+    if "retry-after-ms" in headers:
+        retry_after_ms = parse_retry_after(headers["retry-after-ms"])
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000
+    return parse_retry_after(headers.get("retry-after"))
+
+
+def get_retry_policy() -> RetryPolicy:
+    global RETRY_POLICY
+    if RETRY_POLICY is None:
+        budget = RetryBudget(
+            ttl_seconds=float(getenv('RETRY_BUDGET_TTL_SECONDS', default=10)),
+            min_retries_per_second=float(getenv('RETRY_BUDGET_MIN_PER_SECOND', default=1)),
+            retry_ratio=float(getenv('RETRY_BUDGET_RATIO', default=0.2)))
+        RETRY_POLICY = RetryPolicy(
+            max_retries=int(getenv('TEXT_OPTIMIZER_MAX_RETRY', default=2)),
+            base_delay=float(getenv('RETRY_BASE_DELAY_SECONDS', default=0.5)),
+            max_delay=float(getenv('RETRY_MAX_DELAY_SECONDS', default=8)),
+            max_retry_after=float(getenv('RETRY_MAX_RETRY_AFTER_SECONDS', default=20)),
+            budget=budget)
+
+    return RETRY_POLICY
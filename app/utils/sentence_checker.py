@@ -1,16 +1,116 @@
-import nltk.corpus
-from nltk import download
+import mmap
+import os
+import sys
+from array import array
+from os import getenv
+
+LEXICON_MAGIC = b"LEXICON1"
+LEXICON_PATH = getenv("LEXICON_PATH", "./data/english_words.lex")
+
+SENTENCE_CHECKER = None
+
+
+def load_corpus_words() -> list[str]:
+    """
+    Retrieve the English words from nltk's corpus words data (downloaded if missing)
+    """
+    import nltk.corpus
+    from nltk import download
+
+    try:
+        return nltk.corpus.words.words()
+    except LookupError:
+        download('words')
+        return nltk.corpus.words.words()
+
+
+def build_lexicon(lexicon_path:str=LEXICON_PATH, words:list[str]|None=None) -> str:
+    """
+    Precompile the English words into a compact lexicon file, loaded by Lexicon with mmap.
+    File layout: magic | words count (uint32) | (count + 1) words offsets (uint32) | sorted utf-8 words blob
+    The file is written to a temporary path then renamed, so concurrent workers never read a partial file.
+    """
+    if words is None:
+        words = load_corpus_words()
+    encoded_words = sorted({word.encode("utf-8") for word in words})
+
+    offsets = array("I", [0])
+    for word in encoded_words:
+        offsets.append(offsets[-1] + len(word))
+
+    os.makedirs(os.path.dirname(os.path.abspath(lexicon_path)), exist_ok=True)
+    tmp_path = f"{lexicon_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(LEXICON_MAGIC)
+        f.write(array("I", [len(encoded_words)]).tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded_words))
+    os.replace(tmp_path, lexicon_path)
+    return lexicon_path
+
+
+class Lexicon:
+    """
+    Read-only sorted words list memory-mapped from the precompiled lexicon file.
+    Pages are shared by all the workers through the OS page cache, lookups are a binary search
+    without loading the words into Python objects.
+    """
+    def __init__(self, lexicon_path:str=LEXICON_PATH):
+        with open(lexicon_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(LEXICON_MAGIC)] != LEXICON_MAGIC:
+            raise ValueError(f"'{lexicon_path}' is not a valid lexicon file.")
+        item_size = array("I").itemsize
+        header_size = len(LEXICON_MAGIC) + item_size
+        self._count = memoryview(self._mm)[len(LEXICON_MAGIC):header_size].cast("I")[0]
+        self._blob_start = header_size + (self._count + 1) * item_size
+        self._offsets = memoryview(self._mm)[header_size:self._blob_start].cast("I")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, word:str) -> bool:
+        target = word.encode("utf-8")
+        mm, offsets, blob_start = self._mm, self._offsets, self._blob_start
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = mm[blob_start + offsets[middle]:blob_start + offsets[middle + 1]]
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return True
+        return False
+
 
 class SentenceChecker:
-    def __init__(self):
-        try:
-            self.words = set(nltk.corpus.words.words())
-        except LookupError:
-            download('words')
-            self.words = set(nltk.corpus.words.words())
-            
+    def __init__(self, lexicon:Lexicon|None=None):
+        if lexicon is None:
+            if not os.path.exists(LEXICON_PATH):
+                build_lexicon(LEXICON_PATH)
+            lexicon = Lexicon(LEXICON_PATH)
+        self.words = lexicon
+
     def is_sentence_meaningless(self, sentence):
         """
         Check if all words in the input sentence do not contain in the set of English word (retrieved from nltk's corpus words data)
         """
-        return all([word not in self.words for word in sentence.lower().split()])
\ No newline at end of file
+        return not any(word in self.words for word in sentence.lower().split())
+
+
+def get_sentence_checker() -> SentenceChecker:
+    """
+    Shared sentence checker of the worker (the lexicon is built on first use if missing)
+    """
+    global SENTENCE_CHECKER
+    if SENTENCE_CHECKER is None:
+        SENTENCE_CHECKER = SentenceChecker()
+
+    return SENTENCE_CHECKER
+
+
+if __name__ == "__main__":
+    # Prebuild the lexicon file (i.e: at image build time): python -m app.utils.sentence_checker [lexicon_path]
+    print(f"Lexicon built: '{build_lexicon(*sys.argv[1:2])}'")
@@ -0,0 +1,28 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls sharing the same key: the first caller starts the call,
+    the others wait for it and receive the same result (or exception).
+    The shared call keeps running if one of the waiting callers is cancelled (client disconnected).
+    """
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key:str, func, *args, **kwargs):
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = call
+            call.add_done_callback(lambda done_call: self._forget(key, done_call))
+        return await asyncio.shield(call)
+
+    def _forget(self, key:str, call:asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception() # Mark the exception as retrieved if nobody was waiting anymore
+
+    def in_flight(self) -> int:
+        return len(self._calls)
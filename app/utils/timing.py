@@ -0,0 +1,64 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Spans (name, duration in ms) of the current request, set by the server_timing middleware.
+# The list is shared (not copied) with the tasks and threads started by the request, so their spans are recorded too.
+REQUEST_SPANS: ContextVar[list[tuple[str, float]]|None] = ContextVar('request_spans', default=None)
+
+
+def start_request_spans() -> list[tuple[str, float]]:
+    """
+    Start collecting the spans of the current request (called by the middleware)
+    """
+    spans = []
+    REQUEST_SPANS.set(spans)
+    return spans
+
+
+def record_span(name:str, duration_ms:float):
+    """
+    Record a stage duration of the current request (no-op outside of a request)
+    """
+    spans = REQUEST_SPANS.get()
+    if spans is not None:
+        spans.append((name, duration_ms))
+
+
+@contextmanager
+def span(name:str):
+    """
+    Time a stage of the current request:
+        with span("provider"):
+            ...
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, (time.perf_counter() - start_time) * 1000)
+
+
+def aggregate_spans(spans:list[tuple[str, float]]) -> dict[str, dict]:
+    """
+    Total duration and count of each span name, in the order of the first occurrence
+    """
+    aggregated = {}
+    for name, duration_ms in spans:
+        entry = aggregated.setdefault(name, {"duration_ms": 0.0, "count": 0})
+        entry["duration_ms"] += duration_ms
+        entry["count"] += 1
+    return aggregated
+
+
+def format_server_timing(aggregated_spans:dict[str, dict], total_ms:float|None=None) -> str:
+    """
+    Server-Timing header value, i.e: 'sentence_check;dur=0.41, provider;desc="2x";dur=812.52, total;dur=815.13'
+    """
+    metrics = []
+    for name, entry in aggregated_spans.items():
+        description = f';desc="{entry["count"]}x"' if entry["count"] > 1 else ""
+        metrics.append(f'{name}{description};dur={entry["duration_ms"]:.2f}')
+    if total_ms is not None:
+        metrics.append(f'total;dur={total_ms:.2f}')
+    return ", ".join(metrics)
@@ -1,45 +1,180 @@
 # Source: https://stackoverflow.com/questions/75804599/openai-api-how-do-i-count-tokens-before-i-send-an-api-request
 
-import tiktoken
-from langchain.llms import Bedrock
-# from botocore.client import 
-from app.config.connect_cohere import connect_Cohere
+import math
+import threading
+from os import getenv
 
-def encoding_getter(encoding_type: str):
+class TiktokenCounter:
     """
-    Returns the appropriate encoding based on the given encoding type (either an encoding string or a model name).
+    Token counter of the OpenAI's models (tiktoken encoding)
     """
-    if "k_base" in encoding_type:
-        return tiktoken.get_encoding(encoding_type)
-    else:
-        return tiktoken.encoding_for_model(encoding_type)
+    def __init__(self, encoding_type: str):
+        import tiktoken # Loaded on first use of an OpenAI's model
 
-def tokenizer(string: str, encoding_type: str) -> list:
+        if "k_base" in encoding_type:
+            self.encoding = tiktoken.get_encoding(encoding_type)
+        else:
+            self.encoding = tiktoken.encoding_for_model(encoding_type)
+
+    def count(self, string: str) -> int:
+        return len(self.encoding.encode(string))
+
+    def count_batch(self, strings: list[str]) -> list[int]:
+        return [len(tokens) for tokens in self.encoding.encode_batch(strings)]
+
+
+class HuggingFaceCounter:
     """
-    Returns the tokens in a text string using the specified encoding.
+    Token counter backed by a local HuggingFace `tokenizers` tokenizer (no network call)
     """
-    encoding = encoding_getter(encoding_type)
-    tokens = encoding.encode(string)
-    return tokens
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def count(self, string: str) -> int:
+        return len(self.tokenizer.encode(string).ids)
+
+    def count_batch(self, strings: list[str]) -> list[int]:
+        return [len(encoding.ids) for encoding in self.tokenizer.encode_batch(strings)]
+
 
-def token_counter(string: str, encoding_type: str) -> int:
+class CalibratedEstimator:
     """
-    Returns the number of tokens in a text string using the specified encoding.
+    Fast token count estimator for models without a local tokenizer: tokens of a reference tokenizer
+    multiplied by a safety ratio. The ratio starts at `ratio` and is raised whenever a provider's
+    response reports more prompt tokens than estimated (see observe), so the estimate stays an upper bound
+    of the observed counts. Without a reference tokenizer, the UTF-8 bytes count is used
+    (always an upper bound for byte-level BPE tokenizers).
     """
-    num_tokens = len(tokenizer(string, encoding_type))
-    return num_tokens
+    def __init__(self, reference=None, ratio: float = 1.25, max_ratio: float = 4.0):
+        self.reference = reference
+        self.ratio = ratio if reference is not None else 1.0
+        self.max_ratio = max_ratio
 
-def token_counter_cohere(string:str, model:str) -> int:
-    co = connect_Cohere()
-    response = co.tokenize(string, model=model)
-    return len(response.tokens)
+    def _reference_count(self, string: str) -> int:
+        if self.reference is None:
+            return len(string.encode("utf-8"))
+        return self.reference.count(string)
 
-def token_counter_bedrock(string:str, client, model_id:str):
+    def count(self, string: str) -> int:
+        return math.ceil(self._reference_count(string) * self.ratio)
+
+    def count_batch(self, strings: list[str]) -> list[int]:
+        if self.reference is None:
+            return [self.count(string) for string in strings]
+        return [math.ceil(count * self.ratio) for count in self.reference.count_batch(strings)]
+
+    def observe(self, string: str, actual_count: int) -> bool:
+        """
+        Calibrate the ratio with the actual prompt tokens count reported by the provider for `string`.
+        Returns True if the ratio changed.
+        """
+        reference_count = self._reference_count(string)
+        if self.reference is None or reference_count == 0:
+            return False
+        ratio = min(max(self.ratio, actual_count / reference_count), self.max_ratio)
+        changed = ratio != self.ratio
+        self.ratio = ratio
+        return changed
+
+
+def get_anthropic_tokenizer():
     """
-    References: https://github.com/anthropics/anthropic-bedrock-python/blob/main/src/anthropic_bedrock/_tokenizers.py
-        count_tokens from https://github.com/anthropics/anthropic-bedrock-python/blob/main/src/anthropic_bedrock/_client.py 
-        https://how.wtf/how-to-count-amazon-bedrock-anthropic-tokens-with-langchain.html 
+    Claude's tokenizer shipped with the anthropic_bedrock package (same one used by LangChain's Bedrock.get_num_tokens)
+    """
+    from anthropic_bedrock._tokenizers import sync_get_tokenizer
+    return sync_get_tokenizer()
+
+
+def create_token_counter(encoding_type: str):
     """
-    pass
-    llm = Bedrock(client=client, model_id=model_id)
-    return llm.get_num_tokens(string)
+    Create the token counter of a key: "cohere:<model>", "anthropic:<model>",
+    or a tiktoken encoding string / OpenAI's model name
+    """
+    provider, _, model = encoding_type.partition(":")
+    if provider == "anthropic":
+        try:
+            return HuggingFaceCounter(get_anthropic_tokenizer())
+        except Exception:
+            return CalibratedEstimator()
+    if provider == "cohere":
+        COHERE_TOKENIZER_PATH = getenv('COHERE_TOKENIZER_PATH') # tokenizer.json of the Cohere's model, if available
+        if COHERE_TOKENIZER_PATH:
+            from tokenizers import Tokenizer
+            return HuggingFaceCounter(Tokenizer.from_file(COHERE_TOKENIZER_PATH))
+        # Claude's tokenizer times COHERE_TOKEN_ESTIMATE_RATIO, raised by the observed counts (see CalibratedEstimator).
+        # The UTF-8 bytes count is only a fallback if Claude's tokenizer cannot be loaded
+        try:
+            reference = HuggingFaceCounter(get_anthropic_tokenizer())
+        except Exception:
+            reference = None
+        return CalibratedEstimator(reference, ratio=float(getenv('COHERE_TOKEN_ESTIMATE_RATIO', default=1.25)))
+    return TiktokenCounter(encoding_type)
+
+
+class TokenizerRegistry:
+    """
+    Registry of the token counters, created once per model / encoding name, and of the
+    token counts of the (unchanging) prompt templates, computed once per template.
+    Keys are tiktoken encoding strings / OpenAI's model names, "cohere:<model>" or "anthropic:<model>".
+    """
+    def __init__(self):
+        self._counters = {}
+        self._template_counts = {}
+        self._lock = threading.Lock()
+
+    def get_counter(self, encoding_type: str):
+        """
+        Returns the cached token counter of the given encoding type.
+        """
+        counter = self._counters.get(encoding_type)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.get(encoding_type)
+                if counter is None:
+                    counter = create_token_counter(encoding_type)
+                    self._counters[encoding_type] = counter
+        return counter
+
+    def count(self, string: str, encoding_type: str) -> int:
+        """
+        Returns the number of tokens in a text string.
+        """
+        return self.get_counter(encoding_type).count(string)
+
+    def count_batch(self, strings: list[str], encoding_type: str) -> list[int]:
+        """
+        Returns the number of tokens of each text string, encoded in one call.
+        """
+        return self.get_counter(encoding_type).count_batch(strings)
+
+    def count_template(self, template: str, encoding_type: str) -> int:
+        """
+        Returns the number of tokens of a prompt template, computed once and cached.
+        """
+        key = (encoding_type, template)
+        count = self._template_counts.get(key)
+        if count is None:
+            count = self.count(template, encoding_type)
+            self._template_counts[key] = count
+        return count
+
+    def observe(self, string: str, actual_count: int, encoding_type: str):
+        """
+        Report the actual prompt tokens count of `string` from a provider's response (calibrates the estimators)
+        """
+        counter = self.get_counter(encoding_type)
+        if isinstance(counter, CalibratedEstimator) and counter.observe(string, actual_count):
+            self._template_counts = {key: count for key, count in self._template_counts.items() if key[0] != encoding_type}
+
+    def warm_up(self, encoding_type: str, templates: list[str] | None = None):
+        """
+        Create the counter and precompute the templates token counts (at startup)
+        """
+        self.get_counter(encoding_type)
+        for template in templates or []:
+            self.count_template(template, encoding_type)
+
+TOKENIZER_REGISTRY = TokenizerRegistry()
+
+def get_tokenizer_registry() -> TokenizerRegistry:
+    return TOKENIZER_REGISTRY
@@ -0,0 +1,247 @@
+"""
+Local stand-ins of the provider APIs used by the app, for load tests without spending real quota.
+One server implements the subset of each API called by TextGenerator and ClaidAPIClient (non streaming):
+    /openai/v1/chat/completions                 OpenAI chat completion (OPENAI_BASE_URL=http://host:port/openai/v1)
+    /cohere/v1/generate                         Cohere generate (CO_API_URL=http://host:port/cohere)
+    /bedrock/model/{model_id}/invoke            Bedrock invoke_model, Anthropic body (BEDROCK_ENDPOINT_URL=http://host:port/bedrock)
+    /claid/v1-beta1/image/edit/upload           CLAID.AI upload edit (CLAID_API_HOST=http://host:port/claid)
+    /claid/images/{name}                        Upscaled images (tmp_url of the upload response), also used as input image URLs
+Each provider has a configurable latency (+ jitter), error rate (HTTP 500) and throttling (requests per second,
+HTTP 429 with Retry-After above it).
+
+Usage (from the repository root):
+    python benchmarks/fake_providers.py [--port 9100] [--latency-ms 300] [--jitter-ms 100] [--error-rate 0] [--rate-limit 0]
+                                        [--set openai.latency_ms=800 --set claid.error_rate=0.05 ...]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from email.parser import BytesParser
+from email.policy import HTTP
+
+import uvicorn
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+PROVIDERS = ("openai", "cohere", "bedrock", "claid")
+MAX_STORED_IMAGES = 256
+
+
+@dataclass
+class ProviderBehavior:
+    latency_ms: float = 300
+    jitter_ms: float = 100
+    error_rate: float = 0.0
+    rate_limit: float = 0.0 # Requests per second, 0 for no throttling
+    choices: int = 2 # Suggestions per generated text
+
+
+class Throttle:
+    """
+    Fixed one-second window request counter
+    """
+    def __init__(self, rate_limit:float):
+        self.rate_limit = rate_limit
+        self.window = 0
+        self.count = 0
+
+    def allow(self) -> bool:
+        if self.rate_limit <= 0:
+            return True
+        window = int(time.monotonic())
+        if window != self.window:
+            self.window, self.count = window, 0
+        self.count += 1
+        return self.count <= self.rate_limit
+
+
+class FakeProvider:
+    def __init__(self, name:str, behavior:ProviderBehavior):
+        self.name = name
+        self.behavior = behavior
+        self.throttle = Throttle(behavior.rate_limit)
+        self.requests_count = 0
+
+    async def handle(self) -> int|None:
+        """
+        Simulate the provider's latency, return the HTTP error status to answer (429 / 500) or None
+        """
+        self.requests_count += 1
+        if not self.throttle.allow():
+            return 429
+        await asyncio.sleep(max(self.behavior.latency_ms + random.uniform(-1, 1) * self.behavior.jitter_ms, 0) / 1000)
+        if random.random() < self.behavior.error_rate:
+            return 500
+        return None
+
+
+def suggestions(text:str, count:int) -> list[str]:
+    return [f"{text} ({index + 1})" for index in range(count)]
+
+
+def tokens_count(text:str) -> int:
+    return max(len(text) // 4, 1)
+
+
+def parse_multipart(content_type:str, body:bytes) -> dict[str, tuple[str|None, bytes]]:
+    """
+    Parts of a multipart/form-data body: {name: (filename, content)}
+    """
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    return {part.get_param("name", header="content-disposition"):
+                (part.get_filename(), part.get_payload(decode=True)) for part in message.iter_parts()}
+
+
+def create_app(behaviors:dict[str, ProviderBehavior]) -> FastAPI:
+    providers = {name: FakeProvider(name, behaviors[name]) for name in PROVIDERS}
+    images: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+    app = FastAPI(title="Fake providers")
+
+    openai = APIRouter()
+
+    @openai.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        provider = providers["openai"]
+        error_status = await provider.handle()
+        if error_status is not None:
+            return JSONResponse({"error": {"message": f"Fake error {error_status}", "type": "fake", "code": None}},
+                                status_code=error_status, headers={"retry-after": "1"} if error_status == 429 else None)
+        body = await request.json()
+        user_content = body["messages"][-1]["content"]
+        try: # Packed request {"inputs": [...]}
+            inputs = json.loads(user_content)["inputs"]
+            content = {"results": [{"messages": suggestions(text, provider.behavior.choices)} for text in inputs]}
+        except (ValueError, KeyError, TypeError):
+            content = {"messages": suggestions(user_content, provider.behavior.choices)}
+        content = json.dumps(content)
+        prompt_tokens = sum(tokens_count(message["content"]) for message in body["messages"])
+        return {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens_count(content),
+                          "total_tokens": prompt_tokens + tokens_count(content)}}
+
+    cohere = APIRouter()
+
+    @cohere.post("/v1/generate")
+    async def generate(request: Request):
+        provider = providers["cohere"]
+        error_status = await provider.handle()
+        if error_status is not None:
+            return JSONResponse({"message": f"Fake error {error_status}"}, status_code=error_status,
+                                headers={"retry-after": "1"} if error_status == 429 else None)
+        body = await request.json()
+        text = body["prompt"].rsplit("Message: \"", 1)[-1].rstrip("\"")
+        generations = [{"id": uuid.uuid4().hex, "text": f"```{suggestion}```", "finish_reason": "COMPLETE"}
+                       for suggestion in suggestions(text, body.get("num_generations") or 1)]
+        return {"id": uuid.uuid4().hex, "generations": generations, "prompt": body["prompt"],
+                "meta": {"api_version": {"version": "1"},
+                         "billed_units": {"input_tokens": tokens_count(body["prompt"]),
+                                          "output_tokens": sum(tokens_count(generation["text"]) for generation in generations)}}}
+
+    bedrock = APIRouter()
+
+    @bedrock.post("/model/{model_id}/invoke")
+    async def invoke_model(model_id: str, request: Request):
+        provider = providers["bedrock"]
+        error_status = await provider.handle()
+        if error_status is not None:
+            error_type = "ThrottlingException" if error_status == 429 else "InternalServerException"
+            return JSONResponse({"message": f"Fake error {error_status}"}, status_code=error_status,
+                                headers={"x-amzn-ErrorType": error_type})
+        body = json.loads(await request.body())
+        text = body["prompt"].rsplit("Human: ", 1)[-1].rsplit("\n\nAssistant:", 1)[0].strip()
+        # The prompt ends with the opening brace of the JSON output, the stop sequence "}}" is not returned
+        completion = json.dumps({"messages": suggestions(text, provider.behavior.choices)})[1:]
+        return JSONResponse({"completion": completion, "stop_reason": "stop_sequence"},
+                            headers={"x-amzn-bedrock-input-token-count": str(tokens_count(body["prompt"])),
+                                     "x-amzn-bedrock-output-token-count": str(tokens_count(completion))})
+
+    claid = APIRouter()
+
+    @claid.post("/v1-beta1/image/edit/upload")
+    async def upload_edit(request: Request):
+        provider = providers["claid"]
+        error_status = await provider.handle()
+        if error_status is not None:
+            return JSONResponse({"error_message": f"Fake error {error_status}"}, status_code=error_status,
+                                headers={"retry-after": "1"} if error_status == 429 else None)
+        parts = parse_multipart(request.headers["content-type"], await request.body())
+        _, image = parts["file"]
+        output_format = json.loads(parts["data"][1])["output"]["format"]["type"]
+        name = f"{uuid.uuid4().hex}.{output_format}"
+        images[name] = (image, f"image/{output_format}") # The input image is returned as the "upscaled" image
+        while len(images) > MAX_STORED_IMAGES:
+            images.popitem(last=False)
+        return {"data": {"input": {"format": output_format},
+                         "output": {"tmp_url": f"{str(request.base_url).rstrip('/')}/claid/images/{name}",
+                                    "format": output_format}}}
+
+    @claid.put("/images/{name}")
+    async def put_image(name: str, request: Request):
+        images[name] = (await request.body(), request.headers.get("content-type", "application/octet-stream"))
+        return Response(status_code=201)
+
+    @claid.get("/images/{name}")
+    async def get_image(name: str):
+        if name not in images:
+            return Response(status_code=404)
+        content, media_type = images[name]
+        return Response(content, media_type=media_type)
+
+    @app.get("/stats")
+    async def stats():
+        return {name: provider.requests_count for name, provider in providers.items()}
+
+    app.include_router(openai, prefix="/openai")
+    app.include_router(cohere, prefix="/cohere")
+    app.include_router(bedrock, prefix="/bedrock")
+    app.include_router(claid, prefix="/claid")
+    return app
+
+
+def parse_behaviors(args:argparse.Namespace) -> dict[str, ProviderBehavior]:
+    behaviors = {name: ProviderBehavior(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                        error_rate=args.error_rate, rate_limit=args.rate_limit, choices=args.choices)
+                 for name in PROVIDERS}
+    field_types = {field.name: field.type for field in fields(ProviderBehavior)}
+    for override in args.set:
+        key, value = override.split("=", 1)
+        name, field_name = key.split(".", 1)
+        if name not in behaviors or field_name not in field_types:
+            raise ValueError(f"Invalid override '{override}', expected PROVIDER.FIELD=VALUE with PROVIDER in {PROVIDERS} "
+                             f"and FIELD in {list(field_types)}")
+        setattr(behaviors[name], field_name, int(value) if field_types[field_name] is int else float(value))
+    return behaviors
+
+
+def add_behavior_arguments(arg_parser:argparse.ArgumentParser):
+    arg_parser.add_argument("--latency-ms", type=float, default=300, help="Mean latency of the provider calls")
+    arg_parser.add_argument("--jitter-ms", type=float, default=100, help="Uniform jitter around the mean latency")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the calls answered with HTTP 500")
+    arg_parser.add_argument("--rate-limit", type=float, default=0.0,
+                            help="Requests per second of each provider above which HTTP 429 is returned (0: no limit)")
+    arg_parser.add_argument("--choices", type=int, default=2, help="Suggestions per generated text (TEXT_OPTIMIZER_CHOICES)")
+    arg_parser.add_argument("--set", action="append", default=[], metavar="PROVIDER.FIELD=VALUE",
+                            help="Per provider override, i.e: --set openai.latency_ms=800 --set claid.error_rate=0.05")
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Local stand-ins of the OpenAI / Cohere / Bedrock / CLAID.AI APIs")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=9100)
+    add_behavior_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    uvicorn.run(create_app(parse_behaviors(args)), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Worker cold start benchmark: import time of the app per module (python -X importtime), in a fresh interpreter.
+Fails (exit code 1) if the app import time exceeds the budget, or if a lazily loaded SDK is imported at startup.
+
+Usage (from the repository root):
+    python benchmarks/import_time.py [--module app.main] [--budget-ms 1500] [--runs 3] [--top 20]
+
+The budget defaults to STARTUP_IMPORT_BUDGET_MS (1500 ms). The best of --runs is compared to the budget,
+so the result does not depend on a cold disk cache.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Provider SDKs and heavy helpers which must only be imported on first use of their API source / route
+LAZY_MODULES = ["openai", "cohere", "boto3", "botocore", "anthropic_bedrock", "tiktoken", "tokenizers",
+                "nltk", "transformers", "langchain", "PIL", "requests"]
+
+
+def measure_imports(module:str) -> tuple[float, list[tuple[str, int, int]]]:
+    """
+    Import `module` in a new interpreter, return the wall time (ms) and the (module, self us, cumulative us) of each import
+    """
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPOSITORY_PATH, capture_output=True, text=True)
+    wall_time_ms = (time.perf_counter() - start_time) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import '{module}':\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall_time_ms, imports
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Import time benchmark of the app (worker cold start)")
+    arg_parser.add_argument("--module", default="app.main", help="Module imported by the workers")
+    arg_parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1500)),
+                            help="Max import time of the module, in milliseconds")
+    arg_parser.add_argument("--runs", type=int, default=3, help="Number of runs (the best one is kept)")
+    arg_parser.add_argument("--top", type=int, default=20, help="Number of modules listed")
+    args = arg_parser.parse_args()
+
+    runs = [measure_imports(args.module) for _ in range(max(args.runs, 1))]
+    wall_time_ms, imports = min(runs, key=lambda run: dict((name, cumulative) for name, _, cumulative in run[1])[args.module])
+    import_time_ms = next(cumulative for name, _, cumulative in imports if name == args.module) / 1000
+
+    print(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module (top {args.top} by self time)")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+
+    print(f"\n{'cumulative [ms]':>16}  top-level package")
+    top_level_imports = [item for item in imports if "." not in item[0]]
+    for name, _, cumulative_us in sorted(top_level_imports, key=lambda item: item[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>16.1f}  {name}")
+
+    print(f"\n'{args.module}' import time: {import_time_ms:.1f} ms (interpreter wall time {wall_time_ms:.1f} ms), "
+          f"budget: {args.budget_ms:.1f} ms")
+
+    failed = False
+    eager_modules = sorted({name.split(".")[0] for name, _, _ in imports} & set(LAZY_MODULES))
+    if eager_modules:
+        print(f"FAILED: lazily loaded module(s) imported at startup: {', '.join(eager_modules)}")
+        failed = True
+    if import_time_ms > args.budget_ms:
+        print(f"FAILED: import time exceeded the budget by {import_time_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""
+End-to-end load test of /generate and /upscale against local stand-ins of the providers (benchmarks/fake_providers.py),
+so no real OpenAI / Cohere / Bedrock / CLAID.AI quota is spent.
+The app is started with uvicorn (--workers) and pointed at the stand-ins through the providers' host settings
+(OPENAI_BASE_URL, CO_API_URL, BEDROCK_ENDPOINT_URL, CLAID_API_HOST), then driven by --concurrency closed-loop clients.
+Reports RPS, p50 / p95 / p99 latency, the status codes and the memory (RSS) of each worker.
+Fails (exit code 1) if one of the --max-p95-ms / --min-rps / --max-error-rate thresholds is not met.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py [--scenario generate|upscale|mixed] [--api-source openai|cohere|anthropic|all]
+                                   [--upscale-mode data|url] [--upscale-output base64|image|url|tmp_url]
+                                   [--workers 2] [--concurrency 32] [--duration 30] [--warmup 5]
+                                   [--latency-ms 300 --error-rate 0.01 --set cohere.rate_limit=20 ...]
+                                   [--max-p95-ms 1500] [--min-rps 50] [--max-error-rate 0.01] [--json results.json]
+
+The app's .env file (loaded with override) takes precedence over the settings of the load test: run it without
+a .env file defining the provider hosts / keys. The memory report reads /proc (Linux).
+"""
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from fake_providers import add_behavior_arguments
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = "load-test-key"
+API_SOURCES = {"cohere": 1, "openai": 2, "anthropic": 3}
+GENERATE_PATH = "/api/v1/text-generation/generate"
+UPSCALE_PATH = "/api/v1/image-optimization/upscale"
+
+SENTENCES = [
+    "Salon U is an award winning salon known for high quality beauty and spa services",
+    "Our bakery offers fresh bread and pastries made every morning with local flour",
+    "The family restaurant serves traditional dishes in a warm and friendly place",
+    "We repair bicycles of every kind and sell helmets, lights and spare parts",
+    "The community garden welcomes volunteers every weekend to plant and harvest vegetables",
+    "Our bookstore has a large collection of novels, poetry and children books",
+]
+
+# Prompts used when the environment does not define them ({} is the number of choices / max words)
+DEFAULT_PROMPTS = {
+    "OPENAI_TEXT_GEN_PROMPT": "Rewrite the user's text in {} better ways, answer in JSON {{\"messages\": [...]}}",
+    "COHERE_TEXT_GEN_PROMPT": "Rewrite the message in less than {} words, between ``` marks",
+    "ANTHROPIC_TEXT_GEN_PROMPT": "Rewrite the text in {} better ways, answer in JSON {{\"messages\": [...]}}",
+}
+
+
+def percentile(samples:list[float], pct:float) -> float|None:
+    """
+    Nearest-rank percentile (None without samples)
+    """
+    if not samples:
+        return None
+    samples = sorted(samples)
+    rank = -(-pct * len(samples) // 100) # ceil
+    return samples[min(max(int(rank), 1), len(samples)) - 1]
+
+
+def make_test_image(size:int=64) -> bytes:
+    from PIL import Image
+
+    image = Image.new("RGB", (size, size))
+    image.putdata([tuple(random.randrange(256) for _ in range(3)) for _ in range(size * size)])
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def is_worker(pid:int) -> bool:
+    """
+    Whether a child of the app process is a uvicorn worker (spawned process), not a multiprocessing helper
+    """
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as cmdline_file:
+            return b"spawn_main" in cmdline_file.read()
+    except OSError:
+        return False
+
+
+def worker_pids(app_pid:int) -> list[int]:
+    """
+    Pids of the uvicorn workers (the children of the app process, or the app process itself with 1 worker)
+    """
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                parent_pid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent_pid == app_pid and is_worker(int(entry)):
+            children.append(int(entry))
+    return sorted(children) or [app_pid]
+
+
+def rss_mb(pid:int) -> float|None:
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class MemorySampler:
+    """
+    RSS of each worker, sampled every second: first, peak and last value
+    """
+    def __init__(self, app_pid:int):
+        self.app_pid = app_pid
+        self.samples: dict[int, list[float]] = {}
+
+    def sample(self):
+        if not os.path.isdir("/proc"):
+            return
+        for pid in worker_pids(self.app_pid):
+            rss = rss_mb(pid)
+            if rss is not None:
+                self.samples.setdefault(pid, []).append(rss)
+
+    async def run(self, stop:asyncio.Event):
+        while not stop.is_set():
+            self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+        self.sample()
+
+    def report(self) -> dict[int, dict]:
+        return {pid: {"start_mb": samples[0], "peak_mb": max(samples), "end_mb": samples[-1]}
+                for pid, samples in self.samples.items()}
+
+
+class RequestFactory:
+    """
+    Requests of the scenario: unique input texts by default (no response cache hits), round robin over the API sources
+    """
+    def __init__(self, args:argparse.Namespace, fake_url:str, image:bytes):
+        self.scenario = args.scenario
+        self.repeat_inputs = args.repeat_inputs
+        self.api_sources = list(API_SOURCES) if args.api_source == "all" else [args.api_source]
+        self.counter = itertools.count()
+        self.upscale_params = {"output_mode": args.upscale_output}
+        if args.upscale_mode == "url":
+            self.upscale_body = {"image_url": f"{fake_url}/claid/images/load-test-input.png"}
+        else:
+            self.upscale_body = {"image_data": base64.b64encode(image).decode("ascii")}
+
+    def next(self) -> tuple[str, str, dict, dict|None]:
+        """
+        (endpoint name, path, query params, json body) of the next request
+        """
+        index = next(self.counter)
+        if self.scenario == "upscale" or (self.scenario == "mixed" and index % 2 == 1):
+            return "upscale", UPSCALE_PATH, self.upscale_params, self.upscale_body
+        api_source = self.api_sources[index % len(self.api_sources)]
+        sentence = SENTENCES[(index // len(self.api_sources)) % len(SENTENCES)]
+        input_text = sentence if self.repeat_inputs else f"{sentence} {index}"
+        return f"generate:{api_source}", GENERATE_PATH, {"api_source": API_SOURCES[api_source]}, {"input_text": input_text}
+
+
+async def client_loop(client:httpx.AsyncClient, factory:RequestFactory, results:list, measure_from:float, deadline:float):
+    while time.monotonic() < deadline:
+        endpoint, path, params, body = factory.next()
+        start_time = time.monotonic()
+        try:
+            response = await client.post(path, params=params, json=body)
+            status_code = response.status_code
+        except httpx.HTTPError as e:
+            status_code = type(e).__name__
+        end_time = time.monotonic()
+        if start_time >= measure_from and end_time <= deadline:
+            results.append((endpoint, status_code, (end_time - start_time) * 1000))
+
+
+def summarize(results:list, duration:float) -> dict[str, dict]:
+    summary = {}
+    endpoints = sorted({endpoint for endpoint, _, _ in results})
+    for endpoint in endpoints + ["all"]:
+        entries = [entry for entry in results if endpoint == "all" or entry[0] == endpoint]
+        latencies = [latency_ms for _, status_code, latency_ms in entries if status_code == 200]
+        statuses = {}
+        for _, status_code, _ in entries:
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        errors = len(entries) - len(latencies)
+        summary[endpoint] = {"requests": len(entries), "rps": len(latencies) / duration,
+                             "error_rate": errors / len(entries) if entries else 0.0,
+                             "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+                             "p99_ms": percentile(latencies, 99), "statuses": statuses}
+    return summary
+
+
+def format_ms(value:float|None) -> str:
+    return "n/a" if value is None else f"{value:.1f}"
+
+
+def app_environment(args:argparse.Namespace, fake_url:str, work_path:str) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPOSITORY_PATH, env.get("PYTHONPATH")])),
+        "API_KEY": API_KEY,
+        "OPENAI_API_KEY": "fake", "OPENAI_BASE_URL": f"{fake_url}/openai/v1",
+        "COHERE_API_KEY": "fake", "CO_API_URL": f"{fake_url}/cohere",
+        "AWS_ACCESS_KEY_ID": "fake", "AWS_SECRET_ACCESS_KEY": "fake", "AWS_DEFAULT_REGION": "us-east-1",
+        "BEDROCK_ENDPOINT_URL": f"{fake_url}/bedrock",
+        "CLAID_API_KEY": "fake", "CLAID_API_HOST": f"{fake_url}/claid",
+        "TEXT_OPTIMIZER_CHOICES": str(args.choices),
+        "EXECUTION_RECORD_PATH": os.path.join(work_path, "execution_records"),
+    })
+    env.pop("AWS_PROFILE", None)
+    for name, prompt in DEFAULT_PROMPTS.items():
+        env.setdefault(name, prompt)
+    env.setdefault("DB_NAME", "load_test")
+    env.setdefault("LEXICON_PATH", os.path.join(REPOSITORY_PATH, "data", "english_words.lex"))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    return env
+
+
+async def wait_ready(url:str, timeout:float, process:subprocess.Popen):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Process {process.args} exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def stop_process(process:subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_load(args:argparse.Namespace, app_url:str, fake_url:str, app_pid:int) -> tuple[dict, dict]:
+    image = make_test_image()
+    async with httpx.AsyncClient() as client: # Input image of the URL mode
+        (await client.put(f"{fake_url}/claid/images/load-test-input.png", content=image,
+                          headers={"content-type": "image/png"})).raise_for_status()
+
+    factory = RequestFactory(args, fake_url, image)
+    results = []
+    memory_sampler = MemorySampler(app_pid)
+    stop_sampling = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, headers={"X-API-KEY": API_KEY}, limits=limits,
+                                 timeout=args.request_timeout) as client:
+        start_time = time.monotonic()
+        measure_from, deadline = start_time + args.warmup, start_time + args.warmup + args.duration
+        sampler = asyncio.create_task(memory_sampler.run(stop_sampling))
+        await asyncio.gather(*[client_loop(client, factory, results, measure_from, deadline)
+                               for _ in range(args.concurrency)])
+        stop_sampling.set()
+        await sampler
+    return summarize(results, args.duration), memory_sampler.report()
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Load test of the app against local stand-ins of the providers")
+    arg_parser.add_argument("--scenario", choices=["generate", "upscale", "mixed"], default="generate")
+    arg_parser.add_argument("--api-source", choices=list(API_SOURCES) + ["all"], default="openai",
+                            help="API source of the /generate requests (all: round robin)")
+    arg_parser.add_argument("--upscale-mode", choices=["data", "url"], default="data",
+                            help="Input image of the /upscale requests: base64 data or URL (served by the stand-in)")
+    arg_parser.add_argument("--upscale-output", choices=["base64", "image", "url", "tmp_url"], default="base64",
+                            help="Output mode of the /upscale requests")
+    arg_parser.add_argument("--repeat-inputs", action="store_true",
+                            help="Cycle through a few input texts (response cache hits) instead of unique ones")
+    arg_parser.add_argument("--workers", type=int, default=2, help="uvicorn workers of the app")
+    arg_parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    arg_parser.add_argument("--duration", type=float, default=30, help="Measured duration, in seconds")
+    arg_parser.add_argument("--warmup", type=float, default=5, help="Unmeasured load before the measure, in seconds")
+    arg_parser.add_argument("--request-timeout", type=float, default=60, help="Client timeout of a request, in seconds")
+    arg_parser.add_argument("--app-port", type=int, default=8090)
+    arg_parser.add_argument("--fake-port", type=int, default=9100)
+    add_behavior_arguments(arg_parser)
+    arg_parser.add_argument("--max-p95-ms", type=float, help="Fail if the p95 latency (all requests) is above")
+    arg_parser.add_argument("--min-rps", type=float, help="Fail if the successful requests per second are below")
+    arg_parser.add_argument("--max-error-rate", type=float, help="Fail if the share of non 200 responses is above")
+    arg_parser.add_argument("--json", help="Write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    if os.path.exists(os.path.join(REPOSITORY_PATH, ".env")):
+        print("WARNING: the app loads .env with override, its provider hosts / keys take precedence over the load test's.")
+
+    fake_url, app_url = f"http://127.0.0.1:{args.fake_port}", f"http://127.0.0.1:{args.app_port}"
+    behavior_args = [f"--latency-ms={args.latency_ms}", f"--jitter-ms={args.jitter_ms}", f"--error-rate={args.error_rate}",
+                     f"--rate-limit={args.rate_limit}", f"--choices={args.choices}"] + [f"--set={value}" for value in args.set]
+    work_path = tempfile.mkdtemp(prefix="load_test_")
+    os.makedirs(os.path.join(work_path, os.getenv("IMAGES_PATH", "images")), exist_ok=True) # Mounted at import by app.main
+    fake_process = subprocess.Popen([sys.executable, os.path.join(REPOSITORY_PATH, "benchmarks", "fake_providers.py"),
+                                     f"--port={args.fake_port}"] + behavior_args)
+    app_process = None
+    try:
+        asyncio.run(wait_ready(f"{fake_url}/stats", 30, fake_process))
+        # The app runs in a temporary directory (images, execution records), as with server.py but without reload
+        app_process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                                        "--port", str(args.app_port), "--workers", str(args.workers), "--log-level", "warning"],
+                                       cwd=work_path, env=app_environment(args, fake_url, work_path))
+        asyncio.run(wait_ready(f"{app_url}/metrics", 120, app_process))
+        summary, memory = asyncio.run(run_load(args, app_url, fake_url, app_process.pid))
+    finally:
+        if app_process is not None:
+            stop_process(app_process)
+        stop_process(fake_process)
+
+    print(f"\nScenario: {args.scenario}, workers: {args.workers}, concurrency: {args.concurrency}, "
+          f"duration: {args.duration:.0f}s (after {args.warmup:.0f}s warm up)")
+    print(f"{'endpoint':<20} {'requests':>9} {'rps':>9} {'errors':>7} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9}  statuses")
+    for endpoint, entry in summary.items():
+        print(f"{endpoint:<20} {entry['requests']:>9} {entry['rps']:>9.1f} {entry['error_rate']:>7.1%} "
+              f"{format_ms(entry['p50_ms']):>9} {format_ms(entry['p95_ms']):>9} {format_ms(entry['p99_ms']):>9}  "
+              f"{entry['statuses']}")
+    print(f"\n{'worker pid':>10} {'start [MB]':>11} {'peak [MB]':>10} {'end [MB]':>9}")
+    for pid, entry in memory.items():
+        print(f"{pid:>10} {entry['start_mb']:>11.1f} {entry['peak_mb']:>10.1f} {entry['end_mb']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"arguments": vars(args), "endpoints": summary,
+                       "workers_memory": {str(pid): entry for pid, entry in memory.items()}}, json_file, indent=2)
+
+    total, failures = summary.get("all", {}), []
+    if args.max_p95_ms is not None and (total.get("p95_ms") is None or total["p95_ms"] > args.max_p95_ms):
+        failures.append(f"p95 latency {format_ms(total.get('p95_ms'))} ms above {args.max_p95_ms:.1f} ms")
+    if args.min_rps is not None and total.get("rps", 0) < args.min_rps:
+        failures.append(f"{total.get('rps', 0):.1f} requests per second below {args.min_rps:.1f}")
+    if args.max_error_rate is not None and total.get("error_rate", 1) > args.max_error_rate:
+        failures.append(f"error rate {total.get('error_rate', 1):.1%} above {args.max_error_rate:.1%}")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())